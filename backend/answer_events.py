@@ -0,0 +1,52 @@
+"""
+Append-only log of answer events, one row per event.
+
+Rows are never updated; profile projections (projections.py) are derived from
+them, and replay_events.py rebuilds those projections from the whole log.
+"""
+from datetime import datetime
+from database import db, AnswerEvent
+from question_history import TIMESTAMP_FORMAT
+from unit_of_work import execute_write
+
+
+def event_row(username, event):
+    """Map an event dict (as built by projections.py) onto table columns."""
+    payload = {key: value for key, value in event.items() if key not in ('type', 'timestamp')}
+    return {
+        'username': username,
+        'event_type': event['type'],
+        'payload': payload,
+        'created_at': datetime.strptime(event['timestamp'], TIMESTAMP_FORMAT)
+    }
+
+
+def row_event(row):
+    """Map a table row back onto the event dict."""
+    return {'type': row.event_type, 'timestamp': row.created_at.strftime(TIMESTAMP_FORMAT), **row.payload}
+
+
+def record_event(username, event):
+    """Append one event for a student."""
+    record_events([(username, event)])
+
+
+def record_events(entries):
+    """Append many events at once; entries are (username, event) pairs."""
+    rows = [event_row(username, event) for username, event in entries]
+    if rows:
+        execute_write(AnswerEvent, db.insert(AnswerEvent), rows)
+
+
+def iter_events(batch_size=10000):
+    """Stream (username, event) for the whole log, grouped by student, oldest first within a student."""
+    query = (db.select(AnswerEvent.username, AnswerEvent.event_type, AnswerEvent.payload, AnswerEvent.created_at)
+             .order_by(AnswerEvent.username, AnswerEvent.id)
+             .execution_options(yield_per=batch_size))
+    for row in db.session.execute(query):
+        yield row.username, row_event(row)
+
+
+def delete_events(username):
+    """Remove a student's events (account deletion only; progress resets are events themselves)."""
+    return execute_write(AnswerEvent, db.delete(AnswerEvent).where(AnswerEvent.username == username)).rowcount
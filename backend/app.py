@@ -1,15 +1,31 @@
+import copy
 import json
-import math
 import os
 import random
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import threading
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
-from database import db, Student, Domain, init_db
+from database import (db, json_set, read_only, Student, StudentProfile, Domain, Question, STUDENT_LEVEL, STUDENT_ROLE,
+                      split_student, init_db,
+                      get_pool_status)
+from unit_of_work import StaleWriteError, current_unit_of_work, execute_write, fingerprint, write_rows
+from domain_cache import get_domain_cache
+from question_index import get_question_index_cache
+import question_bank
+from question_stats import get_question_stats, get_question_stats_table, get_question_stats_version, record_answer
+from diagnostic_cache import get_diagnostic_cache
+from scoring import (ACCURACY_WEIGHT, BASE_DIFFICULTY, DEFAULT_ACCURACY, DIFFICULTY_RANGE, TARGET_PROBABILITY,
+                     UNKNOWN_DIFFICULTY, success_probability)
+from question_history import append_history, decode_cursor, delete_history, fetch_history
+from history_rollup import fetch_daily_history
+from session_store import get_session_store
+from metrics_buffer import append_after_commit, get_metrics_buffer, init_metrics_buffer
+from answer_events import delete_events, record_event, record_events
+from projections import (apply_event, answer_event, base_projection, clamp, diagnostic_event, reset_event,
+                         skill_added_event)
 
 # Load environment variables
 load_dotenv()
@@ -27,7 +43,8 @@ app = Flask(__name__)
 CORS(app, resources={r"/api/*": {
     "origins": ["https://neurolink-tutor.vercel.app", "http://localhost:3000"],
     "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization"]
+    "allow_headers": ["Content-Type", "Authorization"],
+    "expose_headers": ["X-Next-Cursor"]
 }})
 init_db(app)
 
@@ -35,13 +52,34 @@ init_db(app)
 def log_request_info():
     print(f"Request: {request.method} {request.path} from {request.remote_addr}")
 
+@app.after_request
+def flush_unit_of_work(response):
+    """Commit the rows this request changed in one transaction and report how many."""
+    uow = current_unit_of_work()
+    try:
+        uow.flush()
+    except StaleWriteError as e:
+        print(f"Write conflict for {request.path}: {e}")
+        response = jsonify({"error": "Conflict", "details": str(e)})
+        response.status_code = 409
+    except Exception as e:
+        print(f"Flush failed for {request.path}: {e}")
+        response = jsonify({"error": "Internal Server Error", "details": str(e)})
+        response.status_code = 500
+    response.headers['X-DB-Rows-Written'] = str(uow.rows_written)
+    if uow.rows_written:
+        print(f"Wrote {uow.rows_written} row(s) for {request.method} {request.path}")
+    return response
+
 @app.route('/api/health')
 def health_check():
     db_status = "error"
+    db_pool = {}
     try:
         # Actually try to query the DB to verify connection
         Domain.query.first()
         db_status = "connected"
+        db_pool = get_pool_status()
     except Exception as e:
         db_status = f"error: {str(e)}"
 
@@ -60,78 +98,300 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "database": db_status,
+        "db_pool": db_pool,
         "ai": ai_status,
         "available_models": available_models[:5], # Show first 5
         "env": os.getenv('FLASK_ENV', 'not set')
     }), 200
 
+@app.route('/api/admin/db-pool', methods=['GET'])
+def db_pool_status():
+    """Connection pool statistics for sizing workers against the database."""
+    return jsonify(get_pool_status())
+
+@app.errorhandler(StaleWriteError)
+def handle_stale_write(e):
+    """A concurrent request changed the same profile first; the client can simply retry."""
+    print(f"Write conflict: {e}")
+    current_unit_of_work().rollback()
+    return jsonify({"error": "Conflict", "details": str(e)}), 409
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     """Ensure CORS headers are sent even on errors."""
     print(f"Unhandled Exception: {str(e)}")
+    # Never flush a half-applied request
+    current_unit_of_work().rollback()
     response = jsonify({"error": "Internal Server Error", "details": str(e)})
     response.status_code = 500
     # Flask-CORS should handle this, but we can be safe
     return response
 
-file_lock = threading.Lock()
-
 DATA_DIR = 'data'
 DOMAIN_FILE = os.path.join(DATA_DIR, 'domain.json')
 STUDENT_FILE = os.path.join(DATA_DIR, 'student.json')
 DEFAULT_SKILLS = ["vocabulary", "grammar", "reading_comprehension", "spelling", "writing"]
 ADMIN_ACCESS_CODE = "admin"
+# Compare-and-swap attempts for a profile update before answering 409
+STUDENT_WRITE_RETRIES = int(os.getenv('STUDENT_WRITE_RETRIES', '5'))
+# Largest page /api/admin/users hands out
+ADMIN_USERS_MAX_PAGE = 1000
+# Questions /api/get-question-batch returns by default, and at most
+QUESTION_BATCH_DEFAULT = 10
+QUESTION_BATCH_MAX = int(os.getenv('QUESTION_BATCH_MAX', '50'))
 
 # --- Database Helper Functions ---
-def db_load_domain():
-    """Retrieve all domain data from the database."""
+# Loads register a fingerprint with the request's unit of work; saves are
+# staged there and only changed rows are flushed when the request ends.
+def load_domain_snapshot():
+    """Load the domain rows for the worker cache (lesson placeholders filled in)."""
     data = {}
-    items = Domain.query.all()
-    for item in items:
+    fingerprints = {}
+    for item in Domain.query.all():
         data[item.category] = item.data
+        fingerprints[item.category] = fingerprint(item.data)
+    # Questions and their stats live in their own tables (see get_question_index); ignore legacy blob rows
+    for category in ('questions', 'question_stats'):
+        data.pop(category, None)
+        fingerprints.pop(category, None)
+    ensure_lessons(data)
+    return data, fingerprints
+
+def get_domain_snapshot():
+    """Return the cached domain data without a DB round trip. Never mutate the result."""
+    return get_domain_cache().get(load_domain_snapshot).data
+
+def get_question_index():
+    """Return this worker's question index (by id and skill → lesson → level), current as of the cached domain."""
+    version = get_domain_cache().get(load_domain_snapshot).version
+    return get_question_index_cache().get(version, question_bank.load_questions)
+
+def db_load_domain():
+    """Retrieve a private, mutable copy of all domain data."""
+    uow = current_unit_of_work()
+    snapshot = get_domain_cache().get(load_domain_snapshot)
+    # Questions aren't included: question edits go through question_bank
+    data = {category: copy.deepcopy(cat_data) for category, cat_data in snapshot.data.items()}
+    for category, row_fingerprint in snapshot.fingerprints.items():
+        uow.register_fingerprint(Domain, category, row_fingerprint)
+    # Reflect this request's own unflushed writes
+    for category in data:
+        staged = uow.get_staged(Domain, category)
+        if staged is not None:
+            data[category] = copy.deepcopy(staged)
     return data
 
 def db_save_domain_category(category, data):
     """Save a specific domain category to the database."""
-    item = Domain.query.get(category)
-    if not item:
-        item = Domain(category=category, data=data)
-        db.session.add(item)
-    else:
-        item.data = data
-    db.session.commit()
+    write_rows(Domain, {category: data})
 
 def db_load_students():
-    """Retrieve all students (for compatibility with existing logic)."""
+    """Retrieve the hot records of all students (for compatibility with existing logic)."""
+    uow = current_unit_of_work()
     students = {}
     items = Student.query.all()
     for item in items:
-        students[item.username] = item.data
+        students[item.username] = uow.get_staged(Student, item.username) or item.data
+        uow.register_clean(Student, item.username, item.data)
+        uow.register_version(Student, item.username, item.version)
     return students
 
 def db_load_student(username):
-    """Retrieve a single student profil."""
-    item = Student.query.get(username)
-    return item.data if item else None
+    """Retrieve a single student's hot record (level, mastery, metrics, badges, diagnostic state)."""
+    uow = current_unit_of_work()
+    staged = uow.get_staged(Student, username)
+    if staged is not None:
+        return staged
+    # Plain column read, not the ORM identity map, so the version is never stale
+    item = db.session.execute(
+        db.select(Student.data, Student.version).where(Student.username == username)
+    ).first()
+    if not item:
+        return None
+    uow.register_clean(Student, username, item.data)
+    uow.register_version(Student, username, item.version)
+    return item.data
+
+def db_load_profile(username):
+    """Retrieve a single student's cold record (account and settings fields)."""
+    uow = current_unit_of_work()
+    staged = uow.get_staged(StudentProfile, username)
+    if staged is not None:
+        return staged
+    data = db.session.execute(db.select(StudentProfile.data).where(StudentProfile.username == username)).scalar()
+    if data is None:
+        return None
+    uow.register_clean(StudentProfile, username, data)
+    return data
 
 def db_save_student(username, data):
-    """Save/update a single student profile."""
-    item = Student.query.get(username)
-    if not item:
-        item = Student(username=username, data=data)
-        db.session.add(item)
-    else:
-        item.data = data
-    db.session.commit()
+    """Save/update a single student profile; each half goes to its own table."""
+    hot, cold = split_student(data)
+    write_rows(Student, {username: hot})
+    if cold:
+        write_rows(StudentProfile, {username: cold})
 
 def db_delete_student(username):
     """Delete a single student profile from the database."""
-    item = Student.query.get(username)
-    if item:
-        db.session.delete(item)
-        db.session.commit()
+    uow = current_unit_of_work()
+    uow.discard(Student, username)
+    uow.discard(StudentProfile, username)
+    discard_pending_ops(username)
+    deleted = Student.query.filter_by(username=username).delete()
+    StudentProfile.query.filter_by(username=username).delete()
+    db.session.commit()
+    uow.rows_written += deleted
+    return bool(deleted)
+
+# --- Student repository ---
+# Per-request endpoints only ever touch one student, so they fetch and persist
+# that single row instead of loading the whole students table. Profiles are
+# stored in two halves: tutoring endpoints only need the small hot record
+# (students), account endpoints the cold one (student_profiles).
+def get_student(student_id):
+    """Return a single student's hot record, or None if the student does not exist."""
+    return db_load_student(student_id)
+
+
+def get_full_student(student_id):
+    """Return the whole profile (cold fields merged with the hot record), or None."""
+    student = with_pending_ops(student_id, get_student(student_id))
+    if student is None:
+        return None
+    return {**(db_load_profile(student_id) or {}), **student}
+
+
+def with_pending_ops(student_id, student):
+    """
+    Overlay answers still queued in the write-behind buffer (see metrics_buffer.py) on a
+    loaded profile, so this worker reads its own updates. Read-only: never save the result.
+    """
+    buffer = get_metrics_buffer()
+    if student is None or buffer is None:
+        return student
+    pending = buffer.pending_ops(student_id)
+    if pending:
+        student = copy.deepcopy(student)
+        for event in pending:
+            apply_event(student, student_id, event)
+    return student
+
+
+def projected_student(student_id):
+    """
+    Private copy of a profile with queued write-behind answers applied, for computing
+    the next one. get_or_create_student may have staged the profile it returns, and
+    changes to a staged row would be saved with it on top of the buffered answer.
+    """
+    student = get_or_create_student(student_id)
+    pending = get_metrics_buffer().pending_ops(student_id)
+    student = copy.deepcopy(student)
+    for event in pending:
+        apply_event(student, student_id, event)
+    return student
+
+
+def discard_pending_ops(student_id):
+    """Drop queued write-behind updates for a profile that is being replaced or deleted."""
+    buffer = get_metrics_buffer()
+    if buffer is not None:
+        buffer.discard(student_id)
+
+
+def save_student(student_id, student):
+    """Persist a single student profile."""
+    db_save_student(student_id, student)
+
+
+def get_or_create_student(student_id, password="password123"):
+    """Return a student profile, auto-provisioning it if missing."""
+    student = db_load_student(student_id)
+    if student is None:
+        student = create_new_student_profile(student_id, password)
+        db_save_student(student_id, student)
+    return student
+
+
+def mutate_student(student_id, mutate, password="password123", create=True):
+    """
+    Read-modify-write one profile with compare-and-swap, retrying on concurrent updates.
+
+    The profile is re-read and `mutate(profile)` re-applied whenever another request
+    changed it in between (up to STUDENT_WRITE_RETRIES times), so concurrent answers and
+    hints for the same student never overwrite each other. Only that student's row is
+    involved; other students never contend. `mutate` may run more than once, so keep
+    side effects (history, stats) out of it.
+
+    A missing profile is created unless `create` is False, in which case nothing is
+    written and (None, None) is returned.
+
+    Returns:
+        (profile, whatever mutate returned)
+    """
+    uow = current_unit_of_work()
+    staged = uow.get_staged(Student, student_id)
+    if staged is not None:
+        # This request already rewrites the whole profile; it is checked when flushed
+        return staged, mutate(staged)
+
+    for attempt in range(STUDENT_WRITE_RETRIES):
+        student = db_load_student(student_id)
+        if student is None:
+            if not create:
+                return None, None
+            student = create_new_student_profile(student_id, password)
+            loaded = None
+        else:
+            loaded = fingerprint(student)
+        result = mutate(student)
+        if loaded == fingerprint(student):
+            return student, result
+        # Only a freshly created profile has cold fields to write
+        hot, cold = split_student(student)
+        if uow.compare_and_swap(Student, student_id, hot, uow.get_version(Student, student_id)) is not None:
+            uow.register_clean(Student, student_id, hot)
+            if cold:
+                write_rows(StudentProfile, {student_id: cold})
+            return student, result
+        # Lost the race: back off briefly, then retry against the committed version
+        time.sleep(random.uniform(0, 0.005 * (attempt + 1)))
+    raise StaleWriteError(f"Student {student_id!r} kept changing; gave up after {STUDENT_WRITE_RETRIES} attempts")
+
+
+def update_profile_fields(student_id, fields):
+    """
+    Apply small changes to a student's cold record in place (jsonb_set / json_set)
+    instead of rewriting the document.
+
+    Args:
+        student_id: student to update
+        fields: {path tuple: new value}, e.g. {('language_prefs', 'ui'): 'spanish'}
+
+    Returns:
+        True if the student exists
+    """
+    uow = current_unit_of_work()
+    staged = uow.get_staged(StudentProfile, student_id)
+    if staged is not None:
+        # The whole document is already being written this request; just edit it
+        for path, value in fields.items():
+            target = staged
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
         return True
-    return False
+
+    data = StudentProfile.data
+    for path, value in fields.items():
+        data = json_set(data, path, value)
+    # Core (table-level) UPDATE so RETURNING comes back as a plain cursor result
+    updated = execute_write(StudentProfile, db.update(StudentProfile.__table__)
+                            .where(StudentProfile.username == student_id)
+                            .values(data=data)
+                            .returning(StudentProfile.username)).scalar()
+    # Our fingerprint of this row is stale now
+    uow.discard(StudentProfile, student_id)
+    return updated is not None
 
 # Old JSON helpers (can be redirected to DB)
 def read_json_file(file_path):
@@ -140,18 +400,12 @@ def read_json_file(file_path):
     return db_load_domain()
 
 def write_json_file(file_path, data):
+    # Only rows that differ from what this request loaded are written
     if 'student.json' in file_path:
-        # This is inefficient but maintains compatibility for now
-        for username, student_data in data.items():
-            db_save_student(username, student_data)
+        write_rows(Student, data)
     else:
-        for category, cat_data in data.items():
-            db_save_domain_category(category, cat_data)
-
-
-def clamp(value, min_value=0.0, max_value=1.0):
-    """Clamp a value between min_value and max_value."""
-    return max(min_value, min(max_value, value))
+        # Questions are persisted row by row through question_bank
+        write_rows(Domain, {category: cat_data for category, cat_data in data.items() if category != 'questions'})
 
 
 def slugify_label(label):
@@ -185,12 +439,6 @@ def choose_skill_based_on_metrics(student, unmastered_skills):
     return min(skill_accuracy.keys(), key=lambda k: skill_accuracy[k])
 
 
-def get_question_stats(domain_data):
-    """Return mutable question stats, initializing structure if missing."""
-    question_stats = domain_data.setdefault('question_stats', {})
-    return question_stats
-
-
 def ensure_lessons(domain_data):
     """Guarantee every skill has at least one lesson placeholder."""
     lessons = domain_data.setdefault('lessons', {})
@@ -205,130 +453,61 @@ def ensure_lessons(domain_data):
     return lessons
 
 
-def build_diagnostic_questions(domain_data):
+def build_diagnostic_questions(domain_data, questions):
     """Return one low-stakes question per skill for onboarding assessment."""
-    questions = []
-    question_stats = get_question_stats(domain_data)
+    question_stats = get_question_stats()
 
     difficulty_rank = {'beginner': 0, 'intermediate': 1, 'advanced': 2}
 
-    for skill in get_all_skills(domain_data):
-        skill_questions = [q for q in domain_data.get('questions', []) if q.get('skill') == skill]
-        if not skill_questions:
+    # One pass over the bank: prefer lower difficulty items; break ties with calibrated difficulty score
+    best = {}  # skill -> (rank, difficulty score, question)
+    for q in questions:
+        rank = difficulty_rank.get(q.get('difficulty', 'beginner').lower(), 1)
+        current = best.get(q.get('skill'))
+        if current is not None and current[0] < rank:
             continue
+        score = get_question_difficulty_score(q, question_stats)
+        if current is None or (rank, score) < current[:2]:
+            best[q.get('skill')] = (rank, score, q)
 
-        # Prefer lower difficulty items; break ties with calibrated difficulty score
-        sorted_candidates = sorted(
-            skill_questions,
-            key=lambda q: (
-                difficulty_rank.get(q.get('difficulty', 'beginner').lower(), 1),
-                get_question_difficulty_score(q, question_stats)
-            )
-        )
-        candidate = sorted_candidates[0]
-        candidate_copy = dict(candidate)
-        candidate_copy['difficulty_score'] = round(
-            get_question_difficulty_score(candidate, question_stats), 2
-        )
-        questions.append(candidate_copy)
-
+    questions = []
+    for skill in get_all_skills(domain_data):
+        if skill in best:
+            _, score, candidate = best[skill]
+            questions.append({**candidate, 'difficulty_score': round(score, 2)})
     return questions
 
+def get_diagnostic_questions():
+    """The diagnostic set for the current question bank and stats, memoized per worker (see diagnostic_cache.py)."""
+    domain_version = get_domain_cache().get(load_domain_snapshot).version
+    return get_diagnostic_cache().get(
+        domain_version, get_question_stats_version(),
+        lambda: build_diagnostic_questions(get_domain_snapshot(), get_question_index().questions()))
+
 
 def get_question_difficulty_score(question, question_stats):
     """Combine static difficulty with global performance to produce a score [0,1]."""
-    base_difficulty_map = {
-        'beginner': 0.35,
-        'intermediate': 0.6,
-        'advanced': 0.85
-    }
-
     stats = question_stats.get(str(question.get('id')), {})
     attempts = stats.get('attempts', 0)
     correct = stats.get('correct', 0)
-    global_accuracy = (correct / attempts) if attempts else 0.7
+    global_accuracy = (correct / attempts) if attempts else DEFAULT_ACCURACY
 
-    base_score = base_difficulty_map.get(question.get('difficulty', 'beginner'), 0.5)
+    base_score = BASE_DIFFICULTY.get(question.get('difficulty', 'beginner'), UNKNOWN_DIFFICULTY)
 
     # If lots of students miss the question, increase difficulty; if most get it right, reduce it.
-    difficulty_shift = (0.7 - global_accuracy) * 0.4
-    adjusted_score = clamp(base_score + difficulty_shift, 0.05, 0.95)
+    difficulty_shift = (DEFAULT_ACCURACY - global_accuracy) * ACCURACY_WEIGHT
+    adjusted_score = clamp(base_score + difficulty_shift, *DIFFICULTY_RANGE)
     return adjusted_score
 
 
 def predict_success_probability(student_skill_score, question_difficulty_score):
-    """Predict success probability using a logistic curve over the skill-gap."""
-    gap = student_skill_score - question_difficulty_score
-    return clamp(1 / (1 + math.exp(-5 * gap)))
-
-def update_metrics(student_data, student_id, question_id, skill, is_correct, time_spent, hints_used=0, lesson=None):
-    """Update student metrics after answering a question."""
-    student = student_data[student_id]
-
-    if 'metrics' not in student:
-        student['metrics'] = {
-            'total_questions_answered': 0,
-            'correct_answers': 0,
-            'incorrect_answers': 0,
-            'average_time_per_question': 0,
-            'skill_performance': {}
-        }
-
-    # Initialize question history if it doesn't exist
-    if 'question_history' not in student:
-        student['question_history'] = []
-
-    # Add detailed question record
-    question_record = {
-        'question_id': question_id,
-        'skill': skill,
-        'lesson': lesson,
-        'is_correct': is_correct,
-        'time_spent': round(time_spent, 1),
-        'hints_used': hints_used,
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'session_id': len(student['question_history']) + 1
-    }
-    student['question_history'].append(question_record)
-
-    metrics = student['metrics']
-
-    # Update overall metrics
-    metrics['total_questions_answered'] += 1
-    if is_correct:
-        metrics['correct_answers'] += 1
-    else:
-        metrics['incorrect_answers'] += 1
-
-    # Update average time
-    total_time = metrics['average_time_per_question'] * (metrics['total_questions_answered'] - 1) + time_spent
-    metrics['average_time_per_question'] = total_time / metrics['total_questions_answered']
-
-    # Update skill-specific metrics
-    if skill not in metrics['skill_performance']:
-        metrics['skill_performance'][skill] = {
-            'questions_answered': 0,
-            'correct': 0,
-            'incorrect': 0,
-            'average_time': 0,
-            'struggling_areas': []
-        }
-
-    skill_metrics = metrics['skill_performance'][skill]
-    skill_metrics['questions_answered'] += 1
-    if is_correct:
-        skill_metrics['correct'] += 1
-    else:
-        skill_metrics['incorrect'] += 1
-
-    # Update skill average time
-    total_skill_time = skill_metrics['average_time'] * (skill_metrics['questions_answered'] - 1) + time_spent
-    skill_metrics['average_time'] = total_skill_time / skill_metrics['questions_answered']
+    """Predict success probability using a logistic curve over the skill-gap (the curve selection uses)."""
+    return success_probability(student_skill_score, question_difficulty_score)
 
 def get_all_skills(domain_data=None):
     """Return full list of skills, combining defaults with any custom additions."""
     if domain_data is None:
-        domain_data = read_json_file(DOMAIN_FILE)
+        domain_data = get_domain_snapshot()
 
     skills = domain_data.get('skills', DEFAULT_SKILLS)
     return sorted(list(set(skills + DEFAULT_SKILLS)))
@@ -336,10 +515,7 @@ def get_all_skills(domain_data=None):
 
 def create_new_student_profile(username, password, role="student"):
     """Create a fresh student profile with default values."""
-    domain_data = read_json_file(DOMAIN_FILE)
-    skills = get_all_skills(domain_data)
-
-    mastery = {skill: 0.0 for skill in skills}
+    skills = get_all_skills()
 
     return {
         "username": username,
@@ -352,73 +528,18 @@ def create_new_student_profile(username, password, role="student"):
             "learn": "english",
             "ui": "english"
         },
-        "mastery": mastery,
-        "metrics": {
-            "total_questions_answered": 0,
-            "correct_answers": 0,
-            "incorrect_answers": 0,
-            "average_time_per_question": 0,
-            "skill_performance": {}
-        },
-        "badges": [],
-        "question_history": [],
-        "current_session": {
-            "question_id": None,
-            "hints_used": 0,
-            "start_time": None
-        },
-        "diagnostic_complete": False
+        **base_projection(skills)
     }
 
-def check_badge_eligibility(student_data, student_id):
-    """Check if student earned any new badges."""
-    student = student_data[student_id]
-    current_badges = [badge['id'] for badge in student.get('badges', [])]
-    new_badges = []
-
-    metrics = student.get('metrics', {})
-    mastery = student.get('mastery', {})
-
-    # First lesson badge
-    if 'first_lesson' not in current_badges and metrics.get('total_questions_answered', 0) >= 1:
-        new_badges.append({
-            'id': 'first_lesson',
-            'name': 'First Steps',
-            'description': 'Completed your first lesson!',
-            'icon': '🌟',
-            'earned_date': datetime.now().strftime('%Y-%m-%d')
-        })
-
-    # Speed demon badge
-    if 'speed_demon' not in current_badges and metrics.get('average_time_per_question', 0) < 15:
-        new_badges.append({
-            'id': 'speed_demon',
-            'name': 'Speed Demon',
-            'description': 'Average answer time under 15 seconds!',
-            'icon': '⚡',
-            'earned_date': datetime.now().strftime('%Y-%m-%d')
-        })
-
-    # Skill mastery badges
-    for skill, score in mastery.items():
-        badge_id = f"{skill}_master"
-        if badge_id not in current_badges and score >= 1.0:
-            skill_name = skill.replace('_', ' ').title()
-            new_badges.append({
-                'id': badge_id,
-                'name': f'{skill_name} Master',
-                'description': f'Mastered all {skill_name} skills!',
-                'icon': '🏆',
-                'earned_date': datetime.now().strftime('%Y-%m-%d')
-            })
-
-    # Add new badges to student
-    if new_badges:
-        if 'badges' not in student:
-            student['badges'] = []
-        student['badges'].extend(new_badges)
+def apply_student_events(student_id, events):
+    """Write-behind flush: fold a student's queued events into the profile in one compare-and-swap write."""
+    def apply_all(student):
+        for event in events:
+            apply_event(student, student_id, event)
+    # A profile deleted since the answers were queued stays deleted
+    mutate_student(student_id, apply_all, create=False)
 
-    return new_badges
+init_metrics_buffer(app, apply_student_events)
 
 # --- API Endpoints ---
 
@@ -439,15 +560,12 @@ def register():
     if role == "admin" and admin_code != ADMIN_ACCESS_CODE:
         return jsonify({"error": "Invalid admin access code"}), 403
 
-    student_data = read_json_file(STUDENT_FILE)
-
     # Check if username already exists
-    if username in student_data:
+    if get_student(username) is not None:
         return jsonify({"error": "Username already exists"}), 400
 
     # Create new profile
-    student_data[username] = create_new_student_profile(username, password, role)
-    write_json_file(STUDENT_FILE, student_data)
+    save_student(username, create_new_student_profile(username, password, role))
 
     return jsonify({
         "success": True,
@@ -466,13 +584,11 @@ def login():
     if not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
 
-    student_data = read_json_file(STUDENT_FILE)
+    student = get_full_student(username)
 
-    if username not in student_data:
+    if student is None:
         return jsonify({"error": "Invalid username or password"}), 401
 
-    student = student_data[username]
-
     if 'password_hash' not in student or not check_password_hash(student['password_hash'], password):
         return jsonify({"error": "Invalid username or password"}), 401
 
@@ -482,23 +598,13 @@ def login():
         "role": student.get('role', 'student'),
         "diagnostic_complete": student.get('diagnostic_complete', False)
     })
-@app.route('/api/get-question', methods=['POST'])
-def get_question():
-    """Get next question based on student's mastery and level."""
-    student_id = request.json.get('student_id', 'student_alex')
-    requested_skill = request.json.get('skill')
-    requested_lesson = request.json.get('lesson')
-    student_data = read_json_file(STUDENT_FILE)
-    domain_data = read_json_file(DOMAIN_FILE)
-    ensure_lessons(domain_data)
-    question_stats = get_question_stats(domain_data)
+def question_candidates(student, requested_skill, requested_lesson):
+    """
+    Pick the skill to practise and its candidate questions for a student.
 
-    # Create new student if doesn't exist
-    if student_id not in student_data:
-        student_data[student_id] = create_new_student_profile(student_id, "password123") # Default password for new auto-created students
-        write_json_file(STUDENT_FILE, student_data)
-
-    student = student_data[student_id]
+    Returns (skill, CandidateSet, None), or (skill, None, response) when there
+    is nothing to serve (every skill mastered, or no questions for the skill).
+    """
     mastery = student['mastery']
     student_level = student.get('level', 1)
 
@@ -506,7 +612,7 @@ def get_question():
     unmastered_skills = [skill for skill, score in mastery.items() if score < 1.0]
 
     if not unmastered_skills:
-        return jsonify({
+        return None, None, jsonify({
             "question": "You have mastered all skills! Great job!",
             "id": None,
             "skill": None
@@ -519,65 +625,108 @@ def get_question():
         skill_to_teach = choose_skill_based_on_metrics(student, unmastered_skills)
 
     # Find questions for that skill and level
-    all_questions = domain_data.get('questions', [])
-    skill_questions = [q for q in all_questions
-                      if q['skill'] == skill_to_teach and q.get('level', 1) <= student_level]
+    question_index = get_question_index()
+    candidates = question_index.candidates(skill_to_teach, max_level=student_level, lesson=requested_lesson)
 
-    if requested_lesson:
-        skill_questions = [q for q in skill_questions if q.get('lesson') == requested_lesson]
-
-    if not skill_questions:
-        return jsonify({
+    if not len(candidates):
+        return skill_to_teach, None, (jsonify({
             "error": f"No questions found for skill: {skill_to_teach}",
             "lesson": requested_lesson,
             "skill": skill_to_teach,
             "debug": {
-                "total_questions": len(all_questions),
-                "skill_questions_before_filter": len([q for q in all_questions if q['skill'] == skill_to_teach]),
+                "total_questions": question_index.count(),
+                "skill_questions_before_filter": question_index.count(skill_to_teach),
                 "requested_lesson": requested_lesson
             }
-        }), 404
+        }), 404)
 
-    # ML-inspired selection: choose the question whose predicted success probability is nearest to 70%
-    student_skill_score = student['mastery'].get(skill_to_teach, 0.0)
-    target_probability = 0.7
-    scored_questions = []
-
-    for question in skill_questions:
-        difficulty_score = get_question_difficulty_score(question, question_stats)
-        predicted_probability = predict_success_probability(student_skill_score, difficulty_score)
-        scored_questions.append({
-            'question': question,
-            'predicted_probability': predicted_probability,
-            'difficulty_score': difficulty_score,
-            'distance_to_target': abs(predicted_probability - target_probability)
-        })
+    return skill_to_teach, candidates, None
 
-    if not scored_questions:
-        return jsonify({"error": "No questions available after scoring"}), 500
-
-    # Choose the closest to the target probability; break ties randomly
-    scored_questions.sort(key=lambda q: q['distance_to_target'])
-    best_distance = scored_questions[0]['distance_to_target']
-    best_candidates = [q for q in scored_questions if abs(q['distance_to_target'] - best_distance) < 1e-6]
-    chosen = random.choice(best_candidates)
-    question_to_send = {
-        **chosen['question'],
-        'predicted_success_probability': round(chosen['predicted_probability'], 2),
-        'question_difficulty_score': round(chosen['difficulty_score'], 2)
+def scored_question(chosen):
+    """A question as sent to the client, with its predicted success probability and difficulty."""
+    return {
+        **chosen.question,
+        'predicted_success_probability': round(chosen.probability, 2),
+        'question_difficulty_score': round(chosen.difficulty, 2)
     }
 
-    # Track session start
-    student_data[student_id]['current_session'] = {
+@app.route('/api/get-question', methods=['POST'])
+def get_question():
+    """Get next question based on student's mastery and level."""
+    student_id = request.json.get('student_id', 'student_alex')
+    requested_skill = request.json.get('skill')
+    requested_lesson = request.json.get('lesson')
+
+    # Create new student if doesn't exist
+    student = with_pending_ops(student_id, get_or_create_student(student_id)) # Default password for new auto-created students
+    skill_to_teach, candidates, response = question_candidates(student, requested_skill, requested_lesson)
+    if response is not None:
+        return response
+
+    # ML-inspired selection: choose the question whose predicted success probability is nearest to 70%
+    # (found by bisecting the candidates' difficulty order at the ideal difficulty, ties broken randomly;
+    # see scoring.py)
+    student_skill_score = student['mastery'].get(skill_to_teach, 0.0)
+    chosen = candidates.nearest(student_skill_score, get_question_stats_table(), TARGET_PROBABILITY)
+    question_to_send = scored_question(chosen)
+
+    # Track session start in the expiring session store (no profile write)
+    get_session_store().set(student_id, {
         'question_id': question_to_send['id'],
         'hints_used': 0,
         'start_time': time.time(),
         'lesson': question_to_send.get('lesson')
-    }
-    write_json_file(STUDENT_FILE, student_data)
+    })
 
     return jsonify(question_to_send)
 
+@app.route('/api/get-question-batch', methods=['POST'])
+def get_question_batch():
+    """Get a ranked queue of the next questions for a student, to be served locally in order."""
+    student_id = request.json.get('student_id', 'student_alex')
+    requested_skill = request.json.get('skill')
+    requested_lesson = request.json.get('lesson')
+    try:
+        count = min(max(int(request.json.get('count', QUESTION_BATCH_DEFAULT)), 1), QUESTION_BATCH_MAX)
+    except (TypeError, ValueError):
+        return jsonify({"error": "count must be an integer"}), 400
+
+    student = with_pending_ops(student_id, get_or_create_student(student_id))
+    skill_to_teach, candidates, response = question_candidates(student, requested_skill, requested_lesson)
+    if response is not None:
+        return response
+
+    # Same targeting as get-question: the `count` questions nearest 70%, nearest first, no repeats
+    student_skill_score = student['mastery'].get(skill_to_teach, 0.0)
+    batch = candidates.nearest_many(student_skill_score, get_question_stats_table(), count, TARGET_PROBABILITY)
+    questions = [scored_question(chosen) for chosen in batch]
+
+    # One session for the whole batch: the first question is timed now, submit-answer moves on to the next
+    get_session_store().set(student_id, {
+        'question_id': questions[0]['id'],
+        'queue': [question['id'] for question in questions[1:]],
+        'hints_used': 0,
+        'start_time': time.time(),
+        'lesson': questions[0].get('lesson')
+    })
+
+    return jsonify({"skill": skill_to_teach, "questions": questions})
+
+def advance_session(session_store, student_id, session, question_id):
+    """End the answered question's session, or start timing the next question of a prefetched batch."""
+    queue = [queued for queued in session.get('queue', []) if queued != question_id]
+    if not queue:
+        session_store.delete(student_id)
+        return
+    next_question = get_question_index().get(queue[0]) or {}
+    session_store.set(student_id, {
+        'question_id': queue[0],
+        'queue': queue[1:],
+        'hints_used': 0,
+        'start_time': time.time(),
+        'lesson': next_question.get('lesson')
+    })
+
 @app.route('/api/submit-answer', methods=['POST'])
 def submit_answer():
     """Update student's mastery score and metrics."""
@@ -590,66 +739,36 @@ def submit_answer():
     if not skill:
         return jsonify({"error": "No skill provided"}), 400
 
-    student_data = read_json_file(STUDENT_FILE)
-    domain_data = read_json_file(DOMAIN_FILE)
-    ensure_lessons(domain_data)
-
-    # Create new student if doesn't exist
-    if student_id not in student_data:
-        student_data[student_id] = create_new_student_profile(student_id, "password123") # Default password for new auto-created students
-        write_json_file(STUDENT_FILE, student_data)
-
-    student = student_data[student_id]
+    # Derive lesson from the domain data if it wasn't provided by the client
+    if not lesson and question_id:
+        question = get_question_index().get(question_id)
+        if question:
+            lesson = question.get('lesson')
 
     # Calculate time spent
-    session = student.get('current_session', {})
-    start_time = session.get('start_time', time.time())
+    session_store = get_session_store()
+    session = session_store.get(student_id) or {}
+    start_time = session.get('start_time') or time.time()
     time_spent = time.time() - start_time
     hints_used = session.get('hints_used', 0)
 
-    # Derive lesson from the domain data if it wasn't provided by the client
-    if not lesson and question_id:
-        for question in domain_data.get('questions', []):
-            if question.get('id') == question_id:
-                lesson = question.get('lesson')
-                break
-
-    # Update mastery: +0.25 if correct, -0.1 if wrong
-    if is_correct:
-        new_score = student['mastery'][skill] + 0.25
-    else:
-        new_score = student['mastery'][skill] - 0.1
-
-    student['mastery'][skill] = max(0.0, min(1.0, new_score))
-
-    # Update metrics with hints used
-    update_metrics(student_data, student_id, question_id, skill, is_correct, time_spent, hints_used, lesson)
-
-    # Update global question stats for difficulty calibration
-    question_stats = get_question_stats(domain_data)
-    stats_entry = question_stats.setdefault(str(question_id), {
-        'attempts': 0,
-        'correct': 0,
-        'incorrect': 0
-    })
-    stats_entry['attempts'] += 1
-    if is_correct:
-        stats_entry['correct'] += 1
+    event = answer_event(skill, is_correct, time_spent, hints_used, question_id, lesson)
+    buffer = get_metrics_buffer()
+    if buffer is not None:
+        # Write-behind: compute on the projected profile, queue the answer once it commits
+        student = projected_student(student_id)
+        record, new_badges = apply_event(student, student_id, event)
+        append_after_commit(student_id, event)
     else:
-        stats_entry['incorrect'] += 1
+        # Create new student if doesn't exist (default password for new auto-created students)
+        student, (record, new_badges) = mutate_student(student_id, lambda student: apply_event(student, student_id, event))
 
-    # Check for new badges
-    new_badges = check_badge_eligibility(student_data, student_id)
-
-    # Reset session
-    student['current_session'] = {
-        'question_id': None,
-        'hints_used': 0,
-        'start_time': None
-    }
-
-    write_json_file(STUDENT_FILE, student_data)
-    write_json_file(DOMAIN_FILE, domain_data)
+    # Side effects only once the profile update has won
+    advance_session(session_store, student_id, session, question_id)
+    record_event(student_id, event)
+    append_history(student_id, record)
+    # Update global question stats for difficulty calibration (atomic increment)
+    record_answer(question_id, is_correct)
 
     return jsonify({
         "success": True,
@@ -659,15 +778,16 @@ def submit_answer():
     })
 
 @app.route('/api/get-progress', methods=['POST'])
+@read_only
 def get_progress():
     """Get student's mastery data."""
     student_id = request.json.get('student_id', 'student_alex')
-    student_data = read_json_file(STUDENT_FILE)
+    student = with_pending_ops(student_id, get_student(student_id))
 
-    if student_id not in student_data:
+    if student is None:
         return jsonify({"error": "Student not found"}), 404
 
-    return jsonify(student_data[student_id]['mastery'])
+    return jsonify(student['mastery'])
 
 @app.route('/api/update-profile', methods=['POST'])
 def update_profile():
@@ -676,14 +796,9 @@ def update_profile():
     name = request.json.get('name')
     email = request.json.get('email')
 
-    student_data = read_json_file(STUDENT_FILE)
-    if student_id not in student_data:
+    if not update_profile_fields(student_id, {('name',): name, ('email',): email}):
         return jsonify({"error": "Student not found"}), 404
 
-    student_data[student_id]['name'] = name
-    student_data[student_id]['email'] = email
-    write_json_file(STUDENT_FILE, student_data)
-
     return jsonify({"success": True, "message": "Profile updated!"})
 
 @app.route('/api/update-password', methods=['POST'])
@@ -695,13 +810,9 @@ def update_password():
     if not password or len(password) < 8:
         return jsonify({"error": "Password must be at least 8 characters"}), 400
 
-    student_data = read_json_file(STUDENT_FILE)
-    if student_id not in student_data:
+    if not update_profile_fields(student_id, {('password_hash',): generate_password_hash(password)}):
         return jsonify({"error": "Student not found"}), 404
 
-    student_data[student_id]['password_hash'] = generate_password_hash(password)
-    write_json_file(STUDENT_FILE, student_data)
-
     return jsonify({"success": True, "message": "Password updated successfully!"})
 
 @app.route('/api/update-language', methods=['POST'])
@@ -711,15 +822,12 @@ def update_language():
     learn_lang = request.json.get('learn_lang')
     ui_lang = request.json.get('ui_lang')
 
-    student_data = read_json_file(STUDENT_FILE)
-    if student_id not in student_data:
-        return jsonify({"error": "Student not found"}), 404
-
-    student_data[student_id]['language_prefs'] = {
+    language_prefs = {
         "learn": learn_lang,
         "ui": ui_lang
     }
-    write_json_file(DOMAIN_FILE, domain_data)
+    if not update_profile_fields(student_id, {('language_prefs',): language_prefs}):
+        return jsonify({"error": "Student not found"}), 404
     return jsonify({"success": True, "message": "Language preferences updated!"})
 
 
@@ -742,8 +850,7 @@ def delete_skill():
         del lessons[skill]
 
     # Remove questions
-    questions = domain_data.get('questions', [])
-    domain_data['questions'] = [q for q in questions if q.get('skill') != skill]
+    question_bank.delete_questions(skill=skill)
 
     write_json_file(DOMAIN_FILE, domain_data)
     return jsonify({"success": True, "message": f"Skill '{skill}' deleted successfully"})
@@ -769,28 +876,26 @@ def delete_lesson():
             del lessons[skill]
 
     # Remove questions linked to this lesson
-    questions = domain_data.get('questions', [])
-    domain_data['questions'] = [q for q in questions if q.get('lesson') != lesson_id]
+    question_bank.delete_questions(lesson=lesson_id)
 
     write_json_file(DOMAIN_FILE, domain_data)
     return jsonify({"success": True, "message": f"Lesson '{lesson_id}' deleted successfully"})
 
 
 @app.route('/api/skills', methods=['GET'])
+@read_only
 def list_skills():
     """Return the list of available skills."""
-    domain_data = read_json_file(DOMAIN_FILE)
-    ensure_lessons(domain_data)
-    write_json_file(DOMAIN_FILE, domain_data)
-    return jsonify(get_all_skills(domain_data))
+    return jsonify(get_all_skills(get_domain_snapshot()))
 
 
 @app.route('/api/skill-lessons', methods=['GET'])
+@read_only
 def list_skill_lessons():
     """Return skills with their lessons for navigation/admin selection."""
-    domain_data = read_json_file(DOMAIN_FILE)
-    lessons = ensure_lessons(domain_data)
-    write_json_file(DOMAIN_FILE, domain_data)
+    # The cached snapshot already has placeholder lessons for every skill
+    domain_data = get_domain_snapshot()
+    lessons = domain_data.get('lessons', {})
 
     payload = []
     for skill in get_all_skills(domain_data):
@@ -822,22 +927,13 @@ def add_skill():
     ensure_lessons(domain_data)
 
     # Add mastery slots for all students
-    for student in student_data.values():
-        mastery = student.setdefault('mastery', {})
-        metrics = student.setdefault('metrics', {})
-        skill_performance = metrics.setdefault('skill_performance', {})
-
-        mastery[normalized_skill] = mastery.get(normalized_skill, 0.0)
-        skill_performance.setdefault(normalized_skill, {
-            'questions_answered': 0,
-            'correct': 0,
-            'incorrect': 0,
-            'average_time': 0,
-            'struggling_areas': []
-        })
+    event = skill_added_event(normalized_skill)
+    for username, student in student_data.items():
+        apply_event(student, username, event)
 
     write_json_file(DOMAIN_FILE, domain_data)
     write_json_file(STUDENT_FILE, student_data)
+    record_events((username, event) for username in student_data)
 
     return jsonify({"success": True, "skill": normalized_skill})
 
@@ -877,21 +973,48 @@ def add_lesson():
 
 
 @app.route('/api/admin/users', methods=['GET'])
+@read_only
 def list_users_for_admin():
-    """Return a lightweight list of all users for admin oversight."""
-    student_data = read_json_file(STUDENT_FILE)
-
-    users = []
-    for username, data in student_data.items():
-        users.append({
-            "username": username,
-            "role": data.get('role', 'student'),
-            "email": data.get('email'),
-            "name": data.get('name'),
-            "level": data.get('level', 1)
-        })
+    """
+    Return a lightweight list of users for admin oversight, sorted by username.
+
+    Optional query parameters: `role`, `level`, `limit` (page size, at most
+    ADMIN_USERS_MAX_PAGE) and `cursor` (the X-Next-Cursor header of the previous
+    page). Without `limit` every matching user is returned. The listed fields are
+    extracted and sorted in SQL; profile documents are never loaded.
+    """
+    query = db.select(
+        Student.username, STUDENT_ROLE, StudentProfile.data['email'].as_string(),
+        StudentProfile.data['name'].as_string(), STUDENT_LEVEL
+    ).outerjoin(StudentProfile, StudentProfile.username == Student.username).order_by(Student.username)
 
-    return jsonify(sorted(users, key=lambda u: u['username']))
+    try:
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        if request.args.get('level'):
+            query = query.where(STUDENT_LEVEL == int(request.args['level']))
+    except ValueError:
+        return jsonify({"error": "limit and level must be integers"}), 400
+    if request.args.get('role'):
+        query = query.where(STUDENT_ROLE == request.args['role'])
+    if request.args.get('cursor'):
+        query = query.where(Student.username > request.args['cursor'])
+    if limit is not None:
+        limit = max(1, min(limit, ADMIN_USERS_MAX_PAGE))
+        query = query.limit(limit + 1)
+
+    rows = db.session.execute(query).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0]
+
+    response = jsonify([
+        {"username": username, "role": role, "email": email, "name": name, "level": level}
+        for username, role, email, name, level in rows
+    ])
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @app.route('/api/diagnostic/start', methods=['POST'])
@@ -899,16 +1022,10 @@ def start_diagnostic():
     """Serve a lightweight baseline quiz across skills for new sessions."""
     student_id = request.json.get('student_id', 'student_alex')
 
-    student_data = read_json_file(STUDENT_FILE)
-    domain_data = read_json_file(DOMAIN_FILE)
-    ensure_lessons(domain_data)
-
     # Auto-provision student if missing
-    if student_id not in student_data:
-        student_data[student_id] = create_new_student_profile(student_id, "password123")
-        write_json_file(STUDENT_FILE, student_data)
+    get_or_create_student(student_id)
 
-    questions = build_diagnostic_questions(domain_data)
+    questions = get_diagnostic_questions()
     return jsonify({
         'questions': questions,
         'count': len(questions)
@@ -921,41 +1038,20 @@ def submit_diagnostic():
     student_id = request.json.get('student_id', 'student_alex')
     responses = request.json.get('responses', [])
 
-    student_data = read_json_file(STUDENT_FILE)
-    domain_data = read_json_file(DOMAIN_FILE)
-    lessons = ensure_lessons(domain_data)
-
-    if student_id not in student_data:
-        student_data[student_id] = create_new_student_profile(student_id, "password123")
-
-    student = student_data[student_id]
-    mastery_updates = {}
-    skill_summary = {}
-
-    # Aggregate response accuracy per skill
-    for entry in responses:
-        skill = entry.get('skill')
-        is_correct = entry.get('is_correct', False)
-        question_id = entry.get('question_id')
-        lesson = entry.get('lesson')
-
-        if not skill:
-            continue
-
-        summary = skill_summary.setdefault(skill, {'attempts': 0, 'correct': 0})
-        summary['attempts'] += 1
-        if is_correct:
-            summary['correct'] += 1
-
-        # Log to metrics for transparency/history
-        update_metrics(student_data, student_id, question_id, skill, is_correct, time_spent=5, hints_used=0, lesson=lesson)
+    lessons = get_domain_snapshot().get('lessons', {})
 
-    # Derive mastery adjustments and recommendations
-    for skill, summary in skill_summary.items():
-        ratio = summary['correct'] / summary['attempts'] if summary['attempts'] else 0
-        mastery_score = clamp(0.3 + 0.7 * ratio)
-        student['mastery'][skill] = mastery_score
-        mastery_updates[skill] = mastery_score
+    event = diagnostic_event(responses)
+    buffer = get_metrics_buffer()
+    if buffer is not None:
+        # Write-behind: compute on the projected profile and queue the responses once they commit
+        student = projected_student(student_id)
+        mastery_updates, history = apply_event(student, student_id, event)
+        append_after_commit(student_id, event)
+    else:
+        # Compare-and-swap with retry, like submit-answer (creates the student if missing)
+        student, (mastery_updates, history) = mutate_student(
+            student_id, lambda student: apply_event(student, student_id, event))
+    record_event(student_id, event)
 
     # Recommend lessons for the lowest-confidence skills
     recommended_lessons = []
@@ -970,13 +1066,7 @@ def submit_diagnostic():
             'lesson': lesson_list[0]
         })
 
-    write_json_file(STUDENT_FILE, student_data)
-    write_json_file(DOMAIN_FILE, domain_data)
-
-    # Mark diagnostic as complete
-    student['diagnostic_complete'] = True
-    write_json_file(STUDENT_FILE, student_data)
-    write_json_file(DOMAIN_FILE, domain_data)
+    append_history(student_id, history)
 
     return jsonify({
         'mastery_updates': mastery_updates,
@@ -992,19 +1082,12 @@ def delete_user_account():
     if not username:
         return jsonify({"error": "Username is required"}), 400
 
-    # First attempt to delete from the database
-    db_success = db_delete_student(username)
-
-    # Also check if it exists in the local JSON structure for compatibility
-    student_data = read_json_file(STUDENT_FILE)
-    json_exists = username in student_data
-
-    if json_exists:
-        del student_data[username]
-        write_json_file(STUDENT_FILE, student_data)
-
-    if not db_success and not json_exists:
+    if not db_delete_student(username):
         return jsonify({"error": "User not found"}), 404
+    delete_history(username)
+    delete_events(username)
+    # Including any prefetched batch, so a re-created account with this name starts clean
+    get_session_store().delete(username)
 
     return jsonify({"success": True, "message": f"User '{username}' deleted successfully"})
 
@@ -1017,16 +1100,9 @@ def reset_password():
     if not username or not new_password:
         return jsonify({"error": "Username and new password are required"}), 400
 
-    student_data = read_json_file(STUDENT_FILE)
-    if username not in student_data:
-        return jsonify({"error": "User not found"}), 404
-
     # Hash the new password
-    hashed_password = generate_password_hash(new_password)
-
-    # Update local structure (which updates DB via shim)
-    student_data[username]['password_hash'] = hashed_password
-    write_json_file(STUDENT_FILE, student_data)
+    if not update_profile_fields(username, {('password_hash',): generate_password_hash(new_password)}):
+        return jsonify({"error": "User not found"}), 404
 
     return jsonify({"success": True, "message": "Password reset successfully!"})
 
@@ -1039,18 +1115,12 @@ def delete_own_account():
     if not student_id:
         return jsonify({"error": "Student ID is required"}), 400
 
-    # Use existing deletion logic
-    db_success = db_delete_student(student_id)
-
-    student_data = read_json_file(STUDENT_FILE)
-    json_exists = student_id in student_data
-
-    if json_exists:
-        del student_data[student_id]
-        write_json_file(STUDENT_FILE, student_data)
-
-    if not db_success and not json_exists:
+    if not db_delete_student(student_id):
         return jsonify({"error": "Account not found"}), 404
+    delete_history(student_id)
+    delete_events(student_id)
+    # Including any prefetched batch, so a re-created account with this name starts clean
+    get_session_store().delete(student_id)
 
     return jsonify({"success": True, "message": "Your account has been deleted."})
 
@@ -1141,18 +1211,11 @@ def update_question_image():
     if not question_id or not image_url:
         return jsonify({"error": "question_id and image_url are required"}), 400
 
-    domain_data = read_json_file(DOMAIN_FILE)
-    questions = domain_data.get('questions', [])
-
-    question = next((q for q in questions if q['id'] == question_id), None)
+    # Add image URL to question
+    question = question_bank.update_question(question_id, image_url=image_url)
     if not question:
         return jsonify({"error": "Question not found"}), 404
 
-    # Add image URL to question
-    question['image_url'] = image_url
-
-    write_json_file(DOMAIN_FILE, domain_data)
-
     return jsonify({"success": True, "question": question})
 
 @app.route('/api/add-question', methods=['POST'])
@@ -1167,20 +1230,19 @@ def add_question():
     if not all([question, answer, skill]):
         return jsonify({"error": "Missing data"}), 400
 
-    domain_data = read_json_file(DOMAIN_FILE)
+    domain_data = get_domain_snapshot()
     available_skills = get_all_skills(domain_data)
     if skill not in available_skills:
         return jsonify({"error": f"Skill '{skill}' is not recognized. Add it as a skill first."}), 400
-    lessons = ensure_lessons(domain_data)
+    lessons = domain_data.get('lessons', {})
     skill_lessons = lessons.get(skill, [])
 
     if not lesson and skill_lessons:
         lesson = skill_lessons[0]['id']
     elif lesson and not any(l['id'] == lesson for l in skill_lessons):
         return jsonify({"error": f"Lesson '{lesson}' is not recognized for skill '{skill}'"}), 400
-    all_questions = domain_data.get('questions', [])
 
-    new_id = max([q['id'] for q in all_questions] or [0]) + 1
+    new_id = question_bank.allocate_question_ids(1)
 
     new_question = {
         "id": new_id,
@@ -1198,10 +1260,7 @@ def add_question():
         "difficulty": "beginner"
     }
 
-    all_questions.append(new_question)
-    domain_data['questions'] = all_questions
-
-    write_json_file(DOMAIN_FILE, domain_data)
+    question_bank.add_questions([new_question])
 
     return jsonify({"success": True, "new_question": new_question})
 
@@ -1214,33 +1273,23 @@ def delete_question():
     if not question_id:
         return jsonify({"error": "Question ID required"}), 400
 
-    domain_data = read_json_file(DOMAIN_FILE)
-    all_questions = domain_data.get('questions', [])
-
-    # Find and remove the question
-    original_count = len(all_questions)
-    all_questions = [q for q in all_questions if q['id'] != question_id]
-
-    if len(all_questions) == original_count:
+    if not question_bank.delete_question(question_id):
         return jsonify({"error": "Question not found"}), 404
 
-    domain_data['questions'] = all_questions
-    write_json_file(DOMAIN_FILE, domain_data)
-
     return jsonify({"success": True, "message": "Question deleted successfully"})
 
 @app.route('/api/get-all-questions', methods=['GET'])
+@read_only
 def get_all_questions():
     """Get all questions for admin management."""
-    domain_data = read_json_file(DOMAIN_FILE)
-    return jsonify(domain_data.get('questions', []))
+    return jsonify(get_question_index().questions())
 
 @app.route('/api/student-data', methods=['GET'])
+@read_only
 def get_student_data():
     """Get complete student data for frontend."""
-    student_data = read_json_file(STUDENT_FILE)
     student_id = request.json.get('student_id', 'student_alex')
-    return jsonify(student_data.get(student_id, {}))
+    return jsonify(get_full_student(student_id) or {})
 
 @app.route('/api/get-hint', methods=['POST'])
 def get_hint():
@@ -1248,23 +1297,29 @@ def get_hint():
     student_id = request.json.get('student_id', 'student_alex')
     question_id = request.json.get('question_id')
 
-    student_data = read_json_file(STUDENT_FILE)
-    domain_data = read_json_file(DOMAIN_FILE)
-
-    if student_id not in student_data:
+    if get_student(student_id) is None:
         return jsonify({"error": "Student not found"}), 404
 
-    student = student_data[student_id]
-    session = student.get('current_session', {})
-    hints_used = session.get('hints_used', 0)
-
     # Find the question
-    question = next((q for q in domain_data['questions'] if q['id'] == question_id), None)
+    question = get_question_index().get(question_id)
     if not question:
         return jsonify({"error": "Question not found"}), 404
 
     hints = question.get('hints', [])
 
+    # Read and bump the counter in one atomic step, so two quick clicks can't both get hint #1
+    session_store = get_session_store()
+    hints_used = session_store.increment(student_id, 'hints_used', maximum=len(hints))
+    if hints_used is None:
+        # No live session (expired, or the question wasn't served by get-question): start one
+        session_store.set(student_id, {
+            'question_id': question_id,
+            'hints_used': 0,
+            'start_time': time.time(),
+            'lesson': question.get('lesson')
+        })
+        hints_used = session_store.increment(student_id, 'hints_used', maximum=len(hints))
+
     if hints_used >= len(hints):
         # Give answer after 3 hints
         if hints_used >= 3:
@@ -1278,10 +1333,6 @@ def get_hint():
 
     hint = hints[hints_used]
 
-    # Update hints used
-    student['current_session']['hints_used'] = hints_used + 1
-    write_json_file(STUDENT_FILE, student_data)
-
     return jsonify({
         "hint": hint,
         "is_answer": False,
@@ -1292,12 +1343,11 @@ def get_hint():
 def get_badges():
     """Get student's badges and available badges."""
     student_id = request.json.get('student_id', 'student_alex')
-    student_data = read_json_file(STUDENT_FILE)
+    student = with_pending_ops(student_id, get_student(student_id))
 
-    if student_id not in student_data:
+    if student is None:
         return jsonify({"error": "Student not found"}), 404
 
-    student = student_data[student_id]
     earned_badges = student.get('badges', [])
 
     # Define all possible badges
@@ -1358,14 +1408,9 @@ def get_badges():
 def get_metrics():
     """Get student's performance metrics."""
     student_id = request.json.get('student_id', 'student_alex')
-    student_data = read_json_file(STUDENT_FILE)
 
     # Create new student if doesn't exist
-    if student_id not in student_data:
-        student_data[student_id] = create_new_student_profile(student_id, "password123") # Default password for new auto-created students
-        write_json_file(STUDENT_FILE, student_data)
-
-    student = student_data[student_id]
+    student = with_pending_ops(student_id, get_or_create_student(student_id)) # Default password for new auto-created students
     metrics = student.get('metrics', {})
     mastery = student.get('mastery', {})
 
@@ -1386,31 +1431,26 @@ def get_metrics():
 def reset_progress():
     """Reset student's progress (for testing/new users)."""
     student_id = request.json.get('student_id', 'student_alex')
-    student_data = read_json_file(STUDENT_FILE)
+    student = get_student(student_id)
 
     # Reset to fresh profile
-    # Preserve password and basic info, just reset progress
-    if student_id in student_data:
-        current_password_hash = student_data[student_id].get('password_hash')
-        current_email = student_data[student_id].get('email')
-        current_name = student_data[student_id].get('name')
-
-        # Reset to fresh profile
-        new_profile = create_new_student_profile(student_id, "dummy")
-        new_profile['password_hash'] = current_password_hash
-        new_profile['email'] = current_email
-        new_profile['name'] = current_name
-
-        student_data[student_id] = new_profile
+    if student is not None:
+        # Preserve password and basic info: only the hot record is reset
+        new_profile, _ = split_student(create_new_student_profile(student_id, "dummy"))
+        discard_pending_ops(student_id)
+        save_student(student_id, new_profile)
+        new_profile = {**(db_load_profile(student_id) or {}), **new_profile}
     else:
-        student_data[student_id] = create_new_student_profile(student_id, "password123")
-
-    write_json_file(STUDENT_FILE, student_data)
+        new_profile = create_new_student_profile(student_id, "password123")
+        discard_pending_ops(student_id)
+        save_student(student_id, new_profile)
+    record_event(student_id, reset_event(new_profile['mastery']))
+    delete_history(student_id)
 
     return jsonify({
         "success": True,
         "message": "Progress reset successfully!",
-        "student_data": student_data[student_id]
+        "student_data": new_profile
     })
 
 @app.route('/api/create-student', methods=['POST'])
@@ -1422,14 +1462,15 @@ def create_student():
     if not student_id:
         return jsonify({"error": "Student ID required"}), 400
 
-    student_data = read_json_file(STUDENT_FILE)
-
-    # Create new profile
+    # Create new profile (replacing an existing one, so read its current version first)
+    get_student(student_id)
     new_profile = create_new_student_profile(student_id, "password123")
     new_profile['name'] = name
-    student_data[student_id] = new_profile
-
-    write_json_file(STUDENT_FILE, student_data)
+    discard_pending_ops(student_id)
+    # The replaced student's answers go with it, as on reset-progress
+    delete_history(student_id)
+    save_student(student_id, new_profile)
+    record_event(student_id, reset_event(new_profile['mastery']))
 
     return jsonify({
         "success": True,
@@ -1438,28 +1479,34 @@ def create_student():
     })
 
 @app.route('/api/get-question-history', methods=['POST'])
+@read_only
 def get_question_history():
     """Get detailed question history for a student."""
     student_id = request.json.get('student_id', 'student_alex')
     limit = request.json.get('limit', 50)  # Default to last 50 questions
+    cursor = request.json.get('cursor')  # next_cursor from the previous page, for older records
 
-    student_data = read_json_file(STUDENT_FILE)
-    domain_data = read_json_file(DOMAIN_FILE)
-
-    if student_id not in student_data:
+    try:
+        limit = int(limit)
+        if limit < 0:
+            raise ValueError(limit)
+        if cursor:
+            decode_cursor(cursor)
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit must be a non-negative integer and cursor a next_cursor from a previous page"}), 400
+
+    student = with_pending_ops(student_id, get_student(student_id))
+    if student is None:
         return jsonify({"error": "Student not found"}), 404
 
-    student = student_data[student_id]
-    history = student.get('question_history', [])
+    # Get the most recent questions (one page, read from the indexed history table)
+    recent_history, next_cursor = fetch_history(student_id, limit, cursor)
 
-    # Get the most recent questions (limited)
-    recent_history = history[-limit:] if len(history) > limit else history
-
-    # Enrich history with question details
+    # Enrich history with question details (one id lookup per record)
+    questions_by_id = get_question_index().get_many(record['question_id'] for record in recent_history)
     enriched_history = []
     for record in recent_history:
-        question_id = record['question_id']
-        question_data = next((q for q in domain_data['questions'] if q['id'] == question_id), None)
+        question_data = questions_by_id.get(record['question_id'])
 
         enriched_record = {
             **record,
@@ -1470,11 +1517,35 @@ def get_question_history():
 
     return jsonify({
         "history": enriched_history,
-        "total_questions": len(history),
-        "showing": len(recent_history)
+        "total_questions": student.get('metrics', {}).get('total_questions_answered', 0),
+        "showing": len(recent_history),
+        "next_cursor": next_cursor
     })
 
+@app.route('/api/get-daily-history', methods=['POST'])
+@read_only
+def get_daily_history():
+    """Get per-day, per-skill answer totals for a student, compacted history included."""
+    student_id = request.json.get('student_id', 'student_alex')
+    days = request.json.get('days')  # Only the last N days; everything when omitted
+
+    if get_student(student_id) is None:
+        return jsonify({"error": "Student not found"}), 404
+
+    since = None
+    if days is not None:
+        try:
+            days = int(days)
+            if days < 1:
+                raise ValueError(days)
+            since = (datetime.now() - timedelta(days=days - 1)).date()
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({"error": "days must be an integer of at least 1"}), 400
+
+    return jsonify({"daily_history": fetch_daily_history(student_id, since)})
+
 @app.route('/api/retry-question', methods=['POST'])
+@read_only
 def retry_question():
     """Get a specific question for retry."""
     question_id = request.json.get('question_id')
@@ -1482,8 +1553,7 @@ def retry_question():
     if not question_id:
         return jsonify({"error": "Question ID required"}), 400
 
-    domain_data = read_json_file(DOMAIN_FILE)
-    question = next((q for q in domain_data['questions'] if q['id'] == question_id), None)
+    question = get_question_index().get(question_id)
 
     if not question:
         return jsonify({"error": "Question not found"}), 404
@@ -1496,18 +1566,12 @@ def get_session_summary():
     student_id = request.json.get('student_id', 'student_alex')
     session_size = request.json.get('session_size', 10)  # Last 10 questions
 
-    student_data = read_json_file(STUDENT_FILE)
+    student = with_pending_ops(student_id, get_student(student_id))
 
-    if student_id not in student_data:
+    if student is None:
         return jsonify({"error": "Student not found"}), 404
 
-    student = student_data[student_id]
-    history = student.get('question_history', [])
-
-    if len(history) < session_size:
-        session_questions = history
-    else:
-        session_questions = history[-session_size:]
+    session_questions, _ = fetch_history(student_id, session_size)
 
     if not session_questions:
         return jsonify({
@@ -1572,9 +1636,9 @@ def ai_generate_lesson():
         # Get student weak areas if student_id provided
         weak_areas = []
         if student_id:
-            student_data = db_load_students()
-            if student_id in student_data:
-                metrics = student_data[student_id].get('metrics', {}).get('skill_performance', {})
+            student = get_student(student_id)
+            if student is not None:
+                metrics = student.get('metrics', {}).get('skill_performance', {})
                 if skill in metrics:
                     weak_areas = metrics[skill].get('struggling_areas', [])
 
@@ -1610,9 +1674,8 @@ def ai_generate_lesson():
         skill_lessons.append(new_lesson)
         domain_data['lessons'] = lessons
 
-        # Add auto-generated questions
-        all_questions = domain_data.get('questions', [])
-        next_id = max([q['id'] for q in all_questions] or [0]) + 1
+        # Add auto-generated questions (one contiguous block of ids)
+        next_id = question_bank.allocate_question_ids(len(generated_questions))
 
         for i, q in enumerate(generated_questions):
             q['id'] = next_id + i
@@ -1621,8 +1684,7 @@ def ai_generate_lesson():
             q['lesson'] = lesson_id
             q['ai_generated'] = True
 
-        all_questions.extend(generated_questions)
-        domain_data['questions'] = all_questions
+        question_bank.add_questions(generated_questions)
 
         print(f"Successfully generated lesson and {len(generated_questions)} questions for {lesson_id}")
 
@@ -1658,12 +1720,8 @@ def ai_generate_questions():
         generator = get_generator()
         questions = generator.generate_questions(skill, difficulty, count, lesson_id, focus_areas)
 
-        # Add questions to domain data
-        domain_data = read_json_file(DOMAIN_FILE)
-        all_questions = domain_data.get('questions', [])
-
-        # Get next ID
-        next_id = max([q['id'] for q in all_questions] or [0]) + 1
+        # Reserve a contiguous block of IDs
+        next_id = question_bank.allocate_question_ids(len(questions))
 
         # Add IDs and metadata
         for i, q in enumerate(questions):
@@ -1674,9 +1732,8 @@ def ai_generate_questions():
             if lesson_id:
                 q['lesson'] = lesson_id
 
-        all_questions.extend(questions)
-        domain_data['questions'] = all_questions
-        write_json_file(DOMAIN_FILE, domain_data)
+        # Add questions to the question bank
+        question_bank.add_questions(questions)
 
         return jsonify({
             "success": True,
@@ -1702,22 +1759,19 @@ def ai_personalized_practice():
         return jsonify({"error": "student_id and skill are required"}), 400
 
     try:
-        student_data = read_json_file(STUDENT_FILE)
+        student = with_pending_ops(student_id, get_student(student_id))
 
-        if student_id not in student_data:
+        if student is None:
             return jsonify({"error": "Student not found"}), 404
 
         generator = get_generator()
         practice_data = generator.generate_personalized_practice(
-            student_data[student_id], skill, count
+            student, skill, count
         )
 
-        # Optionally save questions to domain
-        domain_data = read_json_file(DOMAIN_FILE)
-        all_questions = domain_data.get('questions', [])
-        next_id = max([q['id'] for q in all_questions] or [0]) + 1
-
+        # Optionally save questions to the question bank
         generated_questions = practice_data.get('questions', [])
+        next_id = question_bank.allocate_question_ids(len(generated_questions))
         for i, q in enumerate(generated_questions):
             q['id'] = next_id + i
             q['skill'] = skill
@@ -1725,9 +1779,7 @@ def ai_personalized_practice():
             q['ai_generated'] = True
             q['personalized'] = True
 
-        all_questions.extend(generated_questions)
-        domain_data['questions'] = all_questions
-        write_json_file(DOMAIN_FILE, domain_data)
+        question_bank.add_questions(generated_questions)
 
         return jsonify({
             "success": True,
@@ -1783,7 +1835,10 @@ if __name__ == '__main__':
                 ]
             }
             for category, data in default_domain.items():
-                db.session.add(Domain(category=category, data=data))
+                if category == 'questions':
+                    db.session.execute(db.insert(Question), [question_bank.question_row(q) for q in data])
+                else:
+                    db.session.add(Domain(category=category, data=data))
             db.session.commit()
 
         # Check if we have any students, if not, create defaults
@@ -1798,7 +1853,9 @@ if __name__ == '__main__':
             default_students["student_alex"]["email"] = "student@test.com"
 
             for username, data in default_students.items():
-                db.session.add(Student(username=username, data=data))
+                hot, cold = split_student(data)
+                db.session.add(Student(username=username, data=hot))
+                db.session.add(StudentProfile(username=username, data=cold))
             db.session.commit()
 
     port = int(os.environ.get("FLASK_PORT", 5000))
@@ -0,0 +1,117 @@
+"""
+Benchmark candidate scoring for get-question: the per-question Python loop
+(score, build a dict, sort everything, take the closest to 70%) against the
+vectorized scoring of a whole CandidateSet in scoring.py, and against the
+bisection over its difficulty order (nearest(), with answers arriving
+between lookups) that get-question uses.
+
+Runs on the in-memory backend with synthetic questions and answer stats:
+
+    python bench_scoring.py                  # 1k, 100k and 1M candidates
+    python bench_scoring.py 5000 50000
+"""
+import os
+import random
+import statistics
+import sys
+import time
+import numpy as np
+
+os.environ['DATABASE_URL'] = 'memory'
+
+SIZES = [1_000, 100_000, 1_000_000]
+DIFFICULTIES = ['beginner', 'intermediate', 'advanced']
+
+
+def make_questions(count, rng):
+    questions = [{"id": i, "skill": "grammar", "level": 1, "difficulty": rng.choice(DIFFICULTIES)}
+                 for i in range(1, count + 1)]
+    # About half the bank has been answered
+    stats = {}
+    for question in questions:
+        if rng.random() < 0.5:
+            attempts = rng.randint(1, 200)
+            correct = rng.randint(0, attempts)
+            stats[str(question['id'])] = {'attempts': attempts, 'correct': correct, 'incorrect': attempts - correct}
+    return questions, stats
+
+
+def loop_choice(app_module, questions, question_stats, skill_score, target=0.7):
+    """The selection get-question did before scoring.py."""
+    scored_questions = []
+    for question in questions:
+        difficulty_score = app_module.get_question_difficulty_score(question, question_stats)
+        predicted_probability = app_module.predict_success_probability(skill_score, difficulty_score)
+        scored_questions.append({
+            'question': question,
+            'predicted_probability': predicted_probability,
+            'difficulty_score': difficulty_score,
+            'distance_to_target': abs(predicted_probability - target)
+        })
+    scored_questions.sort(key=lambda q: q['distance_to_target'])
+    best_distance = scored_questions[0]['distance_to_target']
+    best_candidates = [q for q in scored_questions if abs(q['distance_to_target'] - best_distance) < 1e-6]
+    return random.choice(best_candidates)
+
+
+def numpy_choice(candidates, table, skill_score, target=0.7):
+    """Score every candidate at once and take the closest to 70%."""
+    _, probability, distance = candidates.score(skill_score, table, target)
+    return float(probability[np.argmin(distance)])
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def run_benchmark(sizes):
+    import app as app_module
+    from scoring import CandidateSet, stats_table
+
+    rng = random.Random(42)
+    print("=" * 96)
+    print("Scoring all candidates and picking the one nearest 70% (ms, median)")
+    print("=" * 96)
+    print(f"{'candidates':>10} | {'python loop':>12} | {'numpy':>10} | {'speedup':>8} | "
+          f"{'arrays build':>12} | {'bisect':>8} | {'+3 answers':>10} | {'order sort':>10} | {'same pick':>9}")
+
+    for size in sizes:
+        questions, question_stats = make_questions(size, rng)
+        repeats = 3 if size >= 1_000_000 else 10
+        skill_score = 0.42
+
+        loop_ms, loop_pick = timed(lambda: loop_choice(app_module, questions, question_stats, skill_score), repeats)
+        # One-off per domain/stats version in the server: candidate arrays and the stats table
+        build_ms, (candidates, table) = timed(lambda: (CandidateSet(questions), stats_table(question_stats)), 1)
+        numpy_ms, numpy_pick = timed(lambda: numpy_choice(candidates, table, skill_score), repeats)
+        # One-off per CandidateSet and stats reload: the sort by difficulty
+        order_ms, _ = timed(lambda: candidates.nearest(skill_score, table), 1)
+        bisect_ms, _ = timed(lambda: candidates.nearest(skill_score, table), repeats * 10)
+
+        def answer_then_pick():
+            # A few answers land between lookups, so each pick also moves the changed questions
+            for _ in range(3):
+                table.record(rng.randint(1, size), rng.random() < 0.7)
+            return candidates.nearest(skill_score, table)
+        answers_ms, _ = timed(answer_then_pick, repeats * 10)
+        bisect_pick = candidates.nearest(skill_score, table)
+        _, _, distance = candidates.score(skill_score, table)
+
+        same = (abs(loop_pick['distance_to_target'] - abs(numpy_pick - 0.7)) < 1e-6
+                and abs(abs(bisect_pick.probability - 0.7) - distance.min()) < 1e-6)
+        print(f"{size:>10} | {loop_ms:12.2f} | {numpy_ms:10.2f} | {loop_ms / numpy_ms:7.0f}x | "
+              f"{build_ms:12.2f} | {bisect_ms:8.3f} | {answers_ms:10.3f} | {order_ms:10.2f} | {'yes' if same else 'NO':>9}")
+        if not same:
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    success = run_benchmark(sizes)
+    exit(0 if success else 1)
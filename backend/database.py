@@ -1,33 +1,423 @@
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Delete, Insert, Select, Update, create_engine, event, exc
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.pool import QueuePool, StaticPool
+import json
 import os
+import threading
+import time
 
-db = SQLAlchemy()
+# --- Read/write routing ---
+# With DATABASE_REPLICA_URL set, SELECTs issued by views marked @read_only go to the
+# replica engine. Everything else, and every read after the request's first write or
+# inside use_primary(), stays on the primary.
+REPLICA_BIND = 'replica'
+
+
+def get_replica_engine():
+    """The replica engine for the current app, or None without DATABASE_REPLICA_URL."""
+    return current_app.extensions.get(REPLICA_BIND)
+
+
+def _reads_from_replica():
+    return (has_app_context() and g.get('db_read_only', False)
+            and not g.get('db_use_primary', False) and not g.get('db_wrote', False))
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if isinstance(clause, Select) and not self._flushing and _reads_from_replica():
+                replica = get_replica_engine()
+                if replica is not None:
+                    return replica
+            elif has_app_context() and (self._flushing or isinstance(clause, (Insert, Update, Delete))):
+                # From now on this request reads its own writes
+                g.db_wrote = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Mark a view as a pure read, so its queries may be served by the replica."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def use_primary():
+    """Keep the enclosed reads on the primary, e.g. when they must see a just-committed write."""
+    previous = g.get('db_use_primary', False)
+    g.db_use_primary = True
+    try:
+        yield
+    finally:
+        g.db_use_primary = previous
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# JSONB on Postgres, plain JSON (text) everywhere else, e.g. SQLite
+JSONDocument = db.JSON().with_variant(JSONB(), 'postgresql')
+# SQLite only auto-increments INTEGER PRIMARY KEY columns
+BigIntegerKey = db.BigInteger().with_variant(db.Integer(), 'sqlite')
 
 class Student(db.Model):
     __tablename__ = 'students'
     username = db.Column(db.String(80), primary_key=True)
-    # Store the entire profile as JSONB to maintain flexibility
-    data = db.Column(JSONB)
+    # Hot half of the profile: the adaptive state (level, mastery, metrics, badges) tutoring requests use
+    data = db.Column(JSONDocument)
+    # Bumped on every write; updates only apply if the version is still the one that was read
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
+class StudentProfile(db.Model):
+    __tablename__ = 'student_profiles'
+    username = db.Column(db.String(80), primary_key=True)
+    # Cold half: account and settings fields (password hash, role, name, email, language prefs)
+    data = db.Column(JSONDocument)
+
+# Profile keys stored in student_profiles; every other key (mastery, metrics, ...) stays in students
+STUDENT_COLD_FIELDS = ('username', 'password_hash', 'role', 'name', 'email', 'language_prefs')
+
+def split_student(profile):
+    """Split a full profile dict into its (hot, cold) halves."""
+    hot = {key: value for key, value in profile.items() if key not in STUDENT_COLD_FIELDS}
+    cold = {key: value for key, value in profile.items() if key in STUDENT_COLD_FIELDS}
+    return hot, cold
+
+# Fields the admin user list filters on, with the defaults profiles are read with
+STUDENT_ROLE = db.func.coalesce(StudentProfile.data['role'].as_string(), 'student')
+STUDENT_LEVEL = db.func.coalesce(Student.data['level'].as_integer(), 1)
+# Expression indexes so filtered, username-ordered pages are index range scans
+STUDENT_INDEXES = (
+    db.Index('ix_student_profiles_role_username', STUDENT_ROLE, StudentProfile.username),
+    db.Index('ix_students_level_username', STUDENT_LEVEL, Student.username),
+)
 
 class Domain(db.Model):
     __tablename__ = 'domain'
     # Category can be 'questions', 'skills', 'lessons', 'question_stats'
     category = db.Column(db.String(50), primary_key=True)
-    data = db.Column(JSONB)
+    data = db.Column(JSONDocument)
 
-def init_db(app):
-    url = os.getenv('DATABASE_URL')
+class Question(db.Model):
+    __tablename__ = 'questions'
+    id = db.Column(db.Integer, primary_key=True)
+    # Indexed copies of the fields questions are selected by
+    skill = db.Column(db.String(80), nullable=False)
+    level = db.Column(db.Integer, nullable=False, default=1)
+    lesson = db.Column(db.String(120), index=True)
+    # Full question document (text, answer, hints, difficulty, ...)
+    data = db.Column(JSONDocument, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_questions_skill_level', 'skill', 'level'),
+    )
+
+class QuestionStat(db.Model):
+    __tablename__ = 'question_stats'
+    # Global answer counters per question, bumped with atomic increments
+    question_id = db.Column(db.Integer, primary_key=True)
+    attempts = db.Column(db.BigInteger, nullable=False, default=0)
+    correct = db.Column(db.BigInteger, nullable=False, default=0)
+    incorrect = db.Column(db.BigInteger, nullable=False, default=0)
+
+class QuestionHistory(db.Model):
+    __tablename__ = 'question_history'
+    # Append-only log of every answered question, paged per student by time
+    id = db.Column(BigIntegerKey, primary_key=True, autoincrement=True)
+    username = db.Column(db.String(80), nullable=False)
+    question_id = db.Column(db.Integer)
+    skill = db.Column(db.String(80))
+    lesson = db.Column(db.String(120))
+    is_correct = db.Column(db.Boolean, nullable=False, default=False)
+    time_spent = db.Column(db.Float, nullable=False, default=0)
+    hints_used = db.Column(db.Integer, nullable=False, default=0)
+    session_id = db.Column(db.Integer)
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_question_history_username_timestamp', 'username', 'timestamp'),
+    )
+
+class HistoryRollup(db.Model):
+    __tablename__ = 'history_rollups'
+    # Daily per-skill totals of question_history rows compacted by history_rollup.py
+    username = db.Column(db.String(80), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    skill = db.Column(db.String(80), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    time_spent = db.Column(db.Float, nullable=False, default=0)
+    hints_used = db.Column(db.Integer, nullable=False, default=0)
+
+class AnswerEvent(db.Model):
+    __tablename__ = 'answer_events'
+    # Immutable log of everything that changes a profile's mastery/metrics/badges (see projections.py)
+    id = db.Column(BigIntegerKey, primary_key=True, autoincrement=True)
+    username = db.Column(db.String(80), nullable=False)
+    event_type = db.Column(db.String(20), nullable=False)
+    payload = db.Column(JSONDocument, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_answer_events_username_id', 'username', 'id'),
+    )
+
+class IdSequence(db.Model):
+    __tablename__ = 'id_sequences'
+    # Named counters that hand out contiguous blocks of ids (e.g. 'questions')
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+
+class ProgressMarker(db.Model):
+    __tablename__ = 'progress_markers'
+    # Small key/value table for bookkeeping written alongside the data it describes:
+    # import checkpoints (migrate.py) and applied metrics log segments (metrics_buffer.py)
+    name = db.Column(db.String(200), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False)
+
+class DomainVersion(db.Model):
+    __tablename__ = 'domain_version'
+    # Single-row counter bumped on every domain write so each worker knows
+    # when its cached copy of the domain data is stale
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+# --- Backend selection ---
+# DATABASE_URL=memory keeps everything in one in-process SQLite database (tests, benchmarks)
+MEMORY_URL = 'sqlite://'
+# Without DATABASE_URL a single node stores its data in a local SQLite file
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'neuralinq.db')
+
+
+def database_url():
+    """Resolve DATABASE_URL to a SQLAlchemy URL (Postgres, SQLite file or in-memory)."""
+    url = os.getenv('DATABASE_URL', '').strip()
+    if url.lower() == 'memory':
+        return MEMORY_URL
     if not url:
-        print("WARNING: DATABASE_URL not found!")
-        return
+        return f"sqlite:///{DEFAULT_SQLITE_PATH}"
+    return url
+
+
+def is_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def upsert(model):
+    """INSERT supporting on_conflict_do_update/do_nothing on the active backend."""
+    table = getattr(model, '__table__', model)
+    return sqlite.insert(table) if is_sqlite() else postgresql.insert(table)
+
+
+def greatest(*values):
+    """Largest of several SQL values (SQLite spells GREATEST as a multi-argument MAX)."""
+    return db.func.max(*values) if is_sqlite() else db.func.greatest(*values)
+
+
+def json_set(document, path, value):
+    """Expression that replaces the value at `path` (a tuple of keys) inside a JSON column."""
+    if is_sqlite():
+        json_path = '$' + ''.join(f'."{key}"' for key in path)
+        return db.func.json_set(document, json_path, db.func.json(db.literal(json.dumps(value))),
+                                type_=JSONDocument)
+    return db.func.jsonb_set(document, db.literal(list(path), postgresql.ARRAY(db.Text)),
+                             db.literal(value, JSONB), type_=JSONB)
+
+
+def json_has_key(document, key):
+    """Condition that a JSON column has a top-level `key`."""
+    if is_sqlite():
+        return db.func.json_type(document, f'$."{key}"').is_not(None)
+    return db.cast(document, JSONB).has_key(key)
+
+
+# --- Connection pool ---
+class PoolStats:
+    """Counters for connection checkouts, shared by every instrumented pool in the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.overflow_events = 0
+            self.timeouts = 0
+            self.invalidations = 0
+
+    def record_checkout(self, wait, overflowed):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts,
+                'invalidated_connections': self.invalidations
+            }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited and when it had to overflow."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        overflow_before = self._overflow
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_timeout()
+            raise
+        overflowed = self._overflow > overflow_before and self._overflow > 0
+        pool_stats.record_checkout(time.perf_counter() - start, overflowed)
+        return connection
+
+
+@event.listens_for(InstrumentedQueuePool, 'invalidate')
+def _count_invalidation(dbapi_connection, connection_record, exception):
+    # Fired for dead connections caught by pre-ping or errors on use
+    pool_stats.record_invalidation()
+
+
+class SerializedStaticPool(StaticPool):
+    """
+    StaticPool that hands its one connection to one thread at a time.
+
+    The in-memory database lives in that single connection, so without this every
+    request thread shares one transaction and one request's commit or rollback
+    lands in another's work. Re-entrant: a thread already holding the connection
+    may check it out again.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._owner = threading.RLock()
+
+    @classmethod
+    def replacing(cls, pool):
+        """A serialized pool with the settings and event listeners of `pool` (as StaticPool.recreate copies them)."""
+        return cls(creator=pool._creator, recycle=pool._recycle, reset_on_return=pool._reset_on_return,
+                   pre_ping=pool._pre_ping, echo=pool.echo, logging_name=pool._orig_logging_name,
+                   _dispatch=pool.dispatch, dialect=pool._dialect)
+
+    def _do_get(self):
+        # Taken before the connection record is handed out, so a waiting thread can't claim it early
+        self._owner.acquire()
+        try:
+            return super()._do_get()
+        except BaseException:
+            self._owner.release()
+            raise
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._owner.release()
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(url):
+    """Pool settings, tunable through the environment."""
+    if url == MEMORY_URL:
+        # One shared connection, otherwise every checkout would get its own empty database
+        # (Flask-SQLAlchemy insists on a plain StaticPool here; init_db swaps in SerializedStaticPool)
+        return {'poolclass': StaticPool, 'connect_args': {'check_same_thread': False}}
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        # Recycle before the server/pooler drops idle connections
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        # Test connections on checkout so stale ones are replaced instead of failing a request
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', 'true')
+    }
+    if url.startswith('sqlite'):
+        # Pooled connections are handed between request threads
+        options['connect_args'] = {'check_same_thread': False}
+    return options
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers carry on while a request commits; wait for the write lock instead of failing
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.close()
+
+
+def get_pool_status():
+    """Current pool gauges plus cumulative checkout statistics."""
+    status = pool_stats.as_dict()
+    pool = db.engine.pool
+    if isinstance(pool, QueuePool):
+        status.update({
+            'pool_size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0)
+        })
+    return status
+
+
+def init_db(app):
+    url = database_url()
+    if not os.getenv('DATABASE_URL'):
+        print(f"DATABASE_URL not set, using local SQLite database {DEFAULT_SQLITE_PATH}")
 
     app.config['SQLALCHEMY_DATABASE_URI'] = url
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
     db.init_app(app)
 
+    replica_url = os.getenv('DATABASE_REPLICA_URL', '').strip()
+    if replica_url:
+        # Kept out of SQLALCHEMY_BINDS: the replica serves the same tables (see RoutingSession)
+        # and create_all/drop_all must never touch it
+        app.extensions[REPLICA_BIND] = create_engine(replica_url, **engine_options(replica_url))
+        print("Routing read-only requests to the database replica.")
+
     try:
         with app.app_context():
+            engines = [db.engine, app.extensions.get(REPLICA_BIND)]
+            if url == MEMORY_URL:
+                db.engine.pool = SerializedStaticPool.replacing(db.engine.pool)
+            for engine in engines:
+                if engine is not None and engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                    event.listen(engine, 'connect', _configure_sqlite)
             db.create_all()
             print("Database tables verified.")
     except Exception as e:
@@ -0,0 +1,84 @@
+"""
+Per-worker memo of the onboarding diagnostic set.
+
+/api/diagnostic/start hands every new student the same questions until the
+question bank or the answer stats change, so the set is built once and kept
+with the (domain version, stats version) it was built for.
+
+- A new domain version (questions added, edited or deleted) rebuilds it in
+  the request, so nobody is served a question that no longer exists.
+- New answer stats only shift calibration: the current set keeps being
+  served while a background thread rebuilds it, at most once every
+  DIAGNOSTIC_REFRESH_INTERVAL seconds.
+"""
+import os
+import threading
+import time
+from flask import current_app
+
+
+class DiagnosticCache:
+    def __init__(self, refresh_interval):
+        """Hold one diagnostic set, refreshing it in the background at most every refresh_interval seconds."""
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._entry = None          # (domain_version, stats_version, questions)
+        self._thread = None         # running background refresh, if any
+        self._refreshed_at = float('-inf')
+
+    def get(self, domain_version, stats_version, build):
+        """
+        Return the diagnostic set (shared: treat as read-only).
+
+        Args:
+            domain_version: version of the domain data the set must come from
+            stats_version: version of the answer stats it was calibrated with
+            build: callable returning a freshly built set (runs with an app context)
+        """
+        entry = self._entry
+        if entry is not None and entry[0] == domain_version:
+            if entry[1] != stats_version:
+                self._refresh_later(domain_version, stats_version, build)
+            return entry[2]
+        questions = build()
+        self._install(domain_version, stats_version, questions)
+        return questions
+
+    def _install(self, domain_version, stats_version, questions):
+        with self._lock:
+            # A slow background build must not replace a set built for newer versions
+            if self._entry is None or (domain_version, stats_version) >= self._entry[:2]:
+                self._entry = (domain_version, stats_version, questions)
+
+    def _refresh_later(self, domain_version, stats_version, build):
+        now = time.monotonic()
+        with self._lock:
+            if self._thread is not None or now - self._refreshed_at < self.refresh_interval:
+                return
+            self._refreshed_at = now
+            self._thread = threading.Thread(
+                target=self._refresh, args=(current_app._get_current_object(), domain_version, stats_version, build),
+                name='diagnostic-refresh', daemon=True)
+        self._thread.start()
+
+    def _refresh(self, app, domain_version, stats_version, build):
+        try:
+            with app.app_context():
+                questions = build()
+            self._install(domain_version, stats_version, questions)
+        except Exception as e:
+            print(f"Diagnostic set refresh failed, serving the previous one: {e}")
+        finally:
+            with self._lock:
+                self._thread = None
+
+
+# Singleton instance
+_diagnostic_cache_instance = None
+
+def get_diagnostic_cache() -> DiagnosticCache:
+    """Get or create the diagnostic set cache for this worker."""
+    global _diagnostic_cache_instance
+    if _diagnostic_cache_instance is None:
+        _diagnostic_cache_instance = DiagnosticCache(float(os.getenv('DIAGNOSTIC_REFRESH_INTERVAL', '5')))
+    return _diagnostic_cache_instance
@@ -0,0 +1,125 @@
+"""
+Per-worker cache of the domain data (skills, lessons).
+
+Every domain or question-bank write bumps a shared version counter in the same transaction.
+Workers serve reads from their in-memory snapshot and only re-check the
+counter every DOMAIN_CACHE_TTL seconds, reloading when it has moved.
+
+Questions are not part of the snapshot (question_index.py keeps them), so a
+question write committed by this worker only moves the snapshot to the new
+version instead of dropping it.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from database import db, upsert, use_primary, Domain, DomainVersion, Question
+from unit_of_work import current_unit_of_work, on_flush
+
+# version: shared counter value, data: domain dict (treat as read-only),
+# fingerprints: {category: fingerprint of the row as stored}
+DomainSnapshot = namedtuple('DomainSnapshot', ['version', 'data', 'fingerprints'])
+
+
+def read_domain_version():
+    """Return the shared domain version counter (0 if never bumped)."""
+    version = db.session.execute(
+        db.select(DomainVersion.version).where(DomainVersion.id == 1)
+    ).scalar()
+    return version or 0
+
+
+def bump_domain_version():
+    """Increment the shared version counter inside the current transaction; returns the new value."""
+    stmt = upsert(DomainVersion).values(id=1, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['id'],
+        set_={'version': DomainVersion.version + 1}
+    )
+    return db.session.execute(stmt.returning(DomainVersion.version)).scalar()
+
+
+class DomainCache:
+    def __init__(self, ttl_seconds):
+        """Cache one domain snapshot, re-validating it at most every ttl_seconds."""
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._generation = 0
+
+    def invalidate(self):
+        """Drop the cached snapshot so the next read reloads it."""
+        with self._lock:
+            self._snapshot = None
+            self._generation += 1
+
+    def advance(self, version):
+        """Move the snapshot to `version` after a local write that left its data unchanged."""
+        with self._lock:
+            snapshot = self._snapshot
+            self._generation += 1
+            # Only if nobody else wrote since it was loaded (see QuestionIndexCache.apply)
+            if snapshot is None or version is None or version <= 1 or snapshot.version != version - 1:
+                self._snapshot = None
+                return
+            self._snapshot = snapshot._replace(version=version)
+
+    def get(self, loader):
+        """
+        Return the current DomainSnapshot.
+
+        Args:
+            loader: callable returning (data, fingerprints) straight from the database
+        """
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < self.ttl:
+            return snapshot
+
+        generation = self._generation
+        # The snapshot is shared by every request in this worker, so never build it from a lagging replica
+        with use_primary():
+            version = read_domain_version()
+            if snapshot is not None and snapshot.version == version:
+                self._checked_at = now
+                return snapshot
+            data, fingerprints = loader()
+        snapshot = DomainSnapshot(version, data, fingerprints)
+        with self._lock:
+            # Don't install a snapshot that was loaded while a local write committed
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._checked_at = now
+        return snapshot
+
+
+# Singleton instance
+_domain_cache_instance = None
+
+def get_domain_cache() -> DomainCache:
+    """Get or create the domain cache for this worker."""
+    global _domain_cache_instance
+    if _domain_cache_instance is None:
+        _domain_cache_instance = DomainCache(float(os.getenv('DOMAIN_CACHE_TTL', '5')))
+    return _domain_cache_instance
+
+
+def _bump_for_flush():
+    # Noted so after_commit hooks know which version the write produced
+    current_unit_of_work().note_change(DomainVersion, bump_domain_version())
+
+
+def _follow_local_write():
+    uow = current_unit_of_work()
+    if uow.staged.get(Domain) or uow.executed.get(Domain):
+        get_domain_cache().invalidate()
+        return
+    versions = uow.changes.get(DomainVersion)
+    get_domain_cache().advance(versions[-1] if versions else None)
+
+
+# Any flushed write to the domain or question tables bumps the version; domain writes
+# drop our local copy, question-only writes just move it to the new version
+for _model in (Domain, Question):
+    on_flush(_model, before_commit=_bump_for_flush, after_commit=_follow_local_write)
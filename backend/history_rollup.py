@@ -0,0 +1,196 @@
+"""
+Compact old question history into daily per-skill rollups.
+
+Raw question_history rows are only read a page at a time for recent activity
+(get-question-history, get-session-summary); after HISTORY_RETENTION_DAYS they
+are only useful in aggregate. This job moves them out of the hot table:
+
+- each batch of old rows is written to a gzip'd JSON-lines file in
+  HISTORY_ARCHIVE_DIR (written to a temp file, fsync'd, then renamed) before
+  anything is deleted;
+- the same transaction then adds the batch to history_rollups (attempts,
+  correct, time spent and hints per student, day and skill) and deletes it.
+
+Archive files are named after the id range they hold, so a run interrupted
+between writing a file and committing its batch rewrites that same file on
+the next run (with the same batch size) instead of archiving the rows twice.
+Rollups of a student are deleted with the rest of their history; archive
+files are append-only and have to be pruned by whatever retention policy
+applies to them.
+
+    python history_rollup.py              # compact history older than HISTORY_RETENTION_DAYS
+    python history_rollup.py --days 30    # ... or older than 30 days
+    python history_rollup.py --dry-run    # only count the rows that would move
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from flask import Flask
+from database import db, database_url, upsert, HistoryRollup, QuestionHistory
+from question_history import history_record
+
+load_dotenv()
+
+BATCH_SIZE = int(os.getenv('HISTORY_ROLLUP_BATCH_SIZE', '5000'))
+RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '90'))
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'history_archive')
+ARCHIVE_PATTERN = 'history-*.jsonl.gz'
+
+ROLLUP_COUNTERS = ('attempts', 'correct', 'time_spent', 'hints_used')
+
+
+def archive_dir():
+    return os.getenv('HISTORY_ARCHIVE_DIR', DEFAULT_ARCHIVE_DIR)
+
+
+def rollup_rows(rows):
+    """Sum history rows into {(username, day, skill): counters} rollup rows."""
+    totals = {}
+    for row in rows:
+        # Part of the primary key, so rows without a skill roll up under ''
+        key = (row.username, row.timestamp.date(), row.skill or '')
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = {'username': key[0], 'day': key[1], 'skill': key[2],
+                                   'attempts': 0, 'correct': 0, 'time_spent': 0.0, 'hints_used': 0}
+        total['attempts'] += 1
+        total['correct'] += int(bool(row.is_correct))
+        total['time_spent'] += row.time_spent or 0
+        total['hints_used'] += row.hints_used or 0
+    return list(totals.values())
+
+
+def add_rollups(rows):
+    """Add counters onto existing rollup rows (a day can be compacted across several runs)."""
+    if not rows:
+        return
+    stmt = upsert(HistoryRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['username', 'day', 'skill'],
+        set_={column: getattr(HistoryRollup, column) + stmt.excluded[column] for column in ROLLUP_COUNTERS}
+    )
+    db.session.execute(stmt, rows)
+
+
+def write_archive(directory, rows):
+    """Durably write raw history rows to a gzip'd JSON-lines file; returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"history-{rows[0].id:012d}-{rows[-1].id:012d}.jsonl.gz")
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for row in rows:
+                record = {'id': row.id, 'username': row.username, **history_record(row)}
+                f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def iter_archive(directory=None):
+    """Yield every archived history record (with its username), oldest batch first."""
+    for path in sorted(glob.glob(os.path.join(directory or archive_dir(), ARCHIVE_PATTERN))):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def compact_history(days=RETENTION_DAYS, batch_size=BATCH_SIZE, directory=None, dry_run=False, now=None):
+    """
+    Archive and roll up every history row older than `days` days.
+
+    Returns:
+        (rows compacted, archive files written)
+    """
+    directory = directory or archive_dir()
+    cutoff = (now or datetime.now()) - timedelta(days=days)
+    old = QuestionHistory.timestamp < cutoff
+    if dry_run:
+        count = db.session.execute(db.select(db.func.count()).select_from(QuestionHistory).where(old)).scalar()
+        print(f"Would compact {count} history rows older than {cutoff:%Y-%m-%d %H:%M}")
+        return count, 0
+
+    compacted = files = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(QuestionHistory).where(old, QuestionHistory.id > last_id)
+            .order_by(QuestionHistory.id).limit(batch_size)
+        ).scalars().all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        write_archive(directory, rows)
+        add_rollups(rollup_rows(rows))
+        db.session.execute(db.delete(QuestionHistory).where(QuestionHistory.id.in_([row.id for row in rows])))
+        db.session.commit()
+        db.session.expunge_all()
+        compacted += len(rows)
+        files += 1
+    print(f"Compacted {compacted} history rows older than {cutoff:%Y-%m-%d %H:%M} into daily rollups "
+          f"({files} archive file(s) in {directory})")
+    return compacted, files
+
+
+def fetch_daily_history(username, since=None):
+    """
+    Per-day, per-skill totals for a student: compacted rollups plus the raw rows not compacted yet.
+
+    Args:
+        username: student to read
+        since: optional date; earlier days are left out
+
+    Returns:
+        [{'day': 'YYYY-MM-DD', 'skill', 'attempts', 'correct', 'time_spent', 'hints_used'}] sorted by day, skill
+    """
+    totals = {}
+
+    def add(day, skill, attempts, correct, time_spent, hints_used):
+        key = (str(day), skill or '')
+        total = totals.setdefault(key, {'day': key[0], 'skill': key[1],
+                                        'attempts': 0, 'correct': 0, 'time_spent': 0.0, 'hints_used': 0})
+        total['attempts'] += attempts or 0
+        total['correct'] += correct or 0
+        total['time_spent'] += time_spent or 0
+        total['hints_used'] += hints_used or 0
+
+    rollups = db.select(HistoryRollup.day, HistoryRollup.skill,
+                        *(getattr(HistoryRollup, column) for column in ROLLUP_COUNTERS)
+                        ).where(HistoryRollup.username == username)
+    day = db.func.date(QuestionHistory.timestamp)
+    recent = db.select(
+        day, QuestionHistory.skill, db.func.count(),
+        db.func.sum(db.case((QuestionHistory.is_correct, 1), else_=0)),
+        db.func.sum(QuestionHistory.time_spent), db.func.sum(QuestionHistory.hints_used)
+    ).where(QuestionHistory.username == username).group_by(day, QuestionHistory.skill)
+    if since is not None:
+        rollups = rollups.where(HistoryRollup.day >= since)
+        recent = recent.where(QuestionHistory.timestamp >= datetime.combine(since, datetime.min.time()))
+    for query in (rollups, recent):
+        for row in db.session.execute(query):
+            add(*row)
+
+    return [totals[key] for key in sorted(totals)]
+
+
+if __name__ == "__main__":
+    if os.getenv('DATABASE_URL', '').strip().lower() == 'memory':
+        print("ERROR: DATABASE_URL=memory is not persistent; point it at Postgres or a SQLite file")
+    else:
+        parser = argparse.ArgumentParser(description="Roll old question history up into daily per-skill totals")
+        parser.add_argument('--days', type=int, default=RETENTION_DAYS, help="keep raw history this many days")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="history rows per transaction")
+        parser.add_argument('--archive-dir', default=None, help="where raw rows are archived (HISTORY_ARCHIVE_DIR)")
+        parser.add_argument('--dry-run', action='store_true', help="only count the rows that would be compacted")
+        args = parser.parse_args()
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            compact_history(args.days, args.batch_size, args.archive_dir, args.dry_run)
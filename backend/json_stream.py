@@ -0,0 +1,151 @@
+"""
+Incremental reader for large top-level JSON objects.
+
+`{"alex": {...}, "sam": {...}, ...}` is read in fixed-size chunks and
+yielded one member at a time, so memory stays bounded by the largest single
+value instead of the whole file. A member holding one large array (the
+question bank in domain.json) can be yielded element by element instead.
+Each member or element comes with the byte offset just past it, which a
+caller can store and later pass back as `start` to resume.
+"""
+import codecs
+import json
+
+CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _Reader:
+    """Text buffer over a binary file that knows the byte offset of its first character."""
+
+    def __init__(self, f, offset, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.offset = offset  # byte offset of buffer[0]
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk; returns False once the file is exhausted."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buffer += self.decoder.decode(b'', final=True)
+            return False
+        self.buffer += self.decoder.decode(chunk)
+        return True
+
+    def consume(self):
+        """Drop everything before pos and return the byte offset of pos."""
+        self.offset += len(self.buffer[:self.pos].encode('utf-8'))
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        return self.offset
+
+    def peek(self):
+        """Next non-whitespace character (without consuming it), or '' at end of file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at byte {self.consume()}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next JSON value, reading more of the file until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number or literal cut off at the end of the buffer still decodes; make
+            # sure the value is followed by something before trusting it
+            if end < len(self.buffer) or self.eof:
+                self.pos = end
+                return value
+            self.fill()
+
+
+def _next_key(reader):
+    """After a member: the next member's key, or None once the object ends."""
+    if reader.peek() == '}':
+        return None
+    reader.expect(',')
+    return reader.value()
+
+
+def _rest_of_array(reader, key):
+    """After an array element: yield (key, element, next_offset) for the rest of the array."""
+    while True:
+        if reader.peek() == ']':
+            reader.pos += 1
+            return
+        reader.expect(',')
+        yield key, reader.value(), reader.consume()
+
+
+def iter_json_object(path, start=0, chunk_size=CHUNK_SIZE, stream=None):
+    """
+    Yield (key, value, next_offset) for each member of the top-level JSON object in `path`.
+
+    Args:
+        path: file holding a single JSON object
+        start: a next_offset from an earlier pass to resume right after what it was yielded with
+            (0 = beginning)
+        chunk_size: bytes read per chunk
+        stream: key of a member holding a large array; its elements are yielded one at a
+            time as (stream, element, next_offset) instead of the array as one value
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        reader = _Reader(f, start, chunk_size)
+        if start == 0:
+            if reader.peek() == '\ufeff':
+                reader.pos += 1
+            reader.expect('{')
+            key = None if reader.peek() == '}' else reader.value()
+        elif reader.peek() == ']':
+            # Resuming after the last element of the streamed array
+            reader.pos += 1
+            key = _next_key(reader)
+        elif reader.peek() == ',':
+            # Resuming after a member or after an element of the streamed array:
+            # only a member key is followed by ':'
+            reader.pos += 1
+            key = reader.value()
+            if reader.peek() != ':':
+                yield stream, key, reader.consume()
+                yield from _rest_of_array(reader, stream)
+                key = _next_key(reader)
+        else:
+            key = _next_key(reader)
+
+        while key is not None:
+            if not isinstance(key, str):
+                raise ValueError(f"Object keys must be strings (byte {reader.consume()})")
+            reader.expect(':')
+            if key == stream and reader.peek() == '[':
+                reader.pos += 1
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    yield key, reader.value(), reader.consume()
+                    yield from _rest_of_array(reader, key)
+            else:
+                yield key, reader.value(), reader.consume()
+            key = _next_key(reader)
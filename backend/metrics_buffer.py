@@ -0,0 +1,281 @@
+"""
+Optional write-behind buffer for per-answer profile updates (METRICS_WRITE_BEHIND=true).
+
+submit-answer and diagnostic/submit normally rewrite the student profile
+(mastery, metrics, badges) inside the request. In write-behind mode they
+instead queue an operation ("this answer happened") and return. Operations
+are:
+
+- appended to a local log segment (fsync'd) once the request's own writes
+  (the answer event among them) commit and before it returns, so a crash
+  loses nothing and a failed request queues nothing;
+- kept in memory, grouped per student, so reads in this worker can overlay
+  them on the stored profile;
+- flushed every METRICS_FLUSH_INTERVAL seconds, or as soon as
+  METRICS_FLUSH_SIZE students are waiting: one compare-and-swap profile write
+  per student, however many answers they queued, all in one transaction.
+
+The same transaction records the flushed log segments as applied, so a crash
+between commit and deleting the segment files never applies them twice. A
+worker that starts up replays segments left behind by dead workers (each live
+worker holds an exclusive lock on its own segment).
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so run a single worker there
+    fcntl = None
+
+from database import db, upsert, AnswerEvent, ProgressMarker
+from unit_of_work import current_unit_of_work, on_flush
+
+SEGMENT_PATTERN = 'metrics-*.jsonl'
+
+
+def _marker_name(segment_path):
+    return f"metrics:{os.path.basename(segment_path)}"[:200]
+
+
+class _Segment:
+    """One append-only log file, exclusively locked while this process owns it."""
+
+    def __init__(self, path, lock=True):
+        self.path = path
+        self.file = open(path, 'a+', encoding='utf-8')
+        self.entries = 0
+        if lock and fcntl is not None:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.file.close()
+                raise
+
+    def append(self, line, sync):
+        self.file.write(line + '\n')
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+        self.entries += 1
+
+    def read(self):
+        self.file.seek(0)
+        entries = []
+        for line in self.file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-write; the request never returned
+                break
+        return entries
+
+    def remove(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class MetricsWriteBehind:
+    def __init__(self, app, apply_ops, log_dir, flush_interval=2.0, flush_size=500, fsync=True):
+        """
+        Args:
+            app: Flask app, used for the flush thread's app context
+            apply_ops: callable(student_id, ops) that applies queued ops to the stored
+                profile within the current unit of work (compare-and-swap)
+            log_dir: directory for the durable log segments
+        """
+        self.app = app
+        self.apply_ops = apply_ops
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._pending = {}   # student_id -> [op, ...] in arrival order
+        self._sealed = []    # segments whose ops are pending but not yet committed
+        self._counter = 0
+
+        os.makedirs(log_dir, exist_ok=True)
+        self._segment = self._open_segment()
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name='metrics-write-behind', daemon=True)
+        self._thread.start()
+
+    # --- producer side ---
+    def append(self, student_id, op):
+        """Durably queue one operation for a student."""
+        line = json.dumps({'student_id': student_id, 'op': op}, default=str)
+        with self._lock:
+            self._segment.append(line, self.fsync)
+            self._queue(student_id, op)
+            waiting = len(self._pending)
+        if waiting >= self.flush_size:
+            self._wake.set()
+
+    def discard(self, student_id):
+        """Drop queued ops for a student whose profile was reset or deleted."""
+        self.append(student_id, {'type': 'discard'})
+
+    def pending_ops(self, student_id):
+        with self._lock:
+            return list(self._pending.get(student_id, ()))
+
+    def _queue(self, student_id, op):
+        if op.get('type') == 'discard':
+            self._pending.pop(student_id, None)
+        else:
+            self._pending.setdefault(student_id, []).append(op)
+
+    # --- flushing ---
+    def flush(self):
+        """Write every queued op to the database; returns how many students were updated."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending and not self._sealed and not self._segment.entries:
+                    return 0
+                batch, self._pending = self._pending, {}
+                segments = self._sealed + [self._segment]
+                self._sealed = []
+                self._segment = self._open_segment()
+
+            try:
+                with self.app.app_context():
+                    for student_id, ops in batch.items():
+                        self.apply_ops(student_id, ops)
+                    for segment in segments:
+                        stmt = upsert(ProgressMarker).values(name=_marker_name(segment.path), value=1)
+                        db.session.execute(stmt.on_conflict_do_nothing(index_elements=['name']))
+                    current_unit_of_work().flush()
+                    db.session.commit()
+            except Exception as e:
+                print(f"Metrics flush failed, will retry: {e}")
+                with self._lock:
+                    # Older ops go back in front of anything queued meanwhile
+                    for student_id, ops in batch.items():
+                        self._pending[student_id] = ops + self._pending.get(student_id, [])
+                    self._sealed = segments + self._sealed
+                return 0
+
+            self._forget(segments)
+            return len(batch)
+
+    def _forget(self, segments):
+        """Delete applied segment files, then their markers."""
+        for segment in segments:
+            segment.remove()
+        try:
+            with self.app.app_context():
+                db.session.execute(db.delete(ProgressMarker).where(
+                    ProgressMarker.name.in_([_marker_name(s.path) for s in segments])))
+                db.session.commit()
+        except Exception as e:
+            # Harmless leftovers: markers only matter while their segment file exists
+            print(f"Could not clear metrics log markers: {e}")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopped:
+                return  # close() does the final flush
+            self.flush()
+
+    def close(self):
+        """Stop the flush thread after a final flush."""
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    # --- log segments ---
+    def _open_segment(self):
+        self._counter += 1
+        name = f"metrics-{os.getpid()}-{int(time.time() * 1000)}-{self._counter}.jsonl"
+        return _Segment(os.path.join(self.log_dir, name))
+
+    def _recover(self):
+        """Take over segments left by workers that died before flushing them."""
+        own = {self._segment.path}
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.log_dir, SEGMENT_PATTERN))):
+            if path in own:
+                continue
+            try:
+                segment = _Segment(path)
+            except OSError:
+                continue  # a live worker owns it
+            with self.app.app_context():
+                applied = db.session.execute(
+                    db.select(ProgressMarker.name).where(ProgressMarker.name == _marker_name(path))
+                ).scalar() is not None
+            if applied:
+                # Committed, but the worker died before deleting the file
+                self._forget([segment])
+                continue
+            for entry in segment.read():
+                self._queue(entry['student_id'], entry['op'])
+                recovered += 1
+            self._sealed.append(segment)
+        if recovered:
+            print(f"Replaying {recovered} queued metrics update(s) from the write-behind log")
+
+
+# Singleton instance
+_metrics_buffer_instance = None
+
+def init_metrics_buffer(app, apply_ops):
+    """Start the write-behind buffer if METRICS_WRITE_BEHIND is enabled; returns it or None."""
+    global _metrics_buffer_instance
+    if os.getenv('METRICS_WRITE_BEHIND', 'false').strip().lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+    if _metrics_buffer_instance is None:
+        default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'metrics_log')
+        _metrics_buffer_instance = MetricsWriteBehind(
+            app,
+            apply_ops,
+            log_dir=os.getenv('METRICS_LOG_DIR', default_dir),
+            flush_interval=float(os.getenv('METRICS_FLUSH_INTERVAL', '2')),
+            flush_size=int(os.getenv('METRICS_FLUSH_SIZE', '500')),
+            fsync=os.getenv('METRICS_LOG_FSYNC', 'true').strip().lower() in ('1', 'true', 'yes', 'on')
+        )
+        atexit.register(_metrics_buffer_instance.close)
+        print("Metrics write-behind enabled.")
+    return _metrics_buffer_instance
+
+def get_metrics_buffer():
+    """The running write-behind buffer, or None when updates are written synchronously."""
+    return _metrics_buffer_instance
+
+
+def append_after_commit(student_id, event):
+    """
+    Queue an answer event once the request's writes commit.
+
+    The event is recorded in answer_events by the same request, so it is appended to
+    the buffer only if that batch commits: a failed request queues nothing.
+    """
+    current_unit_of_work().note_change(AnswerEvent, (student_id, event))
+
+
+def _append_committed_events():
+    buffer = get_metrics_buffer()
+    if buffer is None:
+        return
+    for student_id, event in current_unit_of_work().changes.get(AnswerEvent, []):
+        buffer.append(student_id, event)
+
+
+on_flush(AnswerEvent, after_commit=_append_committed_events)
@@ -1,63 +1,366 @@
-import json
+import argparse
 import os
+import time
 from dotenv import load_dotenv
 from flask import Flask
-from database import db, Student, Domain, init_db
+from sqlalchemy.schema import CreateIndex
+from answer_events import event_row
+from database import (db, database_url, json_has_key, split_student, upsert, AnswerEvent, Student, StudentProfile,
+                      Domain, HistoryRollup, ProgressMarker, Question, QuestionStat, QuestionHistory, STUDENT_INDEXES)
+from domain_cache import bump_domain_version
+from json_stream import iter_json_object
+from projections import snapshot_event
+from question_bank import question_row, sync_question_id_sequence
+from question_history import history_row
 
 load_dotenv()
 
 app = Flask(__name__)
-# Temporary URI if not set, but will fail if not using real one
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
 db.init_app(app)
 
-def read_json_file(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return None
+# Rows written per transaction; each committed batch also records how far into the file it got
+BATCH_SIZE = int(os.getenv('MIGRATE_BATCH_SIZE', '1000'))
 
-def migrate():
+def upsert_questions(questions):
+    """Insert or replace questions in the indexed questions table."""
+    if not questions:
+        return
+    stmt = upsert(Question)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['id'],
+        set_={column: stmt.excluded[column] for column in ('skill', 'level', 'lesson', 'data')}
+    )
+    db.session.execute(stmt, [question_row(q) for q in questions])
+
+def upsert_question_stats(question_stats):
+    """Load {question_id: {attempts, correct, incorrect}} into the question_stats table."""
+    rows = [
+        {
+            'question_id': int(question_id),
+            'attempts': stats.get('attempts', 0),
+            'correct': stats.get('correct', 0),
+            'incorrect': stats.get('incorrect', 0)
+        }
+        for question_id, stats in question_stats.items()
+        if str(question_id).isdigit()
+    ]
+    if not rows:
+        return
+    stmt = upsert(QuestionStat)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['question_id'],
+        set_={column: stmt.excluded[column] for column in ('attempts', 'correct', 'incorrect')}
+    )
+    db.session.execute(stmt, rows)
+
+def add_student_version_column():
+    """Tables created before optimistic locking lack students.version; add it in place."""
+    columns = {column['name'] for column in db.inspect(db.engine).get_columns('students')}
+    if 'version' not in columns:
+        print("Adding students.version...")
+        db.session.execute(db.text("ALTER TABLE students ADD COLUMN version BIGINT NOT NULL DEFAULT 0"))
+        db.session.commit()
+
+def add_student_indexes():
+    """create_all() only indexes new tables; add indexes introduced since to existing student tables."""
+    # Superseded by the per-table indexes once role moved to student_profiles
+    db.session.execute(db.text("DROP INDEX IF EXISTS ix_students_role_level_username"))
+    # IF NOT EXISTS rather than checkfirst: SQLite doesn't reflect expression indexes, so
+    # checkfirst misses the ones create_all() just made and the CREATE fails
+    for index in STUDENT_INDEXES:
+        db.session.execute(CreateIndex(index, if_not_exists=True))
+    db.session.commit()
+
+def upsert_student_profiles(rows):
+    """Insert or replace [{username, data}] cold records."""
+    stmt = upsert(StudentProfile)
+    stmt = stmt.on_conflict_do_update(index_elements=['username'], set_={'data': stmt.excluded.data})
+    db.session.execute(stmt, rows)
+
+def migrate_question_stats_blob():
+    """Move a legacy `question_stats` JSONB blob from the domain table into its own table."""
+    legacy = db.session.get(Domain, 'question_stats')
+    if legacy is None:
+        return
+    print(f"Moving stats for {len(legacy.data or {})} questions into the question_stats table...")
+    upsert_question_stats(legacy.data or {})
+    db.session.delete(legacy)
+    db.session.commit()
+
+def migrate_questions_blob():
+    """Move a legacy `questions` JSONB blob from the domain table into the questions table."""
+    legacy = db.session.get(Domain, 'questions')
+    if legacy is None:
+        return
+    questions = legacy.data or []
+    print(f"Moving {len(questions)} questions from the domain blob into the questions table...")
+    upsert_questions(questions)
+    db.session.delete(legacy)
+    db.session.commit()
+
+def split_question_history(username, data):
+    """Strip the embedded question_history list from a profile and return it as history rows."""
+    history = data.pop('question_history', None) or []
+    return [history_row(username, record) for record in history]
+
+def insert_new_history(history):
+    """
+    Insert history rows, skipping students that already have history (rows or rollups),
+    so running the migration again never adds a student's embedded history twice.
+    """
+    usernames = {row['username'] for row in history}
+    if not usernames:
+        return 0
+    existing = set(db.session.execute(
+        db.select(QuestionHistory.username).where(QuestionHistory.username.in_(usernames))
+        .union(db.select(HistoryRollup.username).where(HistoryRollup.username.in_(usernames)))
+    ).scalars())
+    rows = [row for row in history if row['username'] not in existing]
+    if rows:
+        db.session.execute(db.insert(QuestionHistory), rows)
+    return len(rows)
+
+def migrate_profile_history():
+    """Move question_history out of every stored profile into the question_history table."""
+    moved = 0
+    usernames = db.session.execute(
+        db.select(Student.username).where(json_has_key(Student.data, 'question_history'))
+    ).scalars().all()
+    for username in usernames:
+        student = db.session.get(Student, username)
+        data = dict(student.data)
+        moved += insert_new_history(split_question_history(username, data))
+        student.data = data
+        student.version = Student.version + 1
+        db.session.commit()
+    if usernames:
+        print(f"Moved {moved} history records out of {len(usernames)} profiles.")
+
+def split_student_documents(batch_size=BATCH_SIZE):
+    """
+    Move the cold fields (password hash, role, name, email, language prefs, ...) of profiles
+    stored as one document out of students.data into student_profiles.
+    """
+    moved = 0
+    last = ''
+    while True:
+        rows = db.session.execute(
+            db.select(Student.username, Student.data, Student.version)
+            .where(Student.username > last).order_by(Student.username).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last = rows[-1].username
+        profiles = []
+        for username, data, version in rows:
+            hot, cold = split_student(data or {})
+            if not cold:
+                continue
+            # Compare-and-swap like a request would, so a concurrent answer is never overwritten
+            swapped = db.session.execute(
+                db.update(Student).where(Student.username == username, Student.version == version)
+                .values(data=hot, version=version + 1)
+            ).rowcount
+            if swapped:
+                profiles.append({'username': username, 'data': cold})
+            else:
+                print(f"  {username} changed during the split; run the migration again to finish it")
+        if profiles:
+            upsert_student_profiles(profiles)
+        db.session.commit()
+        moved += len(profiles)
+    if moved:
+        print(f"Moved the cold profile fields of {moved} students into student_profiles.")
+
+def snapshot_student_projections(batch_size=BATCH_SIZE):
+    """
+    Start the answer event log of every student that has none with a snapshot of
+    their current mastery/metrics/badges, so replaying the log keeps pre-log progress.
+    """
+    has_events = db.select(AnswerEvent.id).where(AnswerEvent.username == Student.username).exists()
+    snapshotted = 0
+    last = ''
+    while True:
+        rows = db.session.execute(
+            db.select(Student.username, Student.data)
+            .where(Student.username > last, ~has_events)
+            .order_by(Student.username).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(db.insert(AnswerEvent),
+                           [event_row(username, snapshot_event(data or {})) for username, data in rows])
+        db.session.commit()
+        snapshotted += len(rows)
+        last = rows[-1].username
+    if snapshotted:
+        print(f"Snapshotted progress of {snapshotted} students into the answer event log.")
+
+# --- Resumable import checkpoints ---
+# Stored as named rows in progress_markers (value = byte offset reached in the file), written in
+# the same transaction as the batch they follow, so a resumed import never repeats a batch.
+def checkpoint_name(file_path):
+    """Checkpoint key for this exact version of the file; editing the file starts over."""
+    stat = os.stat(file_path)
+    return f"import:{stat.st_size}:{int(stat.st_mtime)}:{os.path.basename(file_path)}"[:200]
+
+def load_checkpoint(name):
+    return db.session.execute(
+        db.select(ProgressMarker.value).where(ProgressMarker.name == name)
+    ).scalar() or 0
+
+def save_checkpoint(name, offset):
+    stmt = upsert(ProgressMarker).values(name=name, value=offset)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['name'], set_={'value': offset}))
+
+def clear_checkpoint(name):
+    db.session.execute(db.delete(ProgressMarker).where(ProgressMarker.name == name))
+
+class ImportProgress:
+    """Prints records imported, position in the file and throughput after each batch."""
+
+    def __init__(self, label, file_path, start_offset):
+        self.label = label
+        self.total_bytes = os.path.getsize(file_path) or 1
+        self.records = 0
+        self.started = time.perf_counter()
+        if start_offset:
+            print(f"Resuming {label} at byte {start_offset:,} ({start_offset / self.total_bytes:.0%})")
+
+    def report(self, records, offset):
+        self.records += records
+        elapsed = time.perf_counter() - self.started
+        rate = self.records / elapsed if elapsed else 0
+        print(f"  {self.label}: {self.records:,} imported, {offset / self.total_bytes:6.1%} of file, {rate:,.0f}/s")
+
+    def finish(self):
+        print(f"Imported {self.records:,} {self.label} in {time.perf_counter() - self.started:.1f}s")
+
+def write_student_batch(batch, checkpoint, offset):
+    """Upsert one batch of {username: profile} plus their history rows, and advance the checkpoint."""
+    history = []
+    rows = []
+    profiles = []
+    for username, data in batch.items():
+        history.extend(split_question_history(username, data))
+        hot, cold = split_student(data)
+        rows.append({'username': username, 'data': hot})
+        profiles.append({'username': username, 'data': cold})
+    stmt = upsert(Student)
+    # Bump the version so a request holding the old profile can't write it back
+    stmt = stmt.on_conflict_do_update(index_elements=['username'],
+                                      set_={'data': stmt.excluded.data, 'version': Student.version + 1})
+    db.session.execute(stmt, rows)
+    upsert_student_profiles(profiles)
+    # The checkpoint only covers an interrupted run; a second full run must not re-add history either
+    insert_new_history(history)
+    save_checkpoint(checkpoint, offset)
+    db.session.commit()
+
+def import_students(file_path, batch_size=BATCH_SIZE, restart=False):
+    """Stream a {username: profile} file into the students table in batched upserts."""
+    checkpoint = checkpoint_name(file_path)
+    start = 0 if restart else load_checkpoint(checkpoint)
+    progress = ImportProgress('students', file_path, start)
+
+    # Keyed by username so a repeated key keeps the last profile, like json.load did
+    batch = {}
+    offset = start
+    for username, data, offset in iter_json_object(file_path, start):
+        batch[username] = data
+        if len(batch) >= batch_size:
+            write_student_batch(batch, checkpoint, offset)
+            progress.report(len(batch), offset)
+            batch = {}
+    if batch:
+        write_student_batch(batch, checkpoint, offset)
+        progress.report(len(batch), offset)
+
+    clear_checkpoint(checkpoint)
+    db.session.commit()
+    progress.finish()
+
+def write_question_batch(questions, checkpoint, offset):
+    """Upsert one batch of questions and advance the checkpoint to just past the last of them."""
+    upsert_questions(questions)
+    save_checkpoint(checkpoint, offset)
+    db.session.commit()
+
+def import_domain(file_path, batch_size=BATCH_SIZE, restart=False):
+    """Stream domain.json category by category, and the question bank question by question."""
+    checkpoint = checkpoint_name(file_path)
+    start = 0 if restart else load_checkpoint(checkpoint)
+    progress = ImportProgress('domain entries', file_path, start)
+
+    questions = []
+    questions_offset = start
+    for category, data, offset in iter_json_object(file_path, start, stream='questions'):
+        if category == 'questions':
+            questions.append(data)
+            questions_offset = offset
+            if len(questions) >= batch_size:
+                write_question_batch(questions, checkpoint, offset)
+                progress.report(len(questions), offset)
+                questions = []
+            continue
+        if questions:
+            write_question_batch(questions, checkpoint, questions_offset)
+            progress.report(len(questions), questions_offset)
+            questions = []
+        if category == 'question_stats':
+            upsert_question_stats(data)
+        else:
+            stmt = upsert(Domain).values(category=category, data=data)
+            db.session.execute(stmt.on_conflict_do_update(index_elements=['category'], set_={'data': stmt.excluded.data}))
+        save_checkpoint(checkpoint, offset)
+        db.session.commit()
+        progress.report(1, offset)
+    if questions:
+        write_question_batch(questions, checkpoint, questions_offset)
+        progress.report(len(questions), questions_offset)
+
+    clear_checkpoint(checkpoint)
+    db.session.commit()
+    progress.finish()
+
+def migrate(batch_size=BATCH_SIZE, restart=False):
     with app.app_context():
         print("Creating tables...")
         db.create_all()
+        add_student_version_column()
+        add_student_indexes()
 
         # Migrate Students
         student_file = 'data/student.json'
         if os.path.exists(student_file):
             print("Migrating students...")
-            students = read_json_file(student_file)
-            if students:
-                for username, data in students.items():
-                    existing = Student.query.get(username)
-                    if not existing:
-                        db.session.add(Student(username=username, data=data))
-                    else:
-                        existing.data = data
-                db.session.commit()
-                print(f"Migrated {len(students)} students.")
+            import_students(student_file, batch_size, restart)
 
         # Migrate Domain Data
         domain_file = 'data/domain.json'
         if os.path.exists(domain_file):
             print("Migrating domain data...")
-            domain_data = read_json_file(domain_file)
-            if domain_data:
-                for category, data in domain_data.items():
-                    existing = Domain.query.get(category)
-                    if not existing:
-                        db.session.add(Domain(category=category, data=data))
-                    else:
-                        existing.data = data
-                db.session.commit()
-                print("Migrated domain data (questions, lessons, skills, stats).")
+            import_domain(domain_file, batch_size, restart)
+
+        migrate_questions_blob()
+        migrate_question_stats_blob()
+        migrate_profile_history()
+        split_student_documents(batch_size)
+        snapshot_student_projections(batch_size)
+        sync_question_id_sequence()
+        # Running workers cache the domain; make them reload it
+        bump_domain_version()
+        db.session.commit()
 
         print("Migration complete!")
 
 if __name__ == "__main__":
-    if not os.getenv('DATABASE_URL'):
-        print("ERROR: DATABASE_URL not found in .env")
+    if os.getenv('DATABASE_URL', '').strip().lower() == 'memory':
+        print("ERROR: DATABASE_URL=memory is not persistent; point it at Postgres or a SQLite file")
     else:
-        migrate()
+        parser = argparse.ArgumentParser(description="Import data/student.json and data/domain.json")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="rows per transaction")
+        parser.add_argument('--restart', action='store_true', help="ignore saved checkpoints and import from the start")
+        args = parser.parse_args()
+        migrate(args.batch_size, args.restart)
@@ -0,0 +1,295 @@
+"""
+Profile projections of the answer event log.
+
+Every answer, diagnostic, progress reset and added skill is recorded as an
+immutable event (see answer_events.py). The `mastery`, `metrics`, `badges` and
+`diagnostic_complete` fields of a profile are projections of that log: each
+request folds its new event into the stored profile with `apply_event`, and
+replay_events.py rebuilds them for every student from the full log, e.g. after
+the mastery rules below change.
+
+Nothing here may depend on anything but the profile and the event (events carry
+their own timestamp), so a replay reproduces exactly what the live requests
+computed.
+"""
+import copy
+from datetime import datetime
+from question_history import TIMESTAMP_FORMAT
+
+# Profile fields derived from the event log
+PROJECTED_FIELDS = ('mastery', 'metrics', 'badges', 'diagnostic_complete')
+
+# Mastery rules
+CORRECT_STEP = 0.25
+INCORRECT_STEP = 0.1
+DIAGNOSTIC_FLOOR = 0.3
+DIAGNOSTIC_TIME_SPENT = 5
+
+# Badges earned by answering
+SPEED_DEMON_SECONDS = 15
+FIRST_LESSON_BADGE = {
+    'id': 'first_lesson',
+    'name': 'First Steps',
+    'description': 'Completed your first lesson!',
+    'icon': '🌟'
+}
+SPEED_DEMON_BADGE = {
+    'id': 'speed_demon',
+    'name': 'Speed Demon',
+    'description': 'Average answer time under 15 seconds!',
+    'icon': '⚡'
+}
+
+
+def skill_master_badge(skill):
+    skill_name = skill.replace('_', ' ').title()
+    return {
+        'id': f"{skill}_master",
+        'name': f'{skill_name} Master',
+        'description': f'Mastered all {skill_name} skills!',
+        'icon': '🏆'
+    }
+
+
+def clamp(value, min_value=0.0, max_value=1.0):
+    """Clamp a value between min_value and max_value."""
+    return max(min_value, min(max_value, value))
+
+
+def update_metrics(student_data, student_id, question_id, skill, is_correct, time_spent, hints_used=0, lesson=None, at=None):
+    """Update student metrics after answering a question; returns the history record to append."""
+    student = student_data[student_id]
+    at = at or datetime.now()
+
+    if 'metrics' not in student:
+        student['metrics'] = {
+            'total_questions_answered': 0,
+            'correct_answers': 0,
+            'incorrect_answers': 0,
+            'average_time_per_question': 0,
+            'skill_performance': {}
+        }
+
+    # Detailed question record
+    question_record = {
+        'question_id': question_id,
+        'skill': skill,
+        'lesson': lesson,
+        'is_correct': is_correct,
+        'time_spent': round(time_spent, 1),
+        'hints_used': hints_used,
+        'timestamp': at.strftime(TIMESTAMP_FORMAT),
+        'session_id': student['metrics']['total_questions_answered'] + 1
+    }
+
+    metrics = student['metrics']
+
+    # Update overall metrics
+    metrics['total_questions_answered'] += 1
+    if is_correct:
+        metrics['correct_answers'] += 1
+    else:
+        metrics['incorrect_answers'] += 1
+
+    # Update average time
+    total_time = metrics['average_time_per_question'] * (metrics['total_questions_answered'] - 1) + time_spent
+    metrics['average_time_per_question'] = total_time / metrics['total_questions_answered']
+
+    # Update skill-specific metrics
+    if skill not in metrics['skill_performance']:
+        metrics['skill_performance'][skill] = {
+            'questions_answered': 0,
+            'correct': 0,
+            'incorrect': 0,
+            'average_time': 0,
+            'struggling_areas': []
+        }
+
+    skill_metrics = metrics['skill_performance'][skill]
+    skill_metrics['questions_answered'] += 1
+    if is_correct:
+        skill_metrics['correct'] += 1
+    else:
+        skill_metrics['incorrect'] += 1
+
+    # Update skill average time
+    total_skill_time = skill_metrics['average_time'] * (skill_metrics['questions_answered'] - 1) + time_spent
+    skill_metrics['average_time'] = total_skill_time / skill_metrics['questions_answered']
+
+    # History is stored in its own append-only table
+    return question_record
+
+def check_badge_eligibility(student_data, student_id, at=None):
+    """Check if student earned any new badges."""
+    student = student_data[student_id]
+    earned_date = (at or datetime.now()).strftime('%Y-%m-%d')
+    current_badges = [badge['id'] for badge in student.get('badges', [])]
+    new_badges = []
+
+    metrics = student.get('metrics', {})
+    mastery = student.get('mastery', {})
+
+    # First lesson badge
+    if 'first_lesson' not in current_badges and metrics.get('total_questions_answered', 0) >= 1:
+        new_badges.append({**FIRST_LESSON_BADGE, 'earned_date': earned_date})
+
+    # Speed demon badge
+    if 'speed_demon' not in current_badges and metrics.get('average_time_per_question', 0) < SPEED_DEMON_SECONDS:
+        new_badges.append({**SPEED_DEMON_BADGE, 'earned_date': earned_date})
+
+    # Skill mastery badges
+    for skill, score in mastery.items():
+        badge = skill_master_badge(skill)
+        if badge['id'] not in current_badges and score >= 1.0:
+            new_badges.append({**badge, 'earned_date': earned_date})
+
+    # Add new badges to student
+    if new_badges:
+        if 'badges' not in student:
+            student['badges'] = []
+        student['badges'].extend(new_badges)
+
+    return new_badges
+
+def apply_answer(student, student_id, skill, is_correct, time_spent, hints_used=0, question_id=None, lesson=None, at=None):
+    """Apply one answer to a profile (mastery, metrics, badges); returns (history record, new badges)."""
+    student_data = {student_id: student}
+
+    # Update mastery: +0.25 if correct, -0.1 if wrong
+    if is_correct:
+        new_score = student['mastery'][skill] + CORRECT_STEP
+    else:
+        new_score = student['mastery'][skill] - INCORRECT_STEP
+
+    student['mastery'][skill] = max(0.0, min(1.0, new_score))
+
+    # Update metrics with hints used
+    record = update_metrics(student_data, student_id, question_id, skill, is_correct, time_spent, hints_used, lesson, at)
+
+    # Check for new badges
+    new_badges = check_badge_eligibility(student_data, student_id, at)
+    return record, new_badges
+
+def apply_diagnostic(student, student_id, responses, at=None):
+    """Apply diagnostic responses to a profile; returns (mastery updates, history records)."""
+    student_data = {student_id: student}
+    mastery_updates = {}
+    skill_summary = {}
+    history = []
+
+    # Aggregate response accuracy per skill
+    for entry in responses:
+        skill = entry.get('skill')
+        is_correct = entry.get('is_correct', False)
+        question_id = entry.get('question_id')
+        lesson = entry.get('lesson')
+
+        if not skill:
+            continue
+
+        summary = skill_summary.setdefault(skill, {'attempts': 0, 'correct': 0})
+        summary['attempts'] += 1
+        if is_correct:
+            summary['correct'] += 1
+
+        # Log to metrics for transparency/history
+        history.append(update_metrics(student_data, student_id, question_id, skill, is_correct,
+                                      time_spent=DIAGNOSTIC_TIME_SPENT, hints_used=0, lesson=lesson, at=at))
+
+    # Derive mastery adjustments
+    for skill, summary in skill_summary.items():
+        ratio = summary['correct'] / summary['attempts'] if summary['attempts'] else 0
+        mastery_score = clamp(DIAGNOSTIC_FLOOR + (1 - DIAGNOSTIC_FLOOR) * ratio)
+        student['mastery'][skill] = mastery_score
+        mastery_updates[skill] = mastery_score
+
+    # Mark diagnostic as complete
+    student['diagnostic_complete'] = True
+    return mastery_updates, history
+
+
+def base_projection(skills):
+    """Projected fields of a profile before any event: every skill at zero mastery."""
+    return {
+        "mastery": {skill: 0.0 for skill in skills},
+        "metrics": {
+            "total_questions_answered": 0,
+            "correct_answers": 0,
+            "incorrect_answers": 0,
+            "average_time_per_question": 0,
+            "skill_performance": {}
+        },
+        "badges": [],
+        "diagnostic_complete": False
+    }
+
+
+# --- Events ---
+# Plain JSON-able dicts with a 'type' and a 'timestamp'; the rest is the payload.
+def _event(event_type, at, **payload):
+    return {'type': event_type, 'timestamp': (at or datetime.now()).strftime(TIMESTAMP_FORMAT), **payload}
+
+
+def answer_event(skill, is_correct, time_spent, hints_used=0, question_id=None, lesson=None, at=None):
+    return _event('answer', at, skill=skill, is_correct=bool(is_correct), time_spent=time_spent,
+                  hints_used=hints_used, question_id=question_id, lesson=lesson)
+
+
+def diagnostic_event(responses, at=None):
+    return _event('diagnostic', at, responses=[
+        {key: entry.get(key) for key in ('skill', 'is_correct', 'question_id', 'lesson')} for entry in responses
+    ])
+
+
+def reset_event(skills, at=None):
+    """Progress was reset (or the profile re-created) with these skills."""
+    return _event('reset', at, skills=list(skills))
+
+
+def skill_added_event(skill, at=None):
+    """An admin added a skill; every profile gets an empty slot for it."""
+    return _event('skill_added', at, skill=skill)
+
+
+def snapshot_event(profile, at=None):
+    """Projected state carried over from before the event log existed."""
+    return _event('snapshot', at, **{field: copy.deepcopy(profile.get(field)) for field in PROJECTED_FIELDS})
+
+
+def apply_event(student, student_id, event):
+    """Fold one event into a profile's projected fields; returns what the event's apply_* returned."""
+    at = datetime.strptime(event['timestamp'], TIMESTAMP_FORMAT)
+    event_type = event['type']
+    if event_type == 'answer':
+        return apply_answer(student, student_id, event['skill'], event['is_correct'], event['time_spent'],
+                            event['hints_used'], event['question_id'], event['lesson'], at)
+    if event_type == 'diagnostic':
+        return apply_diagnostic(student, student_id, event['responses'], at)
+    if event_type == 'reset':
+        student.update(base_projection(event['skills']))
+        return None
+    if event_type == 'skill_added':
+        skill = event['skill']
+        student.setdefault('mastery', {}).setdefault(skill, 0.0)
+        student.setdefault('metrics', {}).setdefault('skill_performance', {}).setdefault(skill, {
+            'questions_answered': 0,
+            'correct': 0,
+            'incorrect': 0,
+            'average_time': 0,
+            'struggling_areas': []
+        })
+        return None
+    if event_type == 'snapshot':
+        base = base_projection(())
+        student.update({field: copy.deepcopy(event[field]) if event.get(field) is not None else base[field]
+                        for field in PROJECTED_FIELDS})
+        return None
+    raise ValueError(f"Unknown event type: {event_type!r}")
+
+
+def rebuild_projection(skills, events):
+    """Reference replay: fold a student's events, oldest first, over a fresh projection."""
+    projection = base_projection(skills)
+    for event in events:
+        apply_event(projection, None, event)
+    return projection
@@ -0,0 +1,118 @@
+"""
+Question bank backed by the indexed `questions` table.
+
+Each question is one row, so adding, editing or deleting a question touches
+only that row. Selection by skill/level/lesson is served from the per-worker
+index in question_index.py, which is built from load_questions().
+"""
+from database import db, greatest, upsert, IdSequence, Question
+from unit_of_work import current_unit_of_work, execute_write
+
+QUESTION_ID_SEQUENCE = 'questions'
+
+
+def question_row(question):
+    """Map a question dict onto the columns of the questions table."""
+    return {
+        'id': question['id'],
+        'skill': question['skill'],
+        'level': question.get('level', 1),
+        'lesson': question.get('lesson'),
+        'data': question
+    }
+
+
+def load_questions():
+    """Return every question, ordered by id."""
+    rows = db.session.execute(db.select(Question.data).order_by(Question.id)).scalars()
+    return list(rows)
+
+
+def get_question_by_id(question_id):
+    """Return a single question dict, or None."""
+    return db.session.execute(
+        db.select(Question.data).where(Question.id == question_id)
+    ).scalar()
+
+
+def allocate_question_ids(count=1):
+    """
+    Reserve a contiguous block of question ids and return the first one.
+
+    The block comes from the 'questions' row of id_sequences, bumped with one
+    atomic UPDATE ... RETURNING on its own short transaction, so concurrent
+    workers never hand out the same id. Like a database sequence, ids from a
+    request that later fails are simply skipped.
+    """
+    with db.engine.begin() as conn:
+        conn.execute(
+            upsert(IdSequence)
+            .from_select(['name', 'next_value'],
+                         # WHERE keeps SQLite from reading ON CONFLICT as part of the SELECT
+                         db.select(db.literal(QUESTION_ID_SEQUENCE), db.func.coalesce(db.func.max(Question.id), 0) + 1)
+                         .where(db.true()))
+            .on_conflict_do_nothing(index_elements=['name'])
+        )
+        next_value = conn.execute(
+            db.update(IdSequence)
+            .where(IdSequence.name == QUESTION_ID_SEQUENCE)
+            .values(next_value=IdSequence.next_value + count)
+            .returning(IdSequence.next_value)
+        ).scalar()
+    return next_value - count
+
+
+def sync_question_id_sequence():
+    """Move the id sequence past any ids inserted explicitly (e.g. by migrate.py)."""
+    max_id = db.session.execute(db.select(db.func.max(Question.id))).scalar() or 0
+    stmt = upsert(IdSequence).values(name=QUESTION_ID_SEQUENCE, next_value=max_id + 1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'next_value': greatest(IdSequence.next_value, stmt.excluded.next_value)}
+    )
+    db.session.execute(stmt)
+
+
+def _note_change(*change):
+    # Lets this worker's question index (question_index.py) follow the write once it commits
+    current_unit_of_work().note_change(Question, change)
+
+
+def add_questions(questions):
+    """Insert new questions (each must already carry an id)."""
+    if questions:
+        _note_change('add', list(questions))
+        execute_write(Question, db.insert(Question), [question_row(q) for q in questions])
+
+
+def update_question(question_id, **fields):
+    """Merge fields into a question; returns the updated question or None if missing."""
+    question = get_question_by_id(question_id)
+    if question is None:
+        return None
+    question = {**question, **fields}
+    values = question_row(question)
+    del values['id']
+    _note_change('update', question)
+    execute_write(Question, db.update(Question).where(Question.id == question_id).values(**values))
+    return question
+
+
+def delete_question(question_id):
+    """Delete one question; returns True if it existed."""
+    _note_change('delete', question_id)
+    result = execute_write(Question, db.delete(Question).where(Question.id == question_id))
+    return result.rowcount > 0
+
+
+def delete_questions(skill=None, lesson=None):
+    """Delete all questions for a skill and/or lesson; returns how many were removed."""
+    if not skill and not lesson:
+        return 0
+    stmt = db.delete(Question)
+    if skill:
+        stmt = stmt.where(Question.skill == skill)
+    if lesson:
+        stmt = stmt.where(Question.lesson == lesson)
+    _note_change('delete_where', skill, lesson)
+    return execute_write(Question, stmt).rowcount
@@ -0,0 +1,98 @@
+"""
+Append-only question history, stored one row per answer.
+
+History used to live inside the student profile, so every profile read and
+write grew with the number of answered questions. Rows here are indexed on
+(username, timestamp) and read a page at a time with an opaque cursor. Rows
+older than the retention window are compacted into daily per-skill rollups
+by history_rollup.py.
+"""
+from datetime import datetime
+from database import db, HistoryRollup, QuestionHistory
+from unit_of_work import execute_write
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def history_row(username, record):
+    """Map a question record (as built by update_metrics) onto table columns."""
+    return {
+        'username': username,
+        'question_id': record.get('question_id'),
+        'skill': record.get('skill'),
+        'lesson': record.get('lesson'),
+        'is_correct': bool(record.get('is_correct')),
+        'time_spent': record.get('time_spent', 0),
+        'hints_used': record.get('hints_used', 0),
+        'session_id': record.get('session_id'),
+        'timestamp': datetime.strptime(record['timestamp'], TIMESTAMP_FORMAT)
+    }
+
+
+def history_record(row):
+    """Map a table row back onto the record shape the API has always returned."""
+    return {
+        'question_id': row.question_id,
+        'skill': row.skill,
+        'lesson': row.lesson,
+        'is_correct': row.is_correct,
+        'time_spent': row.time_spent,
+        'hints_used': row.hints_used,
+        'timestamp': row.timestamp.strftime(TIMESTAMP_FORMAT),
+        'session_id': row.session_id
+    }
+
+
+def encode_cursor(row):
+    return f"{row.timestamp.strftime(TIMESTAMP_FORMAT)}|{row.id}"
+
+
+def decode_cursor(cursor):
+    """Parse a cursor made by encode_cursor; ValueError if it isn't one."""
+    if not isinstance(cursor, str) or '|' not in cursor:
+        raise ValueError(f"Malformed history cursor: {cursor!r}")
+    timestamp, row_id = cursor.rsplit('|', 1)
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT), int(row_id)
+
+
+def append_history(username, records):
+    """Append one or more question records for a student."""
+    if isinstance(records, dict):
+        records = [records]
+    if records:
+        execute_write(QuestionHistory, db.insert(QuestionHistory),
+                      [history_row(username, record) for record in records])
+
+
+def fetch_history(username, limit=50, cursor=None):
+    """
+    Return one page of a student's most recent history.
+
+    Args:
+        username: student to read
+        limit: page size
+        cursor: value of `next_cursor` from the previous page, to read older records
+
+    Returns:
+        (records oldest-first, cursor for the next older page or None)
+    """
+    query = db.select(QuestionHistory).where(QuestionHistory.username == username)
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.where(db.or_(
+            QuestionHistory.timestamp < timestamp,
+            db.and_(QuestionHistory.timestamp == timestamp, QuestionHistory.id < row_id)
+        ))
+    query = query.order_by(QuestionHistory.timestamp.desc(), QuestionHistory.id.desc()).limit(limit + 1)
+    rows = list(db.session.execute(query).scalars())
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit and limit > 0 else None
+    page = rows[:limit]
+    page.reverse()
+    return [history_record(row) for row in page], next_cursor
+
+
+def delete_history(username):
+    """Remove all history for a student, rollups included (progress reset / account deletion)."""
+    execute_write(HistoryRollup, db.delete(HistoryRollup).where(HistoryRollup.username == username))
+    return execute_write(QuestionHistory, db.delete(QuestionHistory).where(QuestionHistory.username == username)).rowcount
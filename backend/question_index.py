@@ -0,0 +1,209 @@
+"""
+Per-worker index of the question bank by id and by skill → lesson → level.
+
+get-question needs the questions of one skill (optionally one lesson) up to
+the student's level. The index answers that from a handful of buckets, each
+kept sorted by id, so the lookup cost follows the number of candidates rather
+than the size of the bank. Candidate lists are also cached as
+scoring.CandidateSets, so their difficulty arrays are built once per version.
+Single-question reads (hints, retries, history enrichment) go through the id
+map instead of a query per question.
+
+The index is built from the questions table once per domain version (see
+domain_cache.py). Question writes committed by this worker are applied to
+it in place and move it to the version they produced; only when the version
+jumps further (another worker wrote in between) is it rebuilt.
+"""
+import heapq
+import threading
+from database import use_primary, Domain, DomainVersion, Question
+from scoring import CandidateSet
+from unit_of_work import current_unit_of_work, on_flush
+
+
+def _question_id(question):
+    return question['id']
+
+
+def _as_question_id(question_id):
+    # Clients sometimes send ids as strings; the table's ids are integers
+    if isinstance(question_id, str) and question_id.isdigit():
+        return int(question_id)
+    return question_id
+
+
+class QuestionIndex:
+    def __init__(self, questions, version):
+        """Index `questions` (dicts as stored in the questions table) as of domain `version`."""
+        self.version = version
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_skill = {}    # skill -> {level: [question, ...] sorted by id}
+        self._by_lesson = {}   # skill -> {lesson: {level: [question, ...] sorted by id}}
+        self._candidates = {}  # (skill, max_level, lesson) -> CandidateSet
+        self._generation = 0   # bumped by every change, so a set built meanwhile isn't cached
+        for question in sorted(questions, key=_question_id):
+            self._insert(question)
+
+    @staticmethod
+    def _key(question):
+        return question['skill'], question.get('lesson'), question.get('level', 1)
+
+    def _buckets(self, question):
+        skill, lesson, level = self._key(question)
+        return (self._by_skill.setdefault(skill, {}),
+                self._by_lesson.setdefault(skill, {}).setdefault(lesson, {})), level
+
+    def _insert(self, question):
+        self._by_id[question['id']] = question
+        levels, level = self._buckets(question)
+        for by_level in levels:
+            bucket = by_level.setdefault(level, [])
+            bucket.append(question)
+            if len(bucket) > 1 and bucket[-2]['id'] > question['id']:
+                bucket.sort(key=_question_id)
+
+    def _remove(self, question_id):
+        question_id = _as_question_id(question_id)
+        question = self._by_id.pop(question_id, None)
+        if question is None:
+            return
+        levels, level = self._buckets(question)
+        for by_level in levels:
+            by_level[level] = [q for q in by_level[level] if q['id'] != question_id]
+            if not by_level[level]:
+                del by_level[level]
+
+    # --- lookups ---
+    def get(self, question_id):
+        """The question with this id (shared: treat as read-only), or None."""
+        return self._by_id.get(_as_question_id(question_id))
+
+    def get_many(self, question_ids):
+        """{id: question} for those of the given ids that exist."""
+        by_id = self._by_id
+        found = {}
+        for question_id in question_ids:
+            question = by_id.get(_as_question_id(question_id))
+            if question is not None:
+                found[question['id']] = question
+        return found
+
+    def find(self, skill, max_level=None, lesson=None):
+        """Questions for a skill, optionally capped by level and limited to a lesson, ordered by id."""
+        with self._lock:
+            if lesson:
+                levels = self._by_lesson.get(skill, {}).get(lesson, {})
+            else:
+                levels = self._by_skill.get(skill, {})
+            buckets = [bucket for level, bucket in levels.items() if max_level is None or level <= max_level]
+            if len(buckets) == 1:
+                return list(buckets[0])
+            return list(heapq.merge(*buckets, key=_question_id))
+
+    def candidates(self, skill, max_level=None, lesson=None):
+        """Same questions as find(), as a CandidateSet for vectorized scoring."""
+        key = (skill, max_level, lesson or None)
+        candidates = self._candidates.get(key)
+        if candidates is None:
+            generation = self._generation
+            candidates = CandidateSet(self.find(skill, max_level, lesson))
+            with self._lock:
+                if generation == self._generation:
+                    self._candidates[key] = candidates
+        return candidates
+
+    def questions(self):
+        """Every question, ordered by id (shared: treat as read-only)."""
+        with self._lock:
+            return sorted(self._by_id.values(), key=_question_id)
+
+    def count(self, skill=None):
+        """Count questions, optionally for one skill."""
+        with self._lock:
+            if skill is None:
+                return len(self._by_id)
+            return sum(len(bucket) for bucket in self._by_skill.get(skill, {}).values())
+
+    # --- incremental updates ---
+    def apply(self, change):
+        """Apply one change noted by question_bank: ('add', [questions]), ('update', question),
+        ('delete', question_id) or ('delete_where', skill, lesson)."""
+        kind = change[0]
+        with self._lock:
+            self._candidates = {}
+            self._generation += 1
+            if kind == 'add':
+                for question in change[1]:
+                    self._remove(question['id'])
+                    self._insert(dict(question))
+            elif kind == 'update':
+                self._remove(change[1]['id'])
+                self._insert(dict(change[1]))
+            elif kind == 'delete':
+                self._remove(change[1])
+            elif kind == 'delete_where':
+                _, skill, lesson = change
+                doomed = [q['id'] for q in self._by_id.values()
+                          if (not skill or q['skill'] == skill) and (not lesson or q.get('lesson') == lesson)]
+                for question_id in doomed:
+                    self._remove(question_id)
+
+
+class QuestionIndexCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def get(self, version, loader):
+        """
+        Return the index for domain `version`, building it if it is for another version.
+
+        Args:
+            version: current domain version (from the domain cache)
+            loader: callable returning every question straight from the database
+        """
+        index = self._index
+        if index is not None and index.version == version:
+            return index
+        # Shared by every request in this worker, so never built from a lagging replica
+        with use_primary():
+            index = QuestionIndex(loader(), version)
+        with self._lock:
+            self._index = index
+        return index
+
+    def apply(self, changes, version):
+        """Apply this worker's committed question changes, which produced domain `version`."""
+        with self._lock:
+            index = self._index
+            # Patch only if nobody else wrote since the index was built. Version 1 means the
+            # counter row was just created (a fresh database), so nothing older can be trusted.
+            if index is None or version is None or version <= 1 or index.version != version - 1:
+                self._index = None
+                return
+            for change in changes:
+                index.apply(change)
+            index.version = version
+
+
+# Singleton instance
+_question_index_cache_instance = None
+
+def get_question_index_cache() -> QuestionIndexCache:
+    """Get or create the question index cache for this worker."""
+    global _question_index_cache_instance
+    if _question_index_cache_instance is None:
+        _question_index_cache_instance = QuestionIndexCache()
+    return _question_index_cache_instance
+
+
+def _apply_committed_changes():
+    uow = current_unit_of_work()
+    versions = uow.changes.get(DomainVersion)
+    get_question_index_cache().apply(uow.changes.get(Question, []), versions[-1] if versions else None)
+
+
+# Every domain/question flush bumps the version (domain_cache.py); follow it without a rebuild
+for _model in (Domain, Question):
+    on_flush(_model, after_commit=_apply_committed_changes)
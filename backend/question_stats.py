@@ -0,0 +1,139 @@
+"""
+Global per-question answer statistics used for difficulty calibration.
+
+Answers bump the counters with a single atomic upsert, so concurrent
+submissions never lose each other's updates and never rewrite the domain
+data. Reads are served from a per-worker copy that is reloaded every
+QUESTION_STATS_TTL seconds (local answers are applied to it as soon as they commit),
+also kept as arrays (scoring.StatsTable) for vectorized scoring.
+"""
+import os
+import threading
+import time
+from database import db, upsert, QuestionStat
+from scoring import stats_table
+from unit_of_work import current_unit_of_work, execute_write, on_flush
+
+
+def increment_statement(question_id, is_correct):
+    """Upsert that adds one attempt to a question's counters."""
+    stmt = upsert(QuestionStat).values(
+        question_id=question_id,
+        attempts=1,
+        correct=1 if is_correct else 0,
+        incorrect=0 if is_correct else 1
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=['question_id'],
+        set_={
+            'attempts': QuestionStat.attempts + stmt.excluded.attempts,
+            'correct': QuestionStat.correct + stmt.excluded.correct,
+            'incorrect': QuestionStat.incorrect + stmt.excluded.incorrect
+        }
+    )
+
+
+def load_question_stats():
+    """Read every counter row into the {str(question_id): {...}} shape the recommender uses."""
+    rows = db.session.execute(db.select(QuestionStat)).scalars()
+    return {
+        str(row.question_id): {
+            'attempts': row.attempts,
+            'correct': row.correct,
+            'incorrect': row.incorrect
+        }
+        for row in rows
+    }
+
+
+class QuestionStatsCache:
+    def __init__(self, ttl_seconds):
+        """Hold this worker's copy of the stats, reloading it every ttl_seconds."""
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._stats = None
+        self._table = None
+        self._loaded_at = 0.0
+        self.version = 0    # bumped by every reload and local answer, so memos built on the stats can tell
+
+    def get(self):
+        """Return the stats mapping (read-only for callers)."""
+        now = time.monotonic()
+        if self._stats is None or now - self._loaded_at >= self.ttl:
+            stats = load_question_stats()
+            with self._lock:
+                self._stats = stats
+                self._table = None
+                self._loaded_at = now
+                self.version += 1
+        return self._stats
+
+    def table(self):
+        """Return the same counters as a StatsTable of arrays (read-only for callers)."""
+        stats = self.get()
+        table = self._table
+        if table is None:
+            table = stats_table(stats)
+            with self._lock:
+                if self._stats is stats:
+                    self._table = table
+        return table
+
+    def apply(self, question_id, is_correct):
+        """Reflect a committed local answer without waiting for the next reload."""
+        with self._lock:
+            if self._stats is None:
+                return
+            entry = dict(self._stats.get(str(question_id), {'attempts': 0, 'correct': 0, 'incorrect': 0}))
+            entry['attempts'] += 1
+            entry['correct' if is_correct else 'incorrect'] += 1
+            # Swap in a new entry dict; readers only ever do point lookups
+            self._stats[str(question_id)] = entry
+            self.version += 1
+            if self._table is not None:
+                self._table.record(int(question_id), is_correct)
+
+
+def record_answer(question_id, is_correct):
+    """Atomically count an answer against a question."""
+    if question_id is None:
+        return
+    current_unit_of_work().note_change(QuestionStat, (question_id, is_correct))
+    execute_write(QuestionStat, increment_statement(question_id, is_correct))
+
+
+def get_question_stats():
+    """Return {str(question_id): {'attempts', 'correct', 'incorrect'}} for every answered question."""
+    return get_stats_cache().get()
+
+
+def get_question_stats_version():
+    """Return this worker's stats version (changes whenever get_question_stats() would read differently)."""
+    cache = get_stats_cache()
+    cache.get()
+    return cache.version
+
+
+def get_question_stats_table():
+    """Return the global answer counters as a scoring.StatsTable."""
+    return get_stats_cache().table()
+
+
+# Singleton instance
+_stats_cache_instance = None
+
+def get_stats_cache() -> QuestionStatsCache:
+    """Get or create the question stats cache for this worker."""
+    global _stats_cache_instance
+    if _stats_cache_instance is None:
+        _stats_cache_instance = QuestionStatsCache(float(os.getenv('QUESTION_STATS_TTL', '30')))
+    return _stats_cache_instance
+
+
+def _apply_committed_answers():
+    for question_id, is_correct in current_unit_of_work().changes.get(QuestionStat, []):
+        get_stats_cache().apply(question_id, is_correct)
+
+
+# A rolled-back request must not leave its answers in this worker's copy
+on_flush(QuestionStat, after_commit=_apply_committed_answers)
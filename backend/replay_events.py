@@ -0,0 +1,374 @@
+"""
+Rebuild the profile projections (mastery, metrics, badges, diagnostic_complete)
+of every student from the answer event log, e.g. after the mastery rules in
+projections.py change.
+
+Answers are almost all of the log, so they are replayed with NumPy: the log
+is read once into columns, events are lined up by their position in each
+student's log, and step k applies the k-th event of every student at once.
+The rare structural events (diagnostics, resets, snapshots, added skills) of
+a step go through projections.apply_event for the students they belong to,
+so both paths share one set of rules.
+
+Profiles are rewritten with compare-and-swap against the version read before
+the log, so a profile that changed during the replay is left alone (and
+reported); run the tool again to pick it up. With METRICS_WRITE_BEHIND on, run
+it while no worker has answers queued, or those would be counted twice.
+
+    python replay_events.py             # rewrite every profile whose projection differs
+    python replay_events.py --dry-run   # only count them
+"""
+import argparse
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+from flask import Flask
+from answer_events import iter_events
+from database import db, database_url, Student
+from projections import (CORRECT_STEP, INCORRECT_STEP, PROJECTED_FIELDS, SPEED_DEMON_SECONDS, FIRST_LESSON_BADGE,
+                         SPEED_DEMON_BADGE, apply_event, base_projection, skill_master_badge)
+
+load_dotenv()
+
+BATCH_SIZE = int(os.getenv('REPLAY_BATCH_SIZE', '1000'))
+
+# Columns of the badge matrix: the two fixed badges, then one per skill
+FIRST_LESSON, SPEED_DEMON, FIRST_MASTER = 0, 1, 2
+PERFORMANCE_COUNTERS = ('questions_answered', 'correct', 'incorrect', 'average_time')
+
+
+class EventLog:
+    """The whole answer event log as columns, one entry per event."""
+
+    def __init__(self):
+        self.usernames = []      # student index -> username
+        self.students = {}       # username -> student index
+        self.skills = {}         # skill -> column, in first-seen order
+        self.student = []
+        self.position = []       # index of the event within its student's log
+        self.is_answer = []
+        self.skill = []
+        self.correct = []
+        self.time_spent = []
+        self.dates = []
+        self.other = {}          # event number -> event dict, for non-answer events
+
+    def skill_column(self, skill):
+        return self.skills.setdefault(skill, len(self.skills))
+
+    def student_index(self, username):
+        index = self.students.setdefault(username, len(self.usernames))
+        if index == len(self.usernames):
+            self.usernames.append(username)
+        return index
+
+    def add(self, username, event):
+        index = self.student_index(username)
+        self.student.append(index)
+        answer = event['type'] == 'answer'
+        self.is_answer.append(answer)
+        self.dates.append(event['timestamp'][:10])
+        if answer:
+            self.skill.append(self.skill_column(event['skill']))
+            self.correct.append(bool(event['is_correct']))
+            self.time_spent.append(float(event['time_spent']))
+        else:
+            self.skill.append(0)
+            self.correct.append(False)
+            self.time_spent.append(0.0)
+            self.other[len(self.student) - 1] = event
+            for skill in _event_skills(event):
+                self.skill_column(skill)
+
+    def finish(self):
+        """Turn the columns into arrays and number each student's events."""
+        self.student = np.asarray(self.student, dtype=np.int64)
+        self.is_answer = np.asarray(self.is_answer, dtype=bool)
+        self.skill = np.asarray(self.skill, dtype=np.int64)
+        self.correct = np.asarray(self.correct, dtype=bool)
+        self.time_spent = np.asarray(self.time_spent, dtype=np.float64)
+        # iter_events yields each student's events contiguously, oldest first
+        starts = np.r_[0, np.flatnonzero(np.diff(self.student)) + 1] if len(self.student) else np.zeros(0, np.int64)
+        first = np.repeat(starts, np.diff(np.r_[starts, len(self.student)]))
+        self.position = np.arange(len(self.student)) - first
+
+
+def _event_skills(event):
+    if event['type'] == 'diagnostic':
+        return [entry['skill'] for entry in event['responses'] if entry.get('skill')]
+    if event['type'] == 'reset':
+        return event['skills']
+    if event['type'] == 'skill_added':
+        return [event['skill']]
+    if event['type'] == 'snapshot':
+        metrics = event.get('metrics') or {}
+        return list(event.get('mastery') or {}) + list(metrics.get('skill_performance') or {})
+    return []
+
+
+class Projections:
+    """Projected fields of every student as arrays (students x skills)."""
+
+    def __init__(self, log):
+        self.log = log
+        self.skill_names = list(log.skills)
+        students, skills = len(log.usernames), len(self.skill_names)
+        self.mastery = np.zeros((students, skills))
+        self.has_mastery = np.zeros((students, skills), dtype=bool)
+        self.total = np.zeros(students, dtype=np.int64)
+        self.correct = np.zeros(students, dtype=np.int64)
+        self.incorrect = np.zeros(students, dtype=np.int64)
+        self.average_time = np.zeros(students)
+        self.has_performance = np.zeros((students, skills), dtype=bool)
+        self.skill_answered = np.zeros((students, skills), dtype=np.int64)
+        self.skill_correct = np.zeros((students, skills), dtype=np.int64)
+        self.skill_incorrect = np.zeros((students, skills), dtype=np.int64)
+        self.skill_time = np.zeros((students, skills))
+        self.diagnostic_complete = np.zeros(students, dtype=bool)
+        self.earned = np.zeros((students, FIRST_MASTER + skills), dtype=bool)
+        # Small per-student Python state: key order, earned badge dicts, fields we only carry over
+        self.mastery_order = [[] for _ in range(students)]
+        self.performance_order = [[] for _ in range(students)]
+        self.badges = [[] for _ in range(students)]
+        self.extra_metrics = [{} for _ in range(students)]
+        self.extra_performance = {}  # (student, skill) -> non-counter fields, e.g. struggling_areas
+
+    # --- conversion to and from profile dicts (for the non-answer events) ---
+    def export(self, s):
+        names = self.skill_names
+        performance = {}
+        for k in self.performance_order[s]:
+            performance[names[k]] = {
+                'questions_answered': int(self.skill_answered[s, k]),
+                'correct': int(self.skill_correct[s, k]),
+                'incorrect': int(self.skill_incorrect[s, k]),
+                'average_time': float(self.skill_time[s, k]),
+                **self.extra_performance.get((s, k), {})
+            }
+        return {
+            'mastery': {names[k]: float(self.mastery[s, k]) for k in self.mastery_order[s]},
+            'metrics': {
+                **self.extra_metrics[s],
+                'total_questions_answered': int(self.total[s]),
+                'correct_answers': int(self.correct[s]),
+                'incorrect_answers': int(self.incorrect[s]),
+                'average_time_per_question': float(self.average_time[s]),
+                'skill_performance': performance
+            },
+            'badges': [dict(badge) for badge in self.badges[s]],
+            'diagnostic_complete': bool(self.diagnostic_complete[s])
+        }
+
+    def load(self, s, projection):
+        columns = self.log.skills
+        mastery = projection.get('mastery') or {}
+        self.mastery[s] = 0
+        self.has_mastery[s] = False
+        self.mastery_order[s] = [columns[skill] for skill in mastery]
+        for skill, score in mastery.items():
+            self.mastery[s, columns[skill]] = score
+            self.has_mastery[s, columns[skill]] = True
+
+        metrics = dict(projection.get('metrics') or {})
+        performance = metrics.pop('skill_performance', None) or {}
+        self.total[s] = metrics.pop('total_questions_answered', 0)
+        self.correct[s] = metrics.pop('correct_answers', 0)
+        self.incorrect[s] = metrics.pop('incorrect_answers', 0)
+        self.average_time[s] = metrics.pop('average_time_per_question', 0)
+        self.extra_metrics[s] = metrics
+
+        for array in (self.has_performance, self.skill_answered, self.skill_correct,
+                      self.skill_incorrect, self.skill_time):
+            array[s] = 0
+        for k in self.performance_order[s]:
+            self.extra_performance.pop((s, k), None)
+        self.performance_order[s] = [columns[skill] for skill in performance]
+        for skill, entry in performance.items():
+            k = columns[skill]
+            self.has_performance[s, k] = True
+            self.skill_answered[s, k] = entry.get('questions_answered', 0)
+            self.skill_correct[s, k] = entry.get('correct', 0)
+            self.skill_incorrect[s, k] = entry.get('incorrect', 0)
+            self.skill_time[s, k] = entry.get('average_time', 0)
+            self.extra_performance[(s, k)] = {key: value for key, value in entry.items()
+                                              if key not in PERFORMANCE_COUNTERS}
+
+        self.badges[s] = [dict(badge) for badge in projection.get('badges') or []]
+        self.earned[s] = False
+        for badge in self.badges[s]:
+            column = self._badge_column(badge.get('id'))
+            if column is not None:
+                self.earned[s, column] = True
+        self.diagnostic_complete[s] = bool(projection.get('diagnostic_complete'))
+
+    def _badge_column(self, badge_id):
+        if badge_id == FIRST_LESSON_BADGE['id']:
+            return FIRST_LESSON
+        if badge_id == SPEED_DEMON_BADGE['id']:
+            return SPEED_DEMON
+        if badge_id and badge_id.endswith('_master') and badge_id[:-len('_master')] in self.log.skills:
+            return FIRST_MASTER + self.log.skills[badge_id[:-len('_master')]]
+        return None
+
+    # --- answers, vectorized ---
+    def apply_answers(self, events):
+        """Apply answer events of distinct students at once (same rules as projections.apply_answer)."""
+        log = self.log
+        s, k = log.student[events], log.skill[events]
+        correct, time_spent = log.correct[events], log.time_spent[events]
+
+        for i in np.flatnonzero(~self.has_mastery[s, k]):
+            self.mastery_order[s[i]].append(k[i])
+        self.has_mastery[s, k] = True
+        step = np.where(correct, CORRECT_STEP, -INCORRECT_STEP)
+        self.mastery[s, k] = np.clip(self.mastery[s, k] + step, 0.0, 1.0)
+
+        answered = self.total[s]
+        self.total[s] = answered + 1
+        self.correct[s] += correct
+        self.incorrect[s] += ~correct
+        self.average_time[s] = (self.average_time[s] * answered + time_spent) / self.total[s]
+
+        for i in np.flatnonzero(~self.has_performance[s, k]):
+            self.performance_order[s[i]].append(k[i])
+            self.extra_performance.setdefault((s[i], k[i]), {'struggling_areas': []})
+        self.has_performance[s, k] = True
+        answered = self.skill_answered[s, k]
+        self.skill_answered[s, k] = answered + 1
+        self.skill_correct[s, k] += correct
+        self.skill_incorrect[s, k] += ~correct
+        self.skill_time[s, k] = (self.skill_time[s, k] * answered + time_spent) / self.skill_answered[s, k]
+
+        # Badge checks, as check_badge_eligibility runs them after every answer
+        new = np.zeros((len(events), self.earned.shape[1]), dtype=bool)
+        new[:, FIRST_LESSON] = self.total[s] >= 1
+        new[:, SPEED_DEMON] = self.average_time[s] < SPEED_DEMON_SECONDS
+        new[:, FIRST_MASTER:] = self.has_mastery[s] & (self.mastery[s] >= 1.0)
+        new &= ~self.earned[s]
+        for i in np.flatnonzero(new.any(axis=1)):
+            self._award(s[i], new[i], log.dates[events[i]])
+
+    def _award(self, s, new, date):
+        if new[FIRST_LESSON]:
+            self.badges[s].append({**FIRST_LESSON_BADGE, 'earned_date': date})
+        if new[SPEED_DEMON]:
+            self.badges[s].append({**SPEED_DEMON_BADGE, 'earned_date': date})
+        for k in self.mastery_order[s]:
+            if new[FIRST_MASTER + k]:
+                self.badges[s].append({**skill_master_badge(self.skill_names[k]), 'earned_date': date})
+        self.earned[s] |= new
+
+    # --- everything else ---
+    def apply_other(self, event_number):
+        s = self.log.student[event_number]
+        projection = self.export(s)
+        apply_event(projection, self.log.usernames[s], self.log.other[event_number])
+        self.load(s, projection)
+
+
+def load_profiles():
+    """{username: (version, mastery skills)} for every student, read before the log."""
+    profiles = {}
+    query = db.select(Student.username, Student.version, Student.data).execution_options(yield_per=BATCH_SIZE)
+    for username, version, data in db.session.execute(query):
+        profiles[username] = (version, list((data or {}).get('mastery') or {}))
+    return profiles
+
+
+def load_log(profiles):
+    """Read the event log of every existing student into columns."""
+    log = EventLog()
+    for username, event in iter_events():
+        if username in profiles:
+            log.add(username, event)
+    for username in log.usernames:
+        for skill in profiles[username][1]:
+            log.skill_column(skill)
+    log.finish()
+    return log
+
+
+def replay(log, profiles):
+    """Fold every student's events over a fresh projection of their skills; returns {username: projection}."""
+    state = Projections(log)
+    for s, username in enumerate(log.usernames):
+        state.load(s, base_projection(profiles[username][1]))
+
+    if len(log.student):
+        # Step k holds the k-th event of every student (each student at most once per step)
+        order = np.argsort(log.position, kind='stable')
+        bounds = np.searchsorted(log.position[order], np.arange(log.position.max() + 2))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            events = order[start:end]
+            answers = events[log.is_answer[events]]
+            if len(answers):
+                state.apply_answers(answers)
+            for event_number in events[~log.is_answer[events]]:
+                state.apply_other(event_number)
+
+    return {username: state.export(s) for s, username in enumerate(log.usernames)}
+
+
+def write_projections(projections, profiles, batch_size=BATCH_SIZE, dry_run=False):
+    """Store the rebuilt projections; returns (profiles changed, profiles skipped as stale)."""
+    changed = stale = 0
+    usernames = list(projections)
+    for start in range(0, len(usernames), batch_size):
+        batch = usernames[start:start + batch_size]
+        rows = db.session.execute(
+            db.select(Student.username, Student.version, Student.data).where(Student.username.in_(batch))
+        ).all()
+        for username, version, data in rows:
+            expected = profiles[username][0]
+            if version != expected:
+                stale += 1
+                continue
+            rebuilt = {**data, **projections[username]}
+            if {field: data.get(field) for field in PROJECTED_FIELDS} == projections[username]:
+                continue
+            changed += 1
+            if dry_run:
+                continue
+            result = db.session.execute(
+                db.update(Student.__table__)
+                .where(Student.username == username, Student.version == expected)
+                .values(data=rebuilt, version=Student.version + 1)
+            )
+            if result.rowcount == 0:
+                changed -= 1
+                stale += 1
+        db.session.commit()
+    return changed, stale
+
+
+def rebuild_projections(batch_size=BATCH_SIZE, dry_run=False):
+    """Replay the whole log and store the result; returns (events, students, changed, stale)."""
+    started = time.perf_counter()
+    profiles = load_profiles()
+    log = load_log(profiles)
+    loaded = time.perf_counter()
+    projections = replay(log, profiles)
+    replayed = time.perf_counter()
+    changed, stale = write_projections(projections, profiles, batch_size, dry_run)
+    print(f"Replayed {len(log.student)} events for {len(log.usernames)} students "
+          f"(read {loaded - started:.2f}s, replay {replayed - loaded:.2f}s, "
+          f"write {time.perf_counter() - replayed:.2f}s)")
+    print(f"{'Would change' if dry_run else 'Changed'} {changed} profiles"
+          + (f"; {stale} changed during the replay, run again to update them" if stale else ""))
+    return len(log.student), len(log.usernames), changed, stale
+
+
+if __name__ == "__main__":
+    if os.getenv('DATABASE_URL', '').strip().lower() == 'memory':
+        print("ERROR: DATABASE_URL=memory is not persistent; point it at Postgres or a SQLite file")
+    else:
+        parser = argparse.ArgumentParser(description="Rebuild mastery, metrics and badges from the answer event log")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="profiles per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="only report how many profiles would change")
+        args = parser.parse_args()
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+        db.init_app(app)
+        with app.app_context():
+            rebuild_projections(args.batch_size, args.dry_run)
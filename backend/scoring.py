@@ -0,0 +1,259 @@
+"""
+NumPy scoring of candidate questions for adaptive selection.
+
+get-question picks the candidate whose predicted success probability is
+closest to TARGET_PROBABILITY. A CandidateSet keeps the ids and static base
+difficulty of a candidate list as arrays and looks their answer counters up
+in a StatsTable (arrays sorted by question id), so calibrated difficulties
+come out of one vectorized pass (score() adds probability and distance to the
+target for every candidate, as a reference for the lookups below).
+
+Picking doesn't need to score every candidate: the probability is a logistic
+in (mastery - difficulty), so the ideal difficulty has a closed form,
+d* = mastery - ln(target / (1 - target)) / LOGISTIC_SLOPE. Each CandidateSet
+also keeps its candidates sorted by calibrated difficulty; nearest() bisects
+to d*, compares the neighbours on either side and picks at random among the
+near ties, in O(log n); nearest_many() keeps walking outward from there for
+a ranked batch. As answers shift difficulties the StatsTable journals which
+questions changed, and the sorted order moves just those entries.
+
+The difficulty rules are the ones app.get_question_difficulty_score applies
+to a single question; app.predict_success_probability is success_probability.
+"""
+import math
+import random
+import threading
+from collections import namedtuple
+import numpy as np
+
+BASE_DIFFICULTY = {'beginner': 0.35, 'intermediate': 0.6, 'advanced': 0.85}
+UNKNOWN_DIFFICULTY = 0.5
+# Accuracy assumed for questions nobody has answered yet (no difficulty shift)
+DEFAULT_ACCURACY = 0.7
+# How far global accuracy moves the difficulty: (DEFAULT_ACCURACY - accuracy) * ACCURACY_WEIGHT
+ACCURACY_WEIGHT = 0.4
+DIFFICULTY_RANGE = (0.05, 0.95)
+LOGISTIC_SLOPE = 5
+TARGET_PROBABILITY = 0.7
+# Candidates this close to the best distance count as tied and are picked at random
+TIE_TOLERANCE = 1e-6
+
+# One scored candidate: the question dict, its predicted probability and difficulty score
+ScoredQuestion = namedtuple('ScoredQuestion', ['question', 'probability', 'difficulty'])
+
+
+def base_difficulty(question):
+    return BASE_DIFFICULTY.get(question.get('difficulty', 'beginner'), UNKNOWN_DIFFICULTY)
+
+
+def calibrated_difficulty(base, attempts, correct):
+    """Array form of app.get_question_difficulty_score."""
+    accuracy = np.full(len(base), DEFAULT_ACCURACY)
+    answered = attempts > 0
+    accuracy[answered] = correct[answered] / attempts[answered]
+    # If lots of students miss a question it is harder; if most get it right, easier
+    return np.clip(base + (DEFAULT_ACCURACY - accuracy) * ACCURACY_WEIGHT, *DIFFICULTY_RANGE)
+
+
+def success_probabilities(skill_score, difficulty):
+    """Logistic curve over the skill gap, for an array of difficulty scores."""
+    return np.clip(1 / (1 + np.exp(-LOGISTIC_SLOPE * (skill_score - difficulty))), 0.0, 1.0)
+
+
+def success_probability(skill_score, difficulty):
+    """Scalar form of success_probabilities."""
+    return min(max(1 / (1 + math.exp(-LOGISTIC_SLOPE * (skill_score - difficulty))), 0.0), 1.0)
+
+
+def ideal_difficulty(skill_score, target=TARGET_PROBABILITY):
+    """The difficulty whose predicted success probability is exactly `target`."""
+    return skill_score - math.log(target / (1 - target)) / LOGISTIC_SLOPE
+
+
+def _first_true(lo, hi, predicate):
+    """First k in [lo, hi) where a monotone (False... True...) predicate holds, or hi."""
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if predicate(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class StatsTable:
+    """
+    Per-question answer counters as arrays sorted by question id.
+
+    record() updates them in place; every question it touches is appended to
+    `changed`, so difficulty orders built on this table can catch up by moving
+    just those questions.
+    """
+
+    def __init__(self, ids, attempts, correct):
+        # Swapped as one tuple, so readers never see arrays of different lengths
+        self._arrays = (ids, attempts, correct)
+        self.changed = []
+
+    def __len__(self):
+        return len(self._arrays[0])
+
+    def lookup(self, question_ids):
+        """(attempts, correct) arrays for an array of question ids (zeros if never answered)."""
+        ids, attempts, correct = self._arrays
+        if not len(ids):
+            zeros = np.zeros(len(question_ids))
+            return zeros, zeros
+        positions = np.minimum(np.searchsorted(ids, question_ids), len(ids) - 1)
+        found = ids[positions] == question_ids
+        return np.where(found, attempts[positions], 0), np.where(found, correct[positions], 0)
+
+    def record(self, question_id, is_correct):
+        """Count one answer (callers serialize writers)."""
+        ids, attempts, correct = self._arrays
+        position = ids.searchsorted(question_id)
+        if position < len(ids) and ids[position] == question_id:
+            attempts[position] += 1
+            correct[position] += 1 if is_correct else 0
+        else:
+            # First answer to this question: new arrays with it inserted in id order
+            self._arrays = (np.insert(ids, position, question_id),
+                            np.insert(attempts, position, 1),
+                            np.insert(correct, position, 1 if is_correct else 0))
+        self.changed.append(question_id)
+
+
+def stats_table(question_stats):
+    """Build a StatsTable from {str(question_id): {'attempts', 'correct', ...}}."""
+    entries = sorted((int(question_id), stats.get('attempts', 0), stats.get('correct', 0))
+                     for question_id, stats in question_stats.items() if str(question_id).isdigit())
+    if not entries:
+        return StatsTable(np.empty(0, np.int64), np.empty(0), np.empty(0))
+    ids, attempts, correct = zip(*entries)
+    return StatsTable(np.array(ids, np.int64), np.array(attempts, np.float64), np.array(correct, np.float64))
+
+
+class _DifficultyOrder:
+    """A CandidateSet's candidates sorted by calibrated difficulty, as of one StatsTable."""
+
+    def __init__(self, candidates, table):
+        self.table = table
+        self.applied = len(table.changed)
+        self.difficulty = candidates.difficulty(table)    # by candidate position
+        # Stable, so equal difficulties stay in candidate order and any entry can be found by bisection
+        self.order = np.argsort(self.difficulty, kind='stable')
+        self.sorted = self.difficulty[self.order]
+
+    def _slot(self, value, i):
+        """Where candidate i with difficulty `value` sits (or would sit) in the order."""
+        lo, hi = np.searchsorted(self.sorted, value, 'left'), np.searchsorted(self.sorted, value, 'right')
+        return int(lo + np.searchsorted(self.order[lo:hi], i))
+
+    def catch_up(self, candidates):
+        """Move the candidates whose counters changed since this order was built or last caught up."""
+        changed = self.table.changed[self.applied:]
+        self.applied += len(changed)
+        for question_id in set(changed):
+            i = candidates.position(question_id)
+            if i is None:
+                continue
+            new = candidates.difficulty(self.table, i)
+            old = self.difficulty[i]
+            if new == old:
+                continue
+            at, to = self._slot(old, i), self._slot(new, i)
+            # Slide the entries between the old and new slot over by one, in place; a
+            # shifted difficulty usually moves only a short way
+            if new > old:
+                to -= 1    # counted with candidate i still at `at`, below it
+                self.order[at:to] = self.order[at + 1:to + 1].copy()
+                self.sorted[at:to] = self.sorted[at + 1:to + 1].copy()
+            else:
+                self.order[to + 1:at + 1] = self.order[to:at].copy()
+                self.sorted[to + 1:at + 1] = self.sorted[to:at].copy()
+            self.order[to], self.sorted[to] = i, new
+            self.difficulty[i] = new
+
+
+class CandidateSet:
+    def __init__(self, questions):
+        """Hold a candidate list (ordered by id) with its ids and base difficulties as arrays."""
+        self.questions = questions
+        self.ids = np.fromiter((q['id'] for q in questions), np.int64, len(questions))
+        self.base = np.fromiter((base_difficulty(q) for q in questions), np.float64, len(questions))
+        self._lock = threading.Lock()
+        self._order = None
+
+    def __len__(self):
+        return len(self.questions)
+
+    def position(self, question_id):
+        """Index of a question in this set, or None."""
+        i = int(self.ids.searchsorted(question_id))
+        return i if i < len(self.ids) and self.ids[i] == question_id else None
+
+    def difficulty(self, table, i=None):
+        """Calibrated difficulty score of every candidate (or just candidate i) given the answer counters."""
+        if i is not None:
+            return float(calibrated_difficulty(self.base[i:i + 1], *table.lookup(self.ids[i:i + 1]))[0])
+        return calibrated_difficulty(self.base, *table.lookup(self.ids))
+
+    def score(self, skill_score, table, target=TARGET_PROBABILITY):
+        """Return (difficulty, probability, distance to target) arrays for every candidate."""
+        difficulty = self.difficulty(table)
+        probability = success_probabilities(skill_score, difficulty)
+        return difficulty, probability, np.abs(probability - target)
+
+    def _scored(self, i, difficulty, probability):
+        return ScoredQuestion(self.questions[i], float(probability[i]), float(difficulty[i]))
+
+    def _difficulty_order(self, table):
+        order = self._order
+        # A reloaded table, or a journal too long for a quick catch-up, means a fresh sort
+        if order is None or order.table is not table or len(table.changed) - order.applied > len(self) // 8 + 16:
+            order = self._order = _DifficultyOrder(self, table)
+        else:
+            order.catch_up(self)
+        return order
+
+    def nearest(self, skill_score, table, target=TARGET_PROBABILITY, rng=random):
+        """
+        The candidate closest to the target probability (near ties at random), found by
+        bisecting the difficulty order at the ideal difficulty instead of scoring every
+        candidate; None if there are no candidates.
+        """
+        picked = self.nearest_many(skill_score, table, 1, target, rng)
+        return picked[0] if picked else None
+
+    def nearest_many(self, skill_score, table, n, target=TARGET_PROBABILITY, rng=random):
+        """
+        The n candidates closest to the target probability, closest first, walking
+        outward from the ideal difficulty in the difficulty order. Each run of near
+        ties is taken in random order, so equally good questions aren't always
+        served lowest id first.
+        """
+        if n <= 0 or not len(self):
+            return []
+        with self._lock:
+            order = self._difficulty_order(table)
+            values = order.sorted
+
+            def distance(k):
+                return abs(success_probability(skill_score, values[k]) - target)
+
+            # [below, above) is taken; distance only grows moving outward from the split on either side
+            below = above = int(np.searchsorted(values, ideal_difficulty(skill_score, target)))
+            picked = []
+            while len(picked) < n and (below > 0 or above < len(values)):
+                best = min(distance(k) for k in (below - 1, above) if 0 <= k < len(values))
+                limit = best + TIE_TOLERANCE
+                # The near ties are [left, below) and [above, right); find their ends by bisection
+                left = _first_true(0, below, lambda k: distance(k) < limit)
+                right = _first_true(above, len(values), lambda k: distance(k) >= limit)
+                tied = (below - left) + (right - above)
+                for t in rng.sample(range(tied), min(n - len(picked), tied)):
+                    picked.append(left + t if t < below - left else above + t - (below - left))
+                below, above = left, right
+            chosen = [(int(order.order[k]), float(values[k])) for k in picked]
+        return [ScoredQuestion(self.questions[i], success_probability(skill_score, difficulty), difficulty)
+                for i, difficulty in chosen]
@@ -0,0 +1,147 @@
+"""
+Short-lived per-student session state (the question being answered, when it
+was served, hints used so far).
+
+It used to be stored as `current_session` inside the student profile, which
+cost a durable profile write every time a question or hint was served. It now
+lives in a key-value store whose entries expire on their own after
+SESSION_TTL seconds.
+
+- Default: in-process memory. Fine for a single worker; with several workers a
+  student's requests may land on different processes.
+- SESSION_STORE_URL=redis://host:6379/0: shared Redis store (needs the `redis`
+  package). Anything speaking the Redis protocol works as a local stand-in.
+"""
+import json
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class MemorySessionStore:
+    """Per-process TTL store; expired entries are dropped on read and swept periodically."""
+
+    SWEEP_EVERY = 1000
+
+    def __init__(self, ttl_seconds):
+        self.ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (expires_at, session dict)
+        self._writes = 0
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        return entry[1]
+
+    def get(self, key):
+        """Return a copy of the session, or None if missing/expired."""
+        with self._lock:
+            session = self._live(key, time.monotonic())
+            return dict(session) if session is not None else None
+
+    def set(self, key, session):
+        """Replace the session and restart its TTL."""
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, dict(session))
+            self._writes += 1
+            if self._writes % self.SWEEP_EVERY == 0:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def increment(self, key, field, maximum=None):
+        """
+        Atomically add one to an integer field, unless it already reached `maximum`.
+
+        Returns the value before the increment, or None if there is no session.
+        """
+        with self._lock:
+            session = self._live(key, time.monotonic())
+            if session is None:
+                return None
+            value = session.get(field, 0)
+            if maximum is None or value < maximum:
+                session[field] = value + 1
+            return value
+
+
+# Increment a hash field only while the session exists and is below the limit;
+# returns the previous value (nil if the session is gone)
+_INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return nil end
+local value = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if ARGV[2] == '' or value < tonumber(ARGV[2]) then
+    redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+end
+return value
+"""
+
+
+class RedisSessionStore:
+    """Shared store: one Redis hash per session (JSON-encoded fields) with a key expiry."""
+
+    def __init__(self, client, ttl_seconds, prefix='session:'):
+        self.client = client
+        self.ttl = max(1, int(ttl_seconds))
+        self.prefix = prefix
+        self._increment = client.register_script(_INCREMENT_SCRIPT)
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def get(self, key):
+        fields = self.client.hgetall(self._key(key))
+        if not fields:
+            return None
+        return {_text(name): json.loads(value) for name, value in fields.items()}
+
+    def set(self, key, session):
+        name = self._key(key)
+        pipe = self.client.pipeline()
+        pipe.delete(name)
+        if session:
+            pipe.hset(name, mapping={field: json.dumps(value) for field, value in session.items()})
+            pipe.expire(name, self.ttl)
+        pipe.execute()
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def increment(self, key, field, maximum=None):
+        value = self._increment(keys=[self._key(key)], args=[field, '' if maximum is None else maximum])
+        return None if value is None else int(value)
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+# Singleton instance
+_session_store_instance = None
+
+def get_session_store():
+    """Get or create the session store configured by SESSION_STORE_URL / SESSION_TTL."""
+    global _session_store_instance
+    if _session_store_instance is None:
+        ttl = float(os.getenv('SESSION_TTL', '3600'))
+        url = os.getenv('SESSION_STORE_URL', '').strip()
+        if url and redis is None:
+            print("SESSION_STORE_URL is set but the redis package is not installed; using in-memory sessions")
+        if url and redis is not None:
+            _session_store_instance = RedisSessionStore(redis.Redis.from_url(url), ttl)
+        else:
+            _session_store_instance = MemorySessionStore(ttl)
+    return _session_store_instance
@@ -0,0 +1,63 @@
+"""
+Check the admin user list: fields and order come from SQL, with role/level
+filters and cursor pagination.
+
+    python test_admin_users.py
+"""
+import os
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import app as app_module
+from database import db, split_student, Student, StudentProfile
+
+
+def seed():
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        for i in range(7):
+            username = f"user_{i}"
+            hot, cold = split_student({
+                'username': username, 'role': 'admin' if i == 3 else 'student', 'name': f"User {i}",
+                'email': f"{username}@example.com", 'level': 1 + i % 2, 'mastery': {'grammar': 0.5}
+            })
+            db.session.add(Student(username=username, data=hot))
+            db.session.add(StudentProfile(username=username, data=cold))
+        # Profiles predating role/level still list with the defaults
+        db.session.add(Student(username='legacy', data={}))
+        db.session.add(StudentProfile(username='legacy', data={'name': 'Legacy'}))
+        db.session.commit()
+
+
+def test_admin_user_list():
+    print("Testing the admin user list...")
+    seed()
+    client = app_module.app.test_client()
+
+    users = client.get('/api/admin/users').get_json()
+    assert [u['username'] for u in users] == ['legacy'] + [f"user_{i}" for i in range(7)]
+    assert users[0] == {'username': 'legacy', 'role': 'student', 'email': None, 'name': 'Legacy', 'level': 1}
+    assert users[4] == {'username': 'user_3', 'role': 'admin', 'email': 'user_3@example.com',
+                        'name': 'User 3', 'level': 2}
+
+    # Page through students on level 2
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/admin/users', query_string={
+            'role': 'student', 'level': 2, 'limit': 1, **({'cursor': cursor} if cursor else {})})
+        seen += [u['username'] for u in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert seen == ['user_1', 'user_5']
+
+    assert client.get('/api/admin/users?limit=abc').status_code == 400
+
+    print("✅ Admin user list filters and pages in SQL")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_admin_user_list()
+    exit(0 if success else 1)
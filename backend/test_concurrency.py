@@ -0,0 +1,218 @@
+"""
+Stress test for optimistic concurrency on student profiles.
+
+Several threads bump a counter in the same profile through mutate_student()
+(compare-and-swap + retry) and, for comparison, through a blind
+read-modify-write. Prints throughput and retries, and checks that no update
+is lost and that threads working on different students never retry.
+
+Uses a throwaway SQLite file (and the in-memory backend for the isolation check):
+
+    python test_concurrency.py
+"""
+import os
+import tempfile
+import threading
+import time
+from flask import Flask
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import app as app_module
+from database import db, init_db, Student
+from unit_of_work import StaleWriteError, current_unit_of_work
+
+THREADS = 8
+UPDATES_PER_THREAD = 25
+
+
+def create_app(path):
+    saved = os.environ.get('DATABASE_URL')
+    os.environ['DATABASE_URL'] = f"sqlite:///{path}"
+    try:
+        app = Flask(__name__)
+        init_db(app)
+    finally:
+        os.environ['DATABASE_URL'] = saved
+    return app
+
+
+def reset_students(app, usernames):
+    with app.app_context():
+        db.session.execute(db.delete(Student))
+        db.session.add_all(Student(username=u, data={'username': u, 'counter': 0}) for u in usernames)
+        db.session.commit()
+
+
+def read_counter(app, username):
+    with app.app_context():
+        return db.session.execute(db.select(Student.data).where(Student.username == username)).scalar()['counter']
+
+
+def run_threads(app, worker, usernames):
+    """Run THREADS workers (thread i works on usernames[i % len(usernames)]); returns elapsed seconds."""
+    threads = [threading.Thread(target=worker, args=(app, usernames[i % len(usernames)]))
+               for i in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.attempts = 0
+        self.committed = 0
+        self.gave_up = 0
+
+    def add(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+def cas_worker(counters):
+    def worker(app, username):
+        for _ in range(UPDATES_PER_THREAD):
+            def bump(profile):
+                counters.add('attempts')
+                profile['counter'] += 1
+            with app.test_request_context():
+                try:
+                    app_module.mutate_student(username, bump)
+                    current_unit_of_work().flush()
+                    counters.add('committed')
+                except StaleWriteError:
+                    current_unit_of_work().rollback()
+                    counters.add('gave_up')
+    return worker
+
+
+def blind_worker(counters):
+    def worker(app, username):
+        for _ in range(UPDATES_PER_THREAD):
+            with app.app_context():
+                data = dict(db.session.execute(
+                    db.select(Student.data).where(Student.username == username)).scalar())
+                data['counter'] += 1
+                db.session.execute(db.update(Student).where(Student.username == username).values(data=data))
+                db.session.commit()
+                counters.add('committed')
+    return worker
+
+
+def report(label, counters, elapsed):
+    retries = max(counters.attempts - counters.committed - counters.gave_up, 0)
+    print(f"  {label:<34} {counters.committed / elapsed:8.0f} updates/s, "
+          f"{retries} retries, {counters.gave_up} gave up")
+
+
+def test_concurrent_profile_updates():
+    print(f"Stress test: {THREADS} threads x {UPDATES_PER_THREAD} profile updates")
+    app = create_app(os.path.join(tempfile.mkdtemp(), 'concurrency.db'))
+    total = THREADS * UPDATES_PER_THREAD
+
+    # Unversioned read-modify-write: fast, but concurrent writers overwrite each other
+    reset_students(app, ['hot'])
+    counters = Counters()
+    elapsed = run_threads(app, blind_worker(counters), ['hot'])
+    report("one student, blind write:", counters, elapsed)
+    print(f"    lost updates: {total - read_counter(app, 'hot')}")
+
+    # Compare-and-swap on one student: every committed update must be counted
+    reset_students(app, ['hot'])
+    counters = Counters()
+    elapsed = run_threads(app, cas_worker(counters), ['hot'])
+    report("one student, compare-and-swap:", counters, elapsed)
+    assert read_counter(app, 'hot') == counters.committed
+    assert counters.committed + counters.gave_up == total
+
+    # Different students never contend, so nothing is ever retried
+    usernames = [f"student_{i}" for i in range(THREADS)]
+    reset_students(app, usernames)
+    counters = Counters()
+    elapsed = run_threads(app, cas_worker(counters), usernames)
+    report("own student each, compare-and-swap:", counters, elapsed)
+    assert counters.attempts == counters.committed == total
+    assert all(read_counter(app, u) == UPDATES_PER_THREAD for u in usernames)
+
+    print("✅ No lost updates under concurrent writes")
+    return True
+
+
+def test_memory_backend_isolates_threads():
+    print("Testing that threads on the in-memory backend don't share a transaction...")
+    app = app_module.app
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    started = threading.Event()
+
+    def rolled_back():
+        with app.app_context():
+            db.session.add(Student(username='rolled_back', data={}))
+            db.session.flush()
+            started.set()
+            time.sleep(0.2)
+            db.session.rollback()
+
+    def committed():
+        started.wait()
+        with app.app_context():
+            # Waits for the other thread's transaction instead of committing it too
+            db.session.add(Student(username='committed', data={}))
+            db.session.commit()
+
+    threads = [threading.Thread(target=rolled_back), threading.Thread(target=committed)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with app.app_context():
+        assert db.session.execute(db.select(Student.username)).scalars().all() == ['committed']
+
+    print("✅ Each thread's commit and rollback only covers its own work")
+    return True
+
+
+def test_diagnostic_retries_on_concurrent_update():
+    print("Testing that a diagnostic submit retries instead of failing on a concurrent update...")
+    app = app_module.app
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    assert client.post('/api/register', json={'username': 'diag', 'password': 'secret'}).status_code == 200
+
+    apply_event = app_module.apply_event
+    calls = []
+
+    def racing_apply_event(student, student_id, event):
+        calls.append(student_id)
+        if len(calls) == 1:
+            # Another request updates the profile between this one's read and its write
+            db.session.execute(db.update(Student).where(Student.username == student_id)
+                               .values(version=Student.version + 1))
+        return apply_event(student, student_id, event)
+
+    app_module.apply_event = racing_apply_event
+    try:
+        response = client.post('/api/diagnostic/submit', json={
+            'student_id': 'diag', 'responses': [{'skill': 'grammar', 'is_correct': True}]})
+    finally:
+        app_module.apply_event = apply_event
+    assert response.status_code == 200, response.get_json()
+    assert len(calls) == 2
+    with app.app_context():
+        assert db.session.get(Student, 'diag').data['diagnostic_complete'] is True
+
+    print("✅ Diagnostic submits go through compare-and-swap with retry")
+    return True
+
+
+if __name__ == "__main__":
+    success = (test_concurrent_profile_updates() and test_memory_backend_isolates_threads()
+               and test_diagnostic_retries_on_concurrent_update())
+    exit(0 if success else 1)
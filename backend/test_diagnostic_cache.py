@@ -0,0 +1,89 @@
+"""
+Check the memoized diagnostic set on the in-memory backend: it is built once
+per question bank and stats version, answers refresh it in the background,
+and question writes rebuild it straight away.
+
+    python test_diagnostic_cache.py
+"""
+import os
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import app as app_module
+import question_bank
+from database import db, Domain
+from diagnostic_cache import get_diagnostic_cache
+from question_stats import get_question_stats, record_answer
+
+QUESTIONS = [
+    {"id": 1, "skill": "grammar", "difficulty": "intermediate", "question": "Q1", "answer": "a"},
+    {"id": 2, "skill": "grammar", "difficulty": "beginner", "question": "Q2", "answer": "a"},
+    {"id": 3, "skill": "grammar", "difficulty": "beginner", "question": "Q3", "answer": "a"},
+    {"id": 4, "skill": "spelling", "difficulty": "advanced", "question": "Q4", "answer": "a"},
+]
+
+
+def reference_set():
+    """The diagnostic set as the sort over every skill's questions computes it."""
+    stats = get_question_stats()
+    rank = {'beginner': 0, 'intermediate': 1, 'advanced': 2}
+    questions = []
+    for skill in app_module.get_all_skills():
+        candidates = sorted((q for q in question_bank.load_questions() if q['skill'] == skill),
+                            key=lambda q: (rank.get(q.get('difficulty', 'beginner').lower(), 1),
+                                           app_module.get_question_difficulty_score(q, stats)))
+        if candidates:
+            score = app_module.get_question_difficulty_score(candidates[0], stats)
+            questions.append({**candidates[0], 'difficulty_score': round(score, 2)})
+    return questions
+
+
+def start(client):
+    response = client.post('/api/diagnostic/start', json={'student_id': 'diag_student'})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['questions']
+
+
+def test_diagnostic_cache():
+    print("Testing the diagnostic set cache...")
+    client = app_module.app.test_client()
+    get_diagnostic_cache().refresh_interval = 0
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Domain(category='skills', data=['grammar', 'spelling']))
+        db.session.commit()
+        question_bank.add_questions(QUESTIONS)
+        db.session.commit()
+
+    first = start(client)
+    with app_module.app.app_context():
+        assert [q['id'] for q in first] == [2, 4] and first == reference_set()
+        cached = app_module.get_diagnostic_questions()
+        assert app_module.get_diagnostic_questions() is cached
+
+        # Q2 keeps being missed: the cached set is served while the background rebuild picks Q3
+        for _ in range(5):
+            record_answer(2, False)
+        db.session.commit()
+        assert app_module.get_diagnostic_questions() is cached
+        refresh = get_diagnostic_cache()._thread
+        if refresh is not None:
+            refresh.join()
+        refreshed = app_module.get_diagnostic_questions()
+        assert [q['id'] for q in refreshed] == [3, 4] and refreshed == reference_set()
+
+    # A question write moves the domain version: rebuilt in the request
+    with app_module.app.app_context():
+        question_bank.add_questions([{"id": 5, "skill": "spelling", "difficulty": "beginner",
+                                      "question": "Q5", "answer": "a"}])
+        db.session.commit()
+    assert [q['id'] for q in start(client)] == [3, 5]
+
+    print("✅ The diagnostic set is memoized and follows bank and stats changes")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_diagnostic_cache()
+    exit(0 if success else 1)
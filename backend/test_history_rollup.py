@@ -0,0 +1,89 @@
+"""
+Check history compaction on the in-memory backend: old rows become daily
+per-skill rollups plus a gzip'd archive, recent rows stay, and the daily
+totals read the same before and after.
+
+    python test_history_rollup.py
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import app as app_module
+from database import db, HistoryRollup, QuestionHistory
+from history_rollup import compact_history, fetch_daily_history, iter_archive
+from question_history import TIMESTAMP_FORMAT, append_history, fetch_history
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def record(skill, is_correct, at, hints_used=0):
+    return {'question_id': 1, 'skill': skill, 'is_correct': is_correct, 'time_spent': 10,
+            'hints_used': hints_used, 'timestamp': at.strftime(TIMESTAMP_FORMAT), 'session_id': 1}
+
+
+def seed():
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        old = NOW - timedelta(days=120)
+        append_history('rollup_student', [
+            record('grammar', True, old),
+            record('grammar', False, old + timedelta(hours=1), hints_used=2),
+            record('vocabulary', True, old + timedelta(days=1)),
+            record('grammar', True, NOW - timedelta(days=2)),
+        ])
+        append_history('other_student', [record('grammar', True, old)])
+        db.session.commit()
+
+
+def test_history_rollup():
+    print("Testing history rollup and archival...")
+    seed()
+    archive = tempfile.mkdtemp()
+    with app_module.app.app_context():
+        before = fetch_daily_history('rollup_student')
+        assert compact_history(days=90, batch_size=1, directory=archive, now=NOW) == (4, 4)
+
+        # Only the recent row is left in the hot table
+        recent, _ = fetch_history('rollup_student')
+        assert [r['timestamp'][:10] for r in recent] == [(NOW - timedelta(days=2)).strftime('%Y-%m-%d')]
+        assert db.session.execute(db.select(db.func.count()).select_from(QuestionHistory)).scalar() == 1
+
+        # The same day/skill split over two batches is added up, not overwritten
+        grammar = db.session.get(HistoryRollup, ('rollup_student', (NOW - timedelta(days=120)).date(), 'grammar'))
+        assert (grammar.attempts, grammar.correct, grammar.time_spent, grammar.hints_used) == (2, 1, 20, 2)
+
+        # Analytics read the same totals, and every raw row is in the archive
+        assert fetch_daily_history('rollup_student') == before
+        assert len(fetch_daily_history('rollup_student', since=(NOW - timedelta(days=10)).date())) == 1
+        archived = list(iter_archive(archive))
+        assert sorted(r['username'] for r in archived) == ['other_student'] + ['rollup_student'] * 3
+
+        # Nothing left to compact
+        assert compact_history(days=90, directory=archive, now=NOW) == (0, 0)
+
+    print("✅ Old history is rolled up and archived without changing daily totals")
+    return True
+
+
+def test_daily_history_days():
+    print("Testing the days filter of get-daily-history...")
+    seed()
+    client = app_module.app.test_client()
+    assert client.post('/api/register', json={'username': 'daily_student', 'password': 'secret'}).status_code == 200
+    for days in (0, -3, 'ten', 1.5e12, [7]):
+        response = client.post('/api/get-daily-history', json={'student_id': 'daily_student', 'days': days})
+        assert response.status_code == 400 and 'error' in response.get_json(), days
+    for days in (None, 1, '30'):
+        response = client.post('/api/get-daily-history', json={'student_id': 'daily_student', 'days': days})
+        assert response.status_code == 200 and response.get_json()['daily_history'] == [], days
+    print("✅ days must be an integer of at least 1")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_history_rollup() and test_daily_history_days()
+    exit(0 if success else 1)
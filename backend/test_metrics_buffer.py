@@ -0,0 +1,169 @@
+"""
+Check the write-behind buffer for answer updates on the in-memory backend:
+answers are visible right away, land in the profile in one write per student
+when flushed, and survive a crash through the append log.
+
+    python test_metrics_buffer.py
+"""
+import os
+import tempfile
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import app as app_module
+import metrics_buffer
+import question_bank
+from database import db, Domain, ProgressMarker, Student
+from metrics_buffer import MetricsWriteBehind
+
+QUESTIONS = [
+    {"id": 1, "skill": "vocabulary", "level": 1, "question": "Opposite of 'hot'?", "answer": "cold"},
+    {"id": 2, "skill": "vocabulary", "level": 1, "question": "Opposite of 'sad'?", "answer": "happy"},
+]
+
+
+def seed():
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Domain(category='skills', data=app_module.DEFAULT_SKILLS))
+        db.session.commit()
+        question_bank.add_questions(QUESTIONS)
+        db.session.commit()
+
+
+def start_buffer(log_dir):
+    # Long interval: the test decides when to flush
+    buffer = MetricsWriteBehind(app_module.app, app_module.apply_student_events, log_dir, flush_interval=3600)
+    metrics_buffer._metrics_buffer_instance = buffer
+    return buffer
+
+
+def crash(buffer):
+    """Drop the buffer as a killed worker would: no flush, log segment left behind."""
+    buffer._stopped = True
+    buffer._wake.set()
+    buffer._segment.file.close()
+    metrics_buffer._metrics_buffer_instance = None
+
+
+def stored_profile(username):
+    with app_module.app.app_context():
+        return db.session.get(Student, username).data
+
+
+def markers():
+    with app_module.app.app_context():
+        return db.session.execute(db.select(ProgressMarker.name)).scalars().all()
+
+
+def answer(client, question_id, student_id='wb_student'):
+    response = client.post('/api/submit-answer', json={
+        'student_id': student_id, 'skill': 'vocabulary', 'question_id': question_id, 'is_correct': True
+    })
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_write_behind():
+    print("Testing write-behind answer updates...")
+    seed()
+    client = app_module.app.test_client()
+    log_dir = tempfile.mkdtemp()
+    assert client.post('/api/register', json={'username': 'wb_student', 'password': 'secret'}).status_code == 200
+
+    buffer = start_buffer(log_dir)
+    try:
+        # The response and later reads see the answers; the stored profile does not yet
+        assert answer(client, 1)['new_mastery']['vocabulary'] == 0.25
+        assert answer(client, 2)['new_mastery']['vocabulary'] == 0.5
+        assert client.post('/api/get-progress', json={'student_id': 'wb_student'}).get_json()['vocabulary'] == 0.5
+        assert stored_profile('wb_student')['mastery']['vocabulary'] == 0.0
+
+        # Two queued answers, one profile write
+        assert buffer.flush() == 1
+        profile = stored_profile('wb_student')
+        assert profile['mastery']['vocabulary'] == 0.5
+        assert profile['metrics']['total_questions_answered'] == 2
+        assert os.listdir(log_dir) == [os.path.basename(buffer._segment.path)]
+        assert markers() == []
+
+        # A worker dies with an answer only in its log; the next one replays it
+        answer(client, 1)
+        crash(buffer)
+        assert stored_profile('wb_student')['mastery']['vocabulary'] == 0.5
+        buffer = start_buffer(log_dir)
+        assert buffer.pending_ops('wb_student')[0]['question_id'] == 1
+        assert buffer.flush() == 1
+        profile = stored_profile('wb_student')
+        assert profile['mastery']['vocabulary'] == 0.75
+        assert profile['metrics']['total_questions_answered'] == 3
+        assert len(os.listdir(log_dir)) == 1
+
+        # A worker dies after committing a segment but before deleting it: not applied twice
+        answer(client, 1)
+        path = buffer._segment.path
+        crash(buffer)
+        with app_module.app.app_context():
+            db.session.add(ProgressMarker(name=metrics_buffer._marker_name(path), value=1))
+            db.session.commit()
+        buffer = start_buffer(log_dir)
+        assert buffer.pending_ops('wb_student') == []
+        assert not os.path.exists(path) and markers() == []
+
+        # Reset drops whatever is still queued
+        answer(client, 2)
+        assert client.post('/api/reset-progress', json={'student_id': 'wb_student'}).status_code == 200
+        buffer.flush()
+        assert stored_profile('wb_student')['mastery']['vocabulary'] == 0.0
+    finally:
+        crash(buffer)
+
+    print("✅ Write-behind updates are visible at once, batched, and crash-safe")
+    return True
+
+
+def test_write_behind_new_students():
+    print("Testing write-behind answers from auto-created students...")
+    seed()
+    client = app_module.app.test_client()
+    buffer = start_buffer(tempfile.mkdtemp())
+    try:
+        # The created profile is written by the request, the answer only by the buffer
+        assert answer(client, 1, 'wb_new')['new_mastery']['vocabulary'] == 0.25
+        response = client.post('/api/diagnostic/submit', json={
+            'student_id': 'wb_diag', 'responses': [{'skill': 'vocabulary', 'is_correct': True}]})
+        assert response.status_code == 200, response.get_json()
+        assert stored_profile('wb_new')['metrics']['total_questions_answered'] == 0
+        assert buffer.flush() == 2
+        profile = stored_profile('wb_new')
+        assert profile['mastery']['vocabulary'] == 0.25
+        assert profile['metrics']['total_questions_answered'] == 1
+        assert stored_profile('wb_diag')['metrics']['total_questions_answered'] == 1
+
+        # A request that fails after computing its answer queues nothing
+        append_history = app_module.append_history
+
+        def failing_append_history(student_id, record):
+            raise RuntimeError("history write failed")
+
+        app_module.append_history = failing_append_history
+        try:
+            response = client.post('/api/submit-answer', json={
+                'student_id': 'wb_failed', 'skill': 'vocabulary', 'question_id': 1, 'is_correct': True})
+        finally:
+            app_module.append_history = append_history
+        assert response.status_code == 500
+        assert buffer.pending_ops('wb_failed') == [] and buffer._segment.entries == 0
+        with app_module.app.app_context():
+            assert db.session.get(Student, 'wb_failed') is None
+    finally:
+        crash(buffer)
+
+    print("✅ New students' answers are applied once, and only when their request commits")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_write_behind() and test_write_behind_new_students()
+    exit(0 if success else 1)
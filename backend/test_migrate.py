@@ -0,0 +1,193 @@
+"""
+Check the streaming importer in migrate.py: batched upserts, history split and resume
+(for students and for the question bank), plus a full migrate() run on a fresh SQLite file.
+
+Runs on the in-memory backend (and a temporary SQLite file):
+
+    python test_migrate.py
+"""
+import json
+import os
+import tempfile
+from flask import Flask
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import migrate
+from database import db, Domain, Question, Student, StudentProfile, QuestionHistory, STUDENT_INDEXES
+from json_stream import iter_json_object
+
+STUDENT_COUNT = 250
+
+
+def write_students(path):
+    students = {}
+    for i in range(STUDENT_COUNT):
+        students[f"student_{i}"] = {
+            "username": f"student_{i}",
+            "name": f"Student {i} – ü",
+            "question_history": [
+                {"question_id": 1, "skill": "grammar", "is_correct": True, "time_spent": 4,
+                 "hints_used": 0, "timestamp": "2025-01-01 10:00:00", "session_id": 1}
+            ]
+        }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(students, f, ensure_ascii=False, indent=2)
+    return students
+
+
+def counts():
+    return (
+        db.session.execute(db.select(db.func.count()).select_from(Student)).scalar(),
+        db.session.execute(db.select(db.func.count()).select_from(QuestionHistory)).scalar()
+    )
+
+
+def test_streaming_import():
+    print("Testing the streaming student import...")
+    path = os.path.join(tempfile.mkdtemp(), 'student.json')
+    students = write_students(path)
+
+    # The reader yields every member, even with chunks smaller than one profile
+    streamed = {key: value for key, value, _ in iter_json_object(path, chunk_size=64)}
+    assert streamed == students
+
+    with migrate.app.app_context():
+        db.drop_all()
+        db.create_all()
+        migrate.import_students(path, batch_size=40)
+        assert counts() == (STUDENT_COUNT, STUDENT_COUNT)
+        assert db.session.get(Student, 'student_7').data == {}
+        assert db.session.get(StudentProfile, 'student_7').data == {"username": "student_7", "name": "Student 7 – ü"}
+        # A finished import leaves no checkpoint behind
+        assert migrate.load_checkpoint(migrate.checkpoint_name(path)) == 0
+
+        # Pretend an earlier run committed the first 100 students and was interrupted
+        db.drop_all()
+        db.create_all()
+        members = list(iter_json_object(path))
+        migrate.write_student_batch(dict((k, v) for k, v, _ in members[:100]),
+                                    migrate.checkpoint_name(path), members[99][2])
+        migrate.import_students(path, batch_size=40)
+        # Resuming picks up at student 100 without duplicating any history rows
+        assert counts() == (STUDENT_COUNT, STUDENT_COUNT)
+        # So does a second full run, once the checkpoint is gone
+        migrate.import_students(path, batch_size=40)
+        assert counts() == (STUDENT_COUNT, STUDENT_COUNT)
+
+    print("✅ Streaming import and resume work")
+    return True
+
+
+def test_streaming_domain_import():
+    print("Testing the streaming domain import...")
+    path = os.path.join(tempfile.mkdtemp(), 'domain.json')
+    questions = [{"id": i, "skill": "grammar", "question": f"Q{i} – ü", "answer": "a"} for i in range(1, 251)]
+    domain = {"skills": ["grammar"], "questions": questions, "lessons": {"grammar": []}}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(domain, f, ensure_ascii=False, indent=2)
+
+    # The question bank comes out one question at a time, resumable after any of them
+    streamed = list(iter_json_object(path, chunk_size=64, stream='questions'))
+    assert [key for key, _, _ in streamed] == ['skills'] + ['questions'] * 250 + ['lessons']
+    assert [value for key, value, _ in streamed if key == 'questions'] == questions
+    for i in (0, 1, 100, 250, 251):
+        resumed = list(iter_json_object(path, streamed[i][2], chunk_size=64, stream='questions'))
+        assert resumed == streamed[i + 1:], i
+
+    def question_count():
+        return db.session.execute(db.select(db.func.count()).select_from(Question)).scalar()
+
+    with migrate.app.app_context():
+        db.drop_all()
+        db.create_all()
+        # An earlier run committed the first 100 questions and was interrupted
+        migrate.write_question_batch(questions[:100], migrate.checkpoint_name(path), streamed[100][2])
+        migrate.import_domain(path, batch_size=40)
+        assert question_count() == 250
+        assert db.session.get(Question, 250).data == questions[-1]
+        assert db.session.get(Domain, 'lessons').data == {"grammar": []}
+        assert migrate.load_checkpoint(migrate.checkpoint_name(path)) == 0
+
+    print("✅ The question bank is streamed and resumed question by question")
+    return True
+
+
+def test_split_student_documents():
+    print("Testing the hot/cold split of stored profiles...")
+    with migrate.app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Student(username='whole', version=3, data={
+            'username': 'whole', 'password_hash': 'x', 'role': 'admin', 'level': 2,
+            'mastery': {'grammar': 0.5}, 'diagnostic_complete': True}))
+        db.session.add(Student(username='split', version=1, data={'level': 1, 'mastery': {}}))
+        db.session.commit()
+
+        migrate.split_student_documents(batch_size=1)
+        db.session.expire_all()
+        whole = db.session.get(Student, 'whole')
+        assert whole.data == {'level': 2, 'mastery': {'grammar': 0.5}, 'diagnostic_complete': True}
+        assert whole.version == 4
+        assert db.session.get(StudentProfile, 'whole').data == {'username': 'whole', 'password_hash': 'x', 'role': 'admin'}
+        # Already split: left alone
+        assert db.session.get(Student, 'split').version == 1
+        assert db.session.get(StudentProfile, 'split') is None
+
+    print("✅ Cold profile fields move to student_profiles")
+    return True
+
+
+def test_profile_history_moved_once():
+    print("Testing that embedded history is moved only once...")
+    records = [{"question_id": q, "skill": "grammar", "is_correct": True, "time_spent": 4, "hints_used": 0,
+                "timestamp": "2025-01-01 10:00:0%d" % q, "session_id": 1} for q in range(5)]
+    with migrate.app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Student(username='embedded', data={'level': 1, 'question_history': records}))
+        db.session.commit()
+        migrate.migrate_profile_history()
+        assert counts() == (1, 5)
+
+        # The old document comes back (e.g. re-imported from a backup): its history is already in the table
+        db.session.get(Student, 'embedded').data = {'level': 1, 'question_history': records}
+        db.session.commit()
+        migrate.migrate_profile_history()
+        assert counts() == (1, 5)
+        assert db.session.get(Student, 'embedded').data == {'level': 1}
+
+    print("✅ Re-running the history move doesn't duplicate rows")
+    return True
+
+
+def test_migrate_fresh_sqlite_file():
+    print("Testing a full migration on an empty SQLite file...")
+    path = os.path.join(tempfile.mkdtemp(), 'fresh.db')
+    file_app = Flask(__name__)
+    file_app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    db.init_app(file_app)
+    memory_app, migrate.app = migrate.app, file_app
+    try:
+        # Imports data/student.json and data/domain.json like `python migrate.py`; twice changes nothing
+        migrate.migrate()
+        with file_app.app_context():
+            history = db.session.execute(db.select(db.func.count()).select_from(QuestionHistory)).scalar()
+        migrate.migrate()
+        with file_app.app_context():
+            assert db.session.execute(db.select(db.func.count()).select_from(QuestionHistory)).scalar() == history
+            indexes = set(db.session.execute(db.text(
+                "SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+            assert {index.name for index in STUDENT_INDEXES} <= indexes
+            assert 'ix_students_role_level_username' not in indexes
+    finally:
+        migrate.app = memory_app
+
+    print("✅ migrate() runs end to end on a fresh database")
+    return True
+
+
+if __name__ == "__main__":
+    success = (test_streaming_import() and test_streaming_domain_import() and test_split_student_documents() and test_profile_history_moved_once()
+               and test_migrate_fresh_sqlite_file())
+    exit(0 if success else 1)
@@ -0,0 +1,106 @@
+"""
+Check the per-worker question index on the in-memory backend: lookups match
+the questions table (by id as well as by skill/lesson/level), and this
+worker's question writes update the index in place instead of rebuilding it.
+
+    python test_question_index.py
+"""
+import os
+import random
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import app as app_module
+import question_bank
+from database import db, Domain, Question
+from domain_cache import bump_domain_version, get_domain_cache
+
+SKILLS = ['grammar', 'spelling', 'vocabulary']
+LESSONS = [None, 'basics', 'advanced']
+
+
+def random_questions(rng, first_id, count):
+    return [{"id": question_id, "skill": rng.choice(SKILLS), "level": rng.randint(1, 4),
+             "lesson": rng.choice(LESSONS), "question": f"Q{question_id}", "answer": "a"}
+            for question_id in range(first_id, first_id + count)]
+
+
+def find_questions(skill, max_level=None, lesson=None):
+    """The same lookup as a query on the questions table."""
+    query = db.select(Question.data).where(Question.skill == skill)
+    if max_level is not None:
+        query = query.where(Question.level <= max_level)
+    if lesson:
+        query = query.where(Question.lesson == lesson)
+    return list(db.session.execute(query.order_by(Question.id)).scalars())
+
+
+def count_questions(skill=None):
+    query = db.select(db.func.count()).select_from(Question)
+    if skill:
+        query = query.where(Question.skill == skill)
+    return db.session.execute(query).scalar()
+
+
+def assert_index_matches_bank():
+    index = app_module.get_question_index()
+    for skill in SKILLS + ['unknown']:
+        for lesson in LESSONS:
+            for max_level in (None, 1, 2, 4):
+                expected = find_questions(skill, max_level=max_level, lesson=lesson)
+                assert index.find(skill, max_level=max_level, lesson=lesson) == expected, (skill, lesson, max_level)
+        assert index.count(skill) == count_questions(skill)
+    assert index.count() == count_questions()
+    for question_id in range(0, 330):
+        assert index.get(question_id) == question_bank.get_question_by_id(question_id), question_id
+    ids = list(range(0, 330, 7)) + ['12', 'x', None]
+    expected = {q['id']: q for q in map(question_bank.get_question_by_id, range(0, 330, 7)) if q}
+    assert index.get_many(ids) == {**expected, **({12: index.get(12)} if index.get(12) else {})}
+    return index
+
+
+def test_question_index():
+    print("Testing the question index...")
+    rng = random.Random(3)
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Domain(category='skills', data=SKILLS))
+        db.session.commit()
+        question_bank.add_questions(random_questions(rng, 1, 300))
+        index = assert_index_matches_bank()
+        ttl = get_domain_cache().ttl
+
+        # Local writes patch the index and move it (and the domain snapshot) to the new
+        # version without reading the questions or domain tables again
+        load_questions, load_domain_snapshot = question_bank.load_questions, app_module.load_domain_snapshot
+        reloads = []
+        question_bank.load_questions = lambda: reloads.append('questions') or load_questions()
+        app_module.load_domain_snapshot = lambda: reloads.append('domain') or load_domain_snapshot()
+        get_domain_cache().ttl = 0  # re-check the version on every read
+        try:
+            question_bank.add_questions(random_questions(rng, 301, 20))
+            question_bank.update_question(5, level=1, lesson='basics')
+            question_bank.delete_question(7)
+            question_bank.delete_question('9')  # ids from JSON may arrive as strings
+            question_bank.delete_questions(skill='spelling', lesson='advanced')
+            assert app_module.get_question_index() is index and reloads == []
+        finally:
+            question_bank.load_questions, app_module.load_domain_snapshot = load_questions, load_domain_snapshot
+            get_domain_cache().ttl = ttl
+        assert assert_index_matches_bank() is index
+        assert index.questions() == question_bank.load_questions()
+
+        # A write this worker did not see (another worker) forces a rebuild
+        bump_domain_version()
+        db.session.commit()
+        get_domain_cache().invalidate()
+        assert assert_index_matches_bank() is not index
+
+    print("✅ Index lookups match the questions table and follow local writes")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_question_index()
+    exit(0 if success else 1)
@@ -0,0 +1,86 @@
+"""
+Check read/write routing between a primary and a read replica.
+
+Two SQLite files stand in for the primary and the replica; they are never
+synced, so every read shows which database served it:
+
+    python test_replica.py
+"""
+import os
+import tempfile
+from flask import Flask, jsonify
+
+from database import db, get_replica_engine, init_db, read_only, use_primary, Student
+
+
+def create_app(primary_path, replica_path):
+    saved = {key: os.environ.get(key) for key in ('DATABASE_URL', 'DATABASE_REPLICA_URL')}
+    os.environ['DATABASE_URL'] = f"sqlite:///{primary_path}"
+    os.environ['DATABASE_REPLICA_URL'] = f"sqlite:///{replica_path}"
+    try:
+        app = Flask(__name__)
+        init_db(app)
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    def name_of(username):
+        return db.session.execute(db.select(Student.data).where(Student.username == username)).scalar()['name']
+
+    @app.route('/read')
+    @read_only
+    def read():
+        return jsonify(name=name_of('alex'))
+
+    @app.route('/read-primary')
+    @read_only
+    def read_primary():
+        with use_primary():
+            return jsonify(name=name_of('alex'))
+
+    @app.route('/read-after-write')
+    @read_only
+    def read_after_write():
+        db.session.execute(db.update(Student).where(Student.username == 'alex')
+                           .values(data={'name': 'Alex (updated)'}))
+        db.session.commit()
+        return jsonify(name=name_of('alex'))
+
+    @app.route('/write-path')
+    def write_path():
+        return jsonify(name=name_of('alex'))
+
+    return app
+
+
+def test_replica_routing():
+    print("Testing read-replica routing...")
+    workdir = tempfile.mkdtemp()
+    app = create_app(os.path.join(workdir, 'primary.db'), os.path.join(workdir, 'replica.db'))
+
+    with app.app_context():
+        db.metadata.create_all(get_replica_engine())
+        db.session.add(Student(username='alex', data={'name': 'Alex (primary)'}))
+        db.session.commit()
+        with get_replica_engine().begin() as conn:
+            conn.execute(db.insert(Student).values(username='alex', data={'name': 'Alex (replica)'}))
+
+    client = app.test_client()
+    assert client.get('/read').get_json()['name'] == 'Alex (replica)'
+    assert client.get('/read-primary').get_json()['name'] == 'Alex (primary)'
+    assert client.get('/write-path').get_json()['name'] == 'Alex (primary)'
+    # After writing, a read-only view reads its own write from the primary
+    assert client.get('/read-after-write').get_json()['name'] == 'Alex (updated)'
+    # ... and the flag does not leak into the next request
+    assert client.get('/read').get_json()['name'] == 'Alex (replica)'
+
+    print("✅ Reads go to the replica, writes and read-your-writes stay on the primary")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_replica_routing()
+    exit(0 if success else 1)
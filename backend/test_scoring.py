@@ -0,0 +1,137 @@
+"""
+Check the vectorized candidate scoring against the per-question rules in
+app.py, the bisection over the difficulty order (single picks and ranked
+batches), and that the stats arrays follow local answers once they commit.
+
+    python test_scoring.py
+"""
+import os
+import random
+import numpy as np
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import app as app_module
+from database import db
+from question_stats import QuestionStatsCache, get_question_stats, get_stats_cache, record_answer
+from scoring import CandidateSet, _DifficultyOrder, stats_table
+from unit_of_work import current_unit_of_work
+
+DIFFICULTIES = ['beginner', 'intermediate', 'advanced', 'unknown']
+
+
+def test_vectorized_scoring_matches_loop():
+    print("Testing vectorized candidate scoring...")
+    rng = random.Random(5)
+    questions = [{"id": i, "skill": "grammar", "difficulty": rng.choice(DIFFICULTIES)} for i in range(1, 400)]
+    del questions[0]['difficulty']
+    stats = {str(rng.randint(1, 500)): {'attempts': a, 'correct': rng.randint(0, a)}
+             for a in (rng.randint(0, 50) for _ in range(300))}
+    candidates = CandidateSet(questions)
+    table = stats_table(stats)
+
+    for skill_score in (0.0, 0.3, 0.55, 1.0):
+        difficulty, probability, distance = candidates.score(skill_score, table)
+        for i, question in enumerate(questions):
+            expected = app_module.get_question_difficulty_score(question, stats)
+            assert abs(difficulty[i] - expected) < 1e-12, question
+            assert abs(probability[i] - app_module.predict_success_probability(skill_score, expected)) < 1e-12
+
+        # The pick is always among the nearest; nearest_many(n) is the n nearest in order
+        chosen = candidates.nearest(skill_score, table, rng=rng)
+        assert abs(abs(chosen.probability - 0.7) - distance.min()) < 1e-6
+        top = candidates.nearest_many(skill_score, table, 10, rng=rng)
+        assert np.allclose([abs(s.probability - 0.7) for s in top], sorted(distance)[:10], atol=1e-6)
+
+    assert CandidateSet([]).nearest(0.5, table) is None
+    assert CandidateSet([]).nearest_many(0.5, table, 3) == []
+    print("✅ Vectorized scores match the per-question rules")
+    return True
+
+
+def test_stats_table_follows_answers():
+    print("Testing the stats arrays...")
+    cache = QuestionStatsCache(ttl_seconds=3600)
+    cache._stats = {'2': {'attempts': 4, 'correct': 1, 'incorrect': 3}}
+    cache._loaded_at = float('inf')
+    cache.table()
+    cache.apply(2, True)
+    cache.apply(1, False)  # first answers are inserted in id order
+    cache.apply(7, True)
+    table = cache.table()
+    attempts, correct = table.lookup(np.array([1, 2, 3, 7]))
+    assert (list(attempts), list(correct)) == ([1, 5, 0, 1], [0, 2, 0, 1])
+    assert table.changed == [2, 1, 7]
+    print("✅ Local answers update the stats arrays in place")
+    return True
+
+
+def test_stats_cache_waits_for_commit():
+    print("Testing that only committed answers reach the stats cache...")
+    app = app_module.app
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    cache = get_stats_cache()
+    ttl, cache.ttl = cache.ttl, 3600
+    try:
+        with app.test_request_context():
+            cache._stats = None
+            assert get_question_stats() == {}
+            version = cache.version
+            record_answer(3, True)
+            current_unit_of_work().rollback()
+            assert get_question_stats() == {} and cache.version == version
+            record_answer(3, False)
+            assert get_question_stats() == {}
+            current_unit_of_work().flush()
+            assert get_question_stats() == {'3': {'attempts': 1, 'correct': 0, 'incorrect': 1}}
+    finally:
+        cache.ttl = ttl
+    print("✅ Rolled-back answers never reach the stats cache")
+    return True
+
+
+def test_nearest_follows_difficulty_shifts():
+    print("Testing the difficulty-ordered lookup...")
+    rng = random.Random(11)
+    questions = [{"id": i, "difficulty": rng.choice(DIFFICULTIES)} for i in range(1, 600)]
+    candidates = CandidateSet(questions)
+    table = stats_table({str(i): {'attempts': 10, 'correct': rng.randint(0, 10)} for i in range(1, 600, 3)})
+
+    for round_number in range(30):
+        # Answers move difficulties (including first answers and ids outside the set)
+        for _ in range(rng.randint(1, 40)):
+            table.record(rng.randint(1, 700), rng.random() < 0.5)
+        for skill_score in (0.0, 0.2, rng.random(), 0.8, 1.0):
+            _, _, distance = candidates.score(skill_score, table)
+            chosen = candidates.nearest(skill_score, table, rng=rng)
+            assert abs(abs(chosen.probability - 0.7) - distance.min()) < 1e-6, (round_number, skill_score)
+            assert abs(chosen.difficulty - candidates.difficulty(table, candidates.position(chosen.question['id']))) < 1e-12
+            # A ranked batch is the 25 nearest, nearest first, without repeats
+            batch = candidates.nearest_many(skill_score, table, 25, rng=rng)
+            assert len({scored.question['id'] for scored in batch}) == 25
+            assert np.allclose([abs(scored.probability - 0.7) for scored in batch], sorted(distance)[:25], atol=1e-6)
+
+        # The order caught up answer by answer is the one a fresh sort gives
+        order = candidates._order
+        assert order.table is table and order.applied == len(table.changed)
+        fresh = _DifficultyOrder(candidates, table)
+        assert list(order.order) == list(fresh.order) and list(order.sorted) == list(fresh.sorted)
+        assert list(order.sorted) == list(order.difficulty[order.order])
+
+    # Near ties are all reachable
+    tied = CandidateSet([{"id": i, "difficulty": 'beginner'} for i in range(1, 6)])
+    picks = {tied.nearest(0.5, stats_table({}), rng=rng).question['id'] for _ in range(200)}
+    assert picks == {1, 2, 3, 4, 5}
+    batches = {tuple(s.question['id'] for s in tied.nearest_many(0.5, stats_table({}), 2, rng=rng)) for _ in range(200)}
+    assert len(batches) == 20
+    assert sorted(s.question['id'] for s in tied.nearest_many(0.5, stats_table({}), 10)) == [1, 2, 3, 4, 5]
+    print("✅ Bisection picks the nearest question and follows answer-driven shifts")
+    return True
+
+
+if __name__ == "__main__":
+    success = (test_vectorized_scoring_matches_loop() and test_stats_table_follows_answers()
+               and test_stats_cache_waits_for_commit() and test_nearest_follows_difficulty_shifts())
+    exit(0 if success else 1)
@@ -0,0 +1,133 @@
+"""
+End-to-end check of the tutoring loop on the in-memory storage backend.
+
+Runs without any database server:
+
+    python test_storage.py
+"""
+import os
+
+os.environ['DATABASE_URL'] = 'memory'
+
+import app as app_module
+import question_bank
+from database import db, Domain, StudentProfile
+from question_stats import load_question_stats
+from session_store import get_session_store
+
+QUESTIONS = [
+    {"id": 1, "skill": "vocabulary", "level": 1, "question": "Opposite of 'hot'?", "answer": "cold",
+     "hints": ["Think about ice."]},
+    {"id": 2, "skill": "vocabulary", "level": 1, "question": "Opposite of 'sad'?", "answer": "happy",
+     "hints": ["Think about smiling."]},
+]
+
+
+def seed():
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Domain(category='skills', data=app_module.DEFAULT_SKILLS))
+        db.session.commit()
+        question_bank.add_questions(QUESTIONS)
+        question_bank.sync_question_id_sequence()
+        db.session.commit()
+
+
+def post(client, path, payload):
+    response = client.post(f'/api/{path}', json=payload)
+    return response.status_code, response.get_json()
+
+
+def test_memory_backend():
+    print("Testing the tutoring loop on the in-memory backend...")
+    seed()
+    client = app_module.app.test_client()
+
+    status, res = post(client, 'register', {'username': 'mem_student', 'password': 'secret'})
+    assert status == 200, res
+    status, res = post(client, 'login', {'username': 'mem_student', 'password': 'secret'})
+    assert status == 200 and res.get('success'), res
+
+    # Serving a question or a hint only touches the session store, never the profile
+    response = client.post('/api/get-question', json={'student_id': 'mem_student', 'skill': 'vocabulary'})
+    question = response.get_json()
+    assert response.status_code == 200, question
+    assert question['id'] in (1, 2)
+    assert response.headers['X-DB-Rows-Written'] == '0'
+
+    response = client.post('/api/get-hint', json={'student_id': 'mem_student', 'question_id': question['id']})
+    assert response.status_code == 200, response.get_json()
+    assert response.headers['X-DB-Rows-Written'] == '0'
+    assert get_session_store().get('mem_student')['hints_used'] == 1
+
+    # Profile fields are changed in place (json_set on SQLite)
+    status, res = post(client, 'update-language', {'student_id': 'mem_student', 'learn_lang': 'english', 'ui_lang': 'spanish'})
+    assert status == 200, res
+    with app_module.app.app_context():
+        profile = db.session.get(StudentProfile, 'mem_student').data
+        assert profile['language_prefs'] == {'learn': 'english', 'ui': 'spanish'}
+
+    status, res = post(client, 'submit-answer', {
+        'student_id': 'mem_student',
+        'skill': 'vocabulary',
+        'question_id': question['id'],
+        'is_correct': True
+    })
+    assert status == 200, res
+    assert get_session_store().get('mem_student') is None
+
+    status, res = post(client, 'get-question-history', {'student_id': 'mem_student'})
+    assert status == 200, res
+    assert [h['question_id'] for h in res['history']] == [question['id']]
+    for bad in ({'cursor': 'garbage'}, {'cursor': 'x|1'}, {'cursor': 5}, {'limit': 'ten'}, {'limit': -1}):
+        status, res = post(client, 'get-question-history', {'student_id': 'mem_student', **bad})
+        assert status == 400 and 'error' in res, (bad, res)
+
+    # A prefetched batch is one call and one session; each answer moves the session on
+    response = client.post('/api/get-question-batch', json={'student_id': 'mem_student', 'skill': 'vocabulary', 'count': 5})
+    batch = response.get_json()
+    assert response.status_code == 200, batch
+    assert sorted(q['id'] for q in batch['questions']) == [1, 2]
+    assert response.headers['X-DB-Rows-Written'] == '0'
+    first, second = (q['id'] for q in batch['questions'])
+    assert get_session_store().get('mem_student')['queue'] == [second]
+    for answered, current in ((first, second), (second, None)):
+        status, res = post(client, 'submit-answer', {
+            'student_id': 'mem_student', 'skill': 'vocabulary', 'question_id': answered, 'is_correct': False})
+        assert status == 200, res
+        session = get_session_store().get('mem_student')
+        assert (session and session['question_id']) == current
+
+    with app_module.app.app_context():
+        stats = load_question_stats()
+        # The first answer was correct; each question of the batch was then missed once
+        other = 3 - question['id']
+        assert stats[str(question['id'])] == {'attempts': 2, 'correct': 1, 'incorrect': 1}
+        assert stats[str(other)] == {'attempts': 1, 'correct': 0, 'incorrect': 1}
+        # Ids keep coming from the sequence row, past the seeded questions
+        first = question_bank.allocate_question_ids(2)
+        assert first == 3
+        assert question_bank.allocate_question_ids(1) == 5
+
+    # Replacing the student through create-student starts it with an empty history
+    status, res = post(client, 'create-student', {'student_id': 'mem_student', 'name': 'Again'})
+    assert status == 200, res
+    status, res = post(client, 'get-question-history', {'student_id': 'mem_student'})
+    assert status == 200 and res['history'] == [], res
+
+    # Deleting an account drops its session (with any prefetched batch) too
+    for endpoint, field in (('user/delete-account', 'student_id'), ('admin/delete-user', 'username')):
+        response = client.post('/api/get-question-batch', json={'student_id': 'mem_student', 'skill': 'vocabulary', 'count': 5})
+        assert response.status_code == 200 and get_session_store().get('mem_student')['queue']
+        status, res = post(client, endpoint, {field: 'mem_student'})
+        assert status == 200, res
+        assert get_session_store().get('mem_student') is None
+
+    print("✅ In-memory backend works end to end")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_memory_backend()
+    exit(0 if success else 1)
@@ -0,0 +1,200 @@
+"""
+Per-request unit of work for student and domain rows.
+
+Every row a request loads is fingerprinted. Writes are staged instead of
+committed one by one, and at the end of the request only the rows whose
+content actually changed are flushed, as one bulk upsert per table inside a
+single transaction.
+
+Tables with a `version` column (students) are written with compare-and-swap
+instead: the row is only replaced if its version is still the one this
+request loaded, so concurrent writers can't silently overwrite each other.
+"""
+import json
+from flask import g, has_app_context, has_request_context
+from database import db, upsert
+
+
+# model -> [(before_commit, after_commit)] callbacks run when that model's rows are flushed
+_flush_hooks = {}
+
+
+class StaleWriteError(Exception):
+    """A versioned row changed (or appeared) after this request read it."""
+
+
+def fingerprint(data):
+    """Stable content hash used to tell whether a row changed since it was loaded."""
+    return json.dumps(data, sort_keys=True, default=str)
+
+
+def on_flush(model, before_commit=None, after_commit=None):
+    """Run callbacks whenever rows of `model` are written (inside / after the transaction)."""
+    _flush_hooks.setdefault(model, []).append((before_commit, after_commit))
+
+
+class UnitOfWork:
+    """Track loaded rows and stage changed ones for a single transaction."""
+
+    def __init__(self):
+        self.snapshots = {}   # (table, key) -> fingerprint as loaded/last written
+        self.versions = {}    # (table, key) -> version as loaded/last written (versioned tables)
+        self.staged = {}      # model -> {key: data}
+        self.executed = {}    # model -> rows touched by targeted statements
+        self.changes = {}     # model -> [change, ...] noted by writers for that model's after_commit hooks
+        self.rows_written = 0
+
+    def register_clean(self, model, key, data):
+        """Remember what a row looked like when it was loaded."""
+        self.register_fingerprint(model, key, fingerprint(data))
+
+    def register_fingerprint(self, model, key, row_fingerprint):
+        """Same as register_clean, for callers that already hold the fingerprint."""
+        self.snapshots[(model.__tablename__, key)] = row_fingerprint
+
+    def register_version(self, model, key, version):
+        """Remember which version of a versioned row this request is working from."""
+        self.versions[(model.__tablename__, key)] = version
+
+    def get_version(self, model, key):
+        """Version this request last saw for a row, or None if it never read it."""
+        return self.versions.get((model.__tablename__, key))
+
+    def get_staged(self, model, key):
+        """Return a staged (not yet flushed) row, so reads see the request's own writes."""
+        return self.staged.get(model, {}).get(key)
+
+    def stage(self, model, rows):
+        """Stage rows ({key: data}) for writing, skipping any that are unchanged."""
+        pending = self.staged.setdefault(model, {})
+        for key, data in rows.items():
+            if self.snapshots.get((model.__tablename__, key)) == fingerprint(data):
+                continue
+            pending[key] = data
+
+    def discard(self, model, key):
+        """Forget a staged row (e.g. the row was deleted)."""
+        self.staged.get(model, {}).pop(key, None)
+        self.snapshots.pop((model.__tablename__, key), None)
+        self.versions.pop((model.__tablename__, key), None)
+
+    def note_change(self, model, change):
+        """Describe a pending write so after_commit hooks can act on exactly what was committed."""
+        self.changes.setdefault(model, []).append(change)
+
+    def execute(self, model, statement, params=None):
+        """Run a targeted write in the request transaction; it commits with the next flush."""
+        result = db.session.execute(statement, params)
+        touched = len(params) if isinstance(params, list) else max(result.rowcount, 0)
+        self.executed[model] = self.executed.get(model, 0) + touched
+        return result
+
+    def compare_and_swap(self, model, key, data, version):
+        """
+        Replace a versioned row only if it is still at `version` (None = insert only if absent).
+
+        Runs in the request transaction. Returns the new version, or None if another
+        writer got there first.
+        """
+        key_column = model.__table__.primary_key.columns.values()[0]
+        if version is None:
+            stmt = upsert(model).values({key_column.name: key, 'data': data, 'version': 1})
+            stmt = stmt.on_conflict_do_nothing(index_elements=[key_column.name])
+        else:
+            stmt = (db.update(model)
+                    .where(key_column == key, model.version == version)
+                    .values(data=data, version=version + 1))
+        if db.session.execute(stmt).rowcount != 1:
+            return None
+        new_version = 1 if version is None else version + 1
+        self.register_version(model, key, new_version)
+        self.executed[model] = self.executed.get(model, 0) + 1
+        return new_version
+
+    def rollback(self):
+        """Drop everything staged by a request that failed part-way."""
+        self.staged = {}
+        self.executed = {}
+        self.changes = {}
+        self.versions = {}
+        db.session.rollback()
+
+    def flush(self):
+        """Write all staged rows as one bulk upsert per table, in one transaction."""
+        written = sum(self.executed.values())
+        flushed_models = set(self.executed)
+        try:
+            for model, rows in self.staged.items():
+                if not rows:
+                    continue
+                if 'version' in model.__table__.c:
+                    for key, data in rows.items():
+                        if self.compare_and_swap(model, key, data, self.get_version(model, key)) is None:
+                            raise StaleWriteError(f"{model.__tablename__} row {key!r} was changed by another request")
+                    written += len(rows)
+                    flushed_models.add(model)
+                    continue
+                key_column = model.__table__.primary_key.columns.values()[0].name
+                stmt = upsert(model)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[key_column],
+                    set_={'data': stmt.excluded.data}
+                )
+                db.session.execute(stmt, [{key_column: key, 'data': data} for key, data in rows.items()])
+                written += len(rows)
+                flushed_models.add(model)
+
+            hooks = []
+            for model in flushed_models:
+                for hook in _flush_hooks.get(model, []):
+                    if hook not in hooks:
+                        hooks.append(hook)
+            for before_commit, _ in hooks:
+                if before_commit:
+                    before_commit()
+            if flushed_models:
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.versions = {}
+            self.changes = {}
+            raise
+
+        for _, after_commit in hooks:
+            if after_commit:
+                after_commit()
+
+        for model, rows in self.staged.items():
+            for key, data in rows.items():
+                self.register_clean(model, key, data)
+        self.staged = {}
+        self.executed = {}
+        self.changes = {}
+        self.rows_written += written
+        return written
+
+
+def current_unit_of_work():
+    """Return the unit of work bound to the current app context."""
+    if not has_app_context():
+        raise RuntimeError("A unit of work requires an application context")
+    if 'unit_of_work' not in g:
+        g.unit_of_work = UnitOfWork()
+    return g.unit_of_work
+
+
+def write_rows(model, rows):
+    """Stage rows for writing; outside a request (scripts, CLI) flush immediately."""
+    uow = current_unit_of_work()
+    uow.stage(model, rows)
+    if not has_request_context():
+        uow.flush()
+
+
+def execute_write(model, statement, params=None):
+    """Run a targeted write; outside a request (scripts, CLI) commit immediately."""
+    uow = current_unit_of_work()
+    result = uow.execute(model, statement, params)
+    if not has_request_context():
+        uow.flush()
+    return result